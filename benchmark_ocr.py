@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк точності та швидкодії OCR на розміченому корпусі скріншотів
+
+Корпус - каталог зображень, поруч з кожним лежить JSON з очікуваними значеннями:
+
+    live_01.png
+    live_01.json  ->  {"duration": 125, "viewers": 1543, "gifters": 27, "diamonds": 4900}
+
+Кожен режим OCR запускається в окремому процесі, тому пікова пам'ять і кеші
+одного режиму не впливають на інший. Кеш скріншотів та автоматичне
+впорядкування каскаду вимкнені, щоб прогони були відтворюваними і не
+торкались бази даних; шаблони розмітки вивчаються лише в пам'яті прогону.
+Мережа не потрібна.
+
+Приклади:
+    python benchmark_ocr.py screenshots/
+    python benchmark_ocr.py screenshots/ --modes cascade,anchored --save-baseline baseline.json
+    python benchmark_ocr.py screenshots/ --baseline baseline.json
+    python benchmark_ocr.py screenshots/ --glyph-ratio
+    python benchmark_ocr.py screenshots/ --cache-check
+    python benchmark_ocr.py screenshots/ --decode
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, List, Optional
+
+from ocr_timing import STAGES
+
+FIELDS = ('duration', 'viewers', 'gifters', 'diamonds')
+MODES = ('cascade', 'anchored', 'full')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+# Показники зведення: (ключ, підпис, одиниця, чи краще більше)
+METRICS = [
+    *[(f'accuracy.{field}', f'Точність {field}', '%', True) for field in FIELDS],
+    ('accuracy.all', 'Всі 4 поля', '%', True),
+    ('latency_p50_ms', 'Затримка p50', 'мс', False),
+    ('latency_p95_ms', 'Затримка p95', 'мс', False),
+    ('tesseract_calls', 'Викликів Tesseract', 'на скрін', False),
+    ('peak_rss_mb', 'Пік пам\'яті процесу', 'МБ', False),
+]
+
+
+def load_corpus(directory: str) -> List[Dict]:
+    """
+    Знаходить розмічені скріншоти в каталозі
+
+    Returns:
+        List[Dict]: Записи з ключами path, name, expected (кортеж з чотирьох значень)
+    """
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        stem, extension = os.path.splitext(name)
+        if extension.lower() not in IMAGE_EXTENSIONS:
+            continue
+
+        label_path = os.path.join(directory, stem + '.json')
+        if not os.path.exists(label_path):
+            print(f"⚠️ {name}: немає файлу розмітки {stem}.json - пропущено")
+            continue
+
+        try:
+            with open(label_path, encoding='utf-8') as label_file:
+                label = json.load(label_file)
+            expected = tuple(int(label[field]) for field in FIELDS)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"⚠️ {name}: некоректна розмітка ({e}) - пропущено")
+            continue
+
+        corpus.append({'path': os.path.join(directory, name), 'name': name, 'expected': expected})
+    return corpus
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Перцентиль методом найближчого рангу"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def run_mode(mode: str, corpus: List[Dict], repeat: int, tuning: bool) -> Dict:
+    """
+    Прогнати корпус в одному режимі (виконується в окремому процесі)
+
+    Returns:
+        Dict: Зведення режиму та результати кожного скріншоту
+    """
+    # Налаштування читаються при імпорті config, тому задаються до імпорту процесора
+    os.environ['OCR_MODE'] = mode
+    os.environ['OCR_CACHE_SIZE'] = '0'
+    os.environ['OCR_LAYOUTS_PERSIST'] = 'false'
+    if not tuning:
+        os.environ['OCR_TUNING'] = 'false'
+
+    import logging
+    import resource
+
+    logging.basicConfig(level=logging.WARNING)
+
+    from ocr_engine import call_counts, reset_call_counts
+    from ocr_processor import ocr_processor
+
+    ocr_processor.mode = mode
+    latencies = []
+    calls = []
+    stages = []
+    samples = []
+
+    for item in corpus:
+        for attempt in range(repeat):
+            reset_call_counts()
+            started = time.perf_counter()
+            result, timings = ocr_processor.recognize_with_timings(item['path'])
+            latencies.append((time.perf_counter() - started) * 1000)
+            calls.append(sum(call_counts().values()))
+            stages.append(timings['stages'])
+            stats = result.stats if result else None
+
+        samples.append({
+            'name': item['name'],
+            'expected': list(item['expected']),
+            'actual': list(stats) if stats else None,
+        })
+
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss у Linux - в кілобайтах; процеси tesseract сюди не входять - їх пам'ять
+    # у RUSAGE_CHILDREN спотворена копією батьківського процесу при fork
+    return {
+        'mode': mode,
+        'screenshots': len(corpus),
+        'latencies_ms': latencies,
+        'calls': calls,
+        'stages': stages,
+        'peak_rss_mb': usage_self.ru_maxrss / 1024,
+        'samples': samples,
+    }
+
+
+def summarize(run: Dict) -> Dict:
+    """Зведені показники прогону режиму"""
+    samples = run['samples']
+    total = max(1, len(samples))
+
+    accuracy = {}
+    for index, field in enumerate(FIELDS):
+        correct = sum(1 for sample in samples if sample['actual'] and sample['actual'][index] == sample['expected'][index])
+        accuracy[field] = correct / total * 100
+    accuracy['all'] = sum(1 for sample in samples if sample['actual'] == sample['expected']) / total * 100
+
+    seen = {name for stages in run['stages'] for name in stages}
+    stage_names = [name for name in STAGES if name in seen] + sorted(seen - set(STAGES))
+    return {
+        'screenshots': run['screenshots'],
+        'accuracy': accuracy,
+        'latency_p50_ms': percentile(run['latencies_ms'], 50),
+        'latency_p95_ms': percentile(run['latencies_ms'], 95),
+        'tesseract_calls': sum(run['calls']) / max(1, len(run['calls'])),
+        'peak_rss_mb': run['peak_rss_mb'],
+        'stages_p50_ms': {
+            name: percentile([stages.get(name, 0.0) for stages in run['stages']], 50) for name in stage_names
+        },
+    }
+
+
+def metric_value(summary: Dict, key: str) -> Optional[float]:
+    """Значення показника за ключем виду 'accuracy.viewers'"""
+    value = summary
+    for part in key.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def print_summary(mode: str, summary: Dict, baseline: Optional[Dict]) -> bool:
+    """
+    Вивести зведення режиму та порівняння з базовою лінією
+
+    Returns:
+        bool: True якщо точність якогось поля впала відносно базової лінії
+    """
+    regressed = False
+    print(f"\n📊 Режим {mode}: {summary['screenshots']} скріншотів")
+    print("-" * 60)
+
+    metrics = METRICS + [
+        (f'stages_p50_ms.{name}', f'Етап {name} p50', 'мс', False) for name in summary['stages_p50_ms']
+    ]
+    for key, title, unit, higher_is_better in metrics:
+        value = metric_value(summary, key)
+        line = f"{title:<24} {value:>10.1f} {unit}"
+
+        previous = metric_value(baseline, key) if baseline else None
+        if previous is not None:
+            delta = value - previous
+            better = delta > 0 if higher_is_better else delta < 0
+            mark = '✅' if better else ('➖' if abs(delta) < 1e-9 else '❌')
+            line += f"   {mark} {delta:+.1f} (було {previous:.1f})"
+            if key.startswith('accuracy.') and delta < 0:
+                regressed = True
+        print(line)
+
+    return regressed
+
+
+def print_failures(run: Dict):
+    """Вивести скріншоти з хибно розпізнаними полями"""
+    failures = [sample for sample in run['samples'] if sample['actual'] != sample['expected']]
+    if not failures:
+        return
+
+    print(f"\n❌ Помилки режиму {run['mode']}:")
+    for sample in failures:
+        if sample['actual'] is None:
+            print(f"   {sample['name']}: не розпізнано, очікувалось {tuple(sample['expected'])}")
+            continue
+        wrong = [
+            f"{field} {actual} замість {expected}"
+            for field, actual, expected in zip(FIELDS, sample['actual'], sample['expected'])
+            if actual != expected
+        ]
+        print(f"   {sample['name']}: {', '.join(wrong)}")
+
+
+def print_glyph_ratio(corpus: List[Dict]):
+    """
+    Висота символів відносно висоти скріншоту - для OCR_GLYPH_HEIGHT_RATIO
+
+    Бот обирає найменший розмір фото Telegram, на якому символи не нижчі за
+    OCR_MIN_SOURCE_GLYPH_HEIGHT; рекомендоване значення - 10-й перцентиль
+    частки, щоб дрібний шрифт не потрапляв на замалі фото.
+    """
+    import cv2
+
+    from ocr_scale import measure_glyph_height
+
+    ratios = []
+    for item in corpus:
+        gray = cv2.imread(item['path'], cv2.IMREAD_GRAYSCALE)
+        glyph_height = measure_glyph_height(gray) if gray is not None else None
+        if glyph_height:
+            ratios.append(glyph_height / gray.shape[0])
+
+    if not ratios:
+        print("❌ Не вдалося виміряти висоту символів на жодному скріншоті")
+        return
+
+    print(f"📐 Висота символів / висота скріншоту ({len(ratios)} скріншотів):")
+    print(f"   мінімум {min(ratios):.4f}, p10 {percentile(ratios, 10):.4f}, медіана {percentile(ratios, 50):.4f}")
+    print(f"   Рекомендовано: OCR_GLYPH_HEIGHT_RATIO={percentile(ratios, 10):.4f}")
+
+
+def print_decode(corpus: List[Dict], repeat: int):
+    """
+    Час і пам'ять декодування: повне сіре проти зменшення декодером
+
+    Фото Telegram замалі для зменшення (decode_reduction), тому крім самого
+    скріншоту вимірюються його JPEG копії, збільшені в 2 і 4 рази, - великі файли,
+    на яких бот обирає IMREAD_REDUCED_GRAYSCALE_2/4.
+    """
+    import cv2
+    import numpy as np
+
+    from config import OCR_GLYPH_HEIGHT_RATIO, OCR_TARGET_GLYPH_HEIGHT
+    from ocr_processor import GRAY_DECODE_FLAGS
+    from ocr_scale import decode_reduction
+
+    def measure(data: np.ndarray, flags: int):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            gray = cv2.imdecode(data, flags)
+            timings.append((time.perf_counter() - started) * 1000)
+        return min(timings), gray.nbytes / (1024 * 1024)
+
+    print(f"🖼️ Декодування (найкращий з {repeat} прогонів; МБ - розмір декодованого масиву):")
+    for item in corpus:
+        source = cv2.imread(item['path'], cv2.IMREAD_COLOR)
+        if source is None:
+            continue
+        for scale in (1, 2, 4):
+            image = source if scale == 1 else cv2.resize(source, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+            data = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1]
+            height = image.shape[0]
+            chosen = decode_reduction(height, OCR_GLYPH_HEIGHT_RATIO, OCR_TARGET_GLYPH_HEIGHT)
+            results = ', '.join(
+                f"1/{reduction} {ms:.0f} мс / {mb:.1f} МБ"
+                for reduction in (1, 2, 4)
+                for ms, mb in [measure(data, GRAY_DECODE_FLAGS[reduction])]
+            )
+            print(f"   {item['name']} {image.shape[1]}x{height}: бот обирає 1/{chosen}; {results}")
+
+
+def check_cache(corpus: List[Dict]) -> bool:
+    """
+    Перевірка кешу скріншотів: інші значення на тій самій розмітці - промах
+
+    Кожен скріншот корпусу кладеться в кеш у пам'яті, після чого скріншоти з іншими
+    очікуваними значеннями мають промахнутися, а він сам - влучити. Те саме для пари
+    копій скріншоту, що відрізняються однією цифрою («4.9K» і «4.8K» в одному місці).
+
+    Returns:
+        bool: True якщо хибних влучань і пропущених повторів немає
+    """
+    import cv2
+
+    from config import OCR_CACHE_MAX_DISTANCE
+    from ocr_cache import ScreenshotCache
+
+    def one_digit_copy(gray, digit: str):
+        copy = gray.copy()
+        height, width = copy.shape
+        origin = (width // 3, height // 2)
+        cv2.rectangle(copy, (origin[0] - 5, origin[1] - 60), (origin[0] + 260, origin[1] + 15), 255, -1)
+        cv2.putText(copy, f"4.{digit}K", origin, cv2.FONT_HERSHEY_SIMPLEX, 2.0, 0, 4)
+        return copy
+
+    images = []
+    for item in corpus:
+        gray = cv2.imread(item['path'], cv2.IMREAD_GRAYSCALE)
+        if gray is not None:
+            images.append((item['name'], tuple(item['expected']), gray))
+
+    cases = []
+    for name, expected, gray in images:
+        others = [(other_name, other) for other_name, other_expected, other in images if other_expected != expected]
+        cases.append((name, gray, others))
+        cases.append((f"{name} «4.9K»", one_digit_copy(gray, '9'), [(f"{name} «4.8K»", one_digit_copy(gray, '8'))]))
+
+    false_hits, missed = [], []
+    for name, gray, others in cases:
+        cache = ScreenshotCache(max_size=len(images) + 1, max_distance=OCR_CACHE_MAX_DISTANCE, persist=False)
+        _, image_hash, digest = cache.get(gray)
+        cache.put(image_hash, digest, (1, 1, 1, 1))
+        if cache.get(gray)[0] is None:
+            missed.append(name)
+        false_hits.extend(f"{other_name} -> {name}" for other_name, other in others if cache.get(other)[0] is not None)
+
+    print(f"🗄️ Кеш скріншотів: {len(cases)} записів, {sum(len(others) for _, _, others in cases)} перевірок промаху")
+    for hit in false_hits:
+        print(f"   ❌ хибне влучання: {hit}")
+    for name in missed:
+        print(f"   ❌ повтор не влучив: {name}")
+    if not false_hits and not missed:
+        print("   ✅ хибних влучань немає, повтори влучають")
+    return not false_hits and not missed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк точності та швидкодії OCR на розміченому корпусі")
+    parser.add_argument('corpus', help="Каталог зі скріншотами та JSON розміткою")
+    parser.add_argument('--modes', default=','.join(MODES), help="Режими через кому (за замовчуванням: всі)")
+    parser.add_argument('--repeat', type=int, default=1, help="Скільки разів розпізнавати кожен скріншот")
+    parser.add_argument('--tuning', action='store_true', help="Не вимикати автоматичне впорядкування каскаду (пише в БД)")
+    parser.add_argument('--baseline', help="JSON базової лінії для порівняння")
+    parser.add_argument('--save-baseline', help="Зберегти результати як базову лінію")
+    parser.add_argument('--failures', action='store_true', help="Показати скріншоти з помилками")
+    parser.add_argument('--glyph-ratio', action='store_true',
+                        help="Лише виміряти висоту символів відносно скріншоту (OCR_GLYPH_HEIGHT_RATIO)")
+    parser.add_argument('--decode', action='store_true',
+                        help="Лише виміряти декодування: повне сіре проти зменшеного (OCR_REDUCED_DECODE)")
+    parser.add_argument('--cache-check', action='store_true',
+                        help="Лише перевірити, що скріншоти з іншими значеннями не влучають у кеш OCR")
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        print(f"❌ Невідомі режими: {', '.join(unknown)}")
+        return 2
+
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        print(f"❌ У каталозі {args.corpus} немає розмічених скріншотів")
+        return 2
+
+    if args.glyph_ratio:
+        print_glyph_ratio(corpus)
+        return 0
+
+    if args.decode:
+        print_decode(corpus, max(3, args.repeat))
+        return 0
+
+    if args.cache_check:
+        return 0 if check_cache(corpus) else 1
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file).get('modes', {})
+
+    print(f"🧪 Бенчмарк OCR: {len(corpus)} скріншотів, режими: {', '.join(modes)}")
+    print("=" * 60)
+
+    results = {}
+    regressed = False
+    context = get_context('spawn')
+    for mode in modes:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            run = executor.submit(run_mode, mode, corpus, max(1, args.repeat), args.tuning).result()
+
+        summary = summarize(run)
+        results[mode] = summary
+        regressed |= print_summary(mode, summary, baseline.get(mode))
+        if args.failures:
+            print_failures(run)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as baseline_file:
+            json.dump({'created': time.strftime('%Y-%m-%d %H:%M:%S'), 'modes': results}, baseline_file,
+                      ensure_ascii=False, indent=2)
+        print(f"\n💾 Базову лінію збережено: {args.save_baseline}")
+
+    if regressed:
+        print("\n❌ Точність впала відносно базової лінії")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,34 @@
 import logging
 import os
 import tempfile
-from typing import Dict, Set
+from typing import Dict, Optional, Set, Tuple
 from datetime import datetime, timedelta
 import asyncio
 from collections import defaultdict
 import time
 import sys
 import platform
+import math
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton, PhotoSize
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
 from telegram.constants import ParseMode
 
 from config import (
     BOT_TOKEN, ADMIN_USER_IDS, MESSAGES, MAX_FILE_SIZE, ALLOWED_EXTENSIONS,
-    RATE_LIMIT_MESSAGES, RATE_LIMIT_PERIOD, STATS_WORK_START_HOUR, STATS_WORK_END_HOUR
+    RATE_LIMIT_MESSAGES, RATE_LIMIT_PERIOD, STATS_WORK_START_HOUR, STATS_WORK_END_HOUR,
+    OCR_TUNING, OCR_TUNING_MIN_ATTEMPTS, OCR_TUNING_EXPLORE_EVERY, MEDIA_GROUP_WAIT, OCR_LOW_CONFIDENCE,
+    OCR_MIN_SOURCE_GLYPH_HEIGHT, OCR_GLYPH_HEIGHT_RATIO
 )
 from database import db
-from ocr_processor import ocr_processor
+from ocr_workers import (
+    recognize_screenshot, explore_screenshot, test_ocr_installation, shutdown_executor, warm_up, readiness
+)
+from cpu_planner import current_plan
+from ocr_queue import ocr_queue, QueueFull, PositionCallback
+from ocr_tuning import rank_combinations, short_config
+from ocr_timing import timing_stats, bucket_label
+from stats_parser import StatsResult
 from scheduler import start_scheduler
 from utils import create_user_stats_message, format_duration, format_number, create_table_report, create_csv_report, create_user_detailed_csv, create_all_users_csv_package
 
@@ -35,10 +45,33 @@ user_message_history: Dict[int, list] = defaultdict(list)
 # Стани користувачів
 user_states: Dict[int, str] = {}
 
+# Назви полів статистики для повідомлень
+FIELD_NAMES = {'duration': 'Тривалість', 'viewers': 'Глядачі', 'gifters': 'Дарувальники', 'diamonds': 'Алмази'}
+
+# Назви етапів розпізнавання для адмін панелі
+STAGE_NAMES = {
+    'decode': 'Декодування', 'cache': 'Кеш', 'preprocess': 'Підготовка', 'layout': 'Розмітка', 'ocr': 'Tesseract',
+    'parse': 'Аналіз тексту', 'validate': 'Валідація', 'tuning': 'Самонавчання', 'total': 'Всього',
+}
+
+# Сигнатури дозволених форматів зображень (перші байти файлу)
+IMAGE_SIGNATURES = {
+    '.jpg': (b'\xff\xd8\xff',), '.jpeg': (b'\xff\xd8\xff',), '.png': (b'\x89PNG\r\n\x1a\n',),
+    '.bmp': (b'BM',), '.tiff': (b'II*\x00', b'MM\x00*'),
+}
+
+# Альбоми фото, що збираються для пакетної обробки: media_group_id -> дані альбому
+media_groups: Dict[str, dict] = {}
+
+# Часткові результати OCR (бюджет часу вичерпано), що чекають підтвердження: id повідомлення -> дані
+pending_results: Dict[int, dict] = {}
+PENDING_RESULT_TTL = 3600  # секунд, після яких непідтверджений результат забувається
+
 class TikTokStatsBot:
     def __init__(self):
         """Ініціалізація бота"""
         self.application = None
+        self.recognized_count = 0  # розпізнаних скріншотів - для фонового дослідження комбінацій OCR
         
     def is_admin(self, user_id: int) -> bool:
         """Перевірити чи є користувач адміністратором"""
@@ -65,21 +98,18 @@ class TikTokStatsBot:
         user_history.append(now)
         return True
     
-    def validate_file(self, file_path: str) -> bool:
-        """Валідувати файл"""
-        try:
-            # Перевірити розширення
-            _, ext = os.path.splitext(file_path.lower())
-            if ext not in ALLOWED_EXTENSIONS:
-                return False
-            
-            # Перевірити розмір
-            if os.path.getsize(file_path) > MAX_FILE_SIZE:
-                return False
-            
-            return True
-        except Exception:
+    def validate_image_data(self, data: bytearray) -> bool:
+        """Валідувати завантажене в пам'ять зображення: розмір та формат за сигнатурою"""
+        # Перевірити розмір
+        if not data or len(data) > MAX_FILE_SIZE:
             return False
+        
+        # Перевірити формат
+        return any(
+            data.startswith(signature)
+            for ext in ALLOWED_EXTENSIONS
+            for signature in IMAGE_SIGNATURES.get(ext, ())
+        )
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обробник команди /start"""
@@ -296,6 +326,8 @@ class TikTokStatsBot:
              InlineKeyboardButton("🔑 Діагностика доступу", callback_data="admin_diagnostics")],
             [InlineKeyboardButton("⚙️ Системна інформація", callback_data="admin_system_info"),
              InlineKeyboardButton("🔧 Техобслуговування", callback_data="admin_maintenance")],
+            [InlineKeyboardButton("🧠 Рейтинг OCR", callback_data="admin_ocr_ranking"),
+             InlineKeyboardButton("⏱️ Час OCR", callback_data="admin_ocr_timings")],
             [InlineKeyboardButton("🔙 Назад до меню", callback_data="back_to_menu")]
         ]
         
@@ -628,11 +660,8 @@ class TikTokStatsBot:
             # Інші текстові повідомлення
             await update.message.reply_text(MESSAGES['photo_only'])
     
-    async def handle_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обробити фото від користувача"""
-        if not update.message or not update.effective_user:
-            return
-            
+    async def check_photo_access(self, update: Update) -> bool:
+        """Перевірити реєстрацію, техобслуговування та робочі години перед обробкою фото"""
         user_id = update.effective_user.id
         
         # Перевірити чи користувач зареєстрований
@@ -647,7 +676,7 @@ class TikTokStatsBot:
                 "Натисніть кнопку нижче, щоб почати:",
                 reply_markup=reply_markup
             )
-            return
+            return False
         
         # Перевірити режим технічного обслуговування
         if db.is_maintenance_mode():
@@ -665,7 +694,7 @@ class TikTokStatsBot:
             message += "📞 Для термінових питань зверніться до адміністратора"
             
             await update.message.reply_text(message)
-            return
+            return False
         
         # Перевірити робочі години (24/7)
         if not self.is_working_hours():
@@ -676,96 +705,484 @@ class TikTokStatsBot:
                 f"⏳ Робочі години: 00:00 - 23:59\n\n"
                 f"🕐 Спробуйте ще раз через хвилину!"
             )
-            return
+            return False
         
         # Перевірити ліміт
         if not self.check_rate_limit(user_id):
             await update.message.reply_text("⏰ Занадто багато запитів. Спробуйте через хвилину.")
+            return False
+        
+        return True
+    
+    def busy_message(self, error: QueueFull) -> str:
+        """Відповідь користувачу, коли черга OCR заповнена"""
+        minutes = max(1, math.ceil(error.retry_after / 60))
+        return f"🚦 Бот зараз завантажений скріншотами інших користувачів.\nСпробуйте ще раз через {minutes} хв."
+    
+    def format_wait(self, seconds: float) -> str:
+        """Орієнтовне очікування: «~40 с» або «~3 хв»"""
+        if seconds < 60:
+            return f"~{max(1, round(seconds))} с"
+        return f"~{math.ceil(seconds / 60)} хв"
+    
+    def queue_reporter(self, message, started_text: str) -> PositionCallback:
+        """Оновлювати повідомлення про обробку позицією в черзі OCR"""
+        async def report(position: int, eta: float):
+            if position:
+                await message.edit_text(
+                    f"🕐 Ваш скріншот у черзі: {position}-й\n⏳ Орієнтовно {self.format_wait(eta)}"
+                )
+            else:
+                await message.edit_text(started_text)
+        return report
+    
+    def select_photo_size(self, sizes) -> PhotoSize:
+        """
+        Найменший розмір фото, на якому символи достатньо великі для OCR
+        
+        Висота символів оцінюється як частка висоти фото (OCR_GLYPH_HEIGHT_RATIO,
+        вимірюється на корпусі: benchmark_ocr.py --glyph-ratio). Якщо жоден менший
+        розмір не підходить - найбільший.
+        """
+        largest = sizes[-1]
+        if OCR_MIN_SOURCE_GLYPH_HEIGHT <= 0 or OCR_GLYPH_HEIGHT_RATIO <= 0:
+            return largest
+        
+        min_height = OCR_MIN_SOURCE_GLYPH_HEIGHT / OCR_GLYPH_HEIGHT_RATIO
+        for photo in sorted(sizes, key=lambda size: size.width * size.height):
+            if photo.height >= min_height:
+                return photo
+        return largest
+    
+    async def recognize_photo(self, context: ContextTypes.DEFAULT_TYPE, sizes, user_id: int,
+                              on_position: Optional[PositionCallback] = None) -> Tuple[Optional[StatsResult], Optional[str]]:
+        """
+        Завантажити фото та розпізнати статистику
+        
+        Спершу завантажується найменший достатній розмір фото (select_photo_size);
+        найбільший - лише якщо менший не розпізнано зовсім. Частковий результат
+        не повторюється на більшому фото: він здебільшого означає вичерпаний
+        OCR_TIME_BUDGET, і другий прохід подвоїв би час на скріншот. OCR виконується через
+        чергу: задачі користувачів чергуються по колу, а при заповненій черзі
+        користувач одразу отримує відповідь «спробуйте пізніше».
+        
+        Args:
+            sizes: Розміри фото з повідомлення (PhotoSize від меншого до більшого)
+        
+        Returns:
+            Tuple: (статистика з впевненістю або None, текст помилки для користувача або None)
+        """
+        photo, largest = self.select_photo_size(sizes), sizes[-1]
+        try:
+            result, error = await self.recognize_photo_size(context, photo, user_id, on_position)
+            if photo is not largest and not result:
+                logger.info(f"Фото {photo.width}x{photo.height} не розпізнано, пробуємо {largest.width}x{largest.height}")
+                result, error = await self.recognize_photo_size(context, largest, user_id, on_position)
+            return result, error
+        except QueueFull as e:
+            return None, self.busy_message(e)
+    
+    async def recognize_photo_size(self, context: ContextTypes.DEFAULT_TYPE, photo, user_id: int,
+                                   on_position: Optional[PositionCallback] = None) -> Tuple[Optional[StatsResult], Optional[str]]:
+        """
+        Завантажити один розмір фото та розпізнати статистику
+        
+        Raises:
+            QueueFull: Черга OCR заповнена
+        """
+        # Розмір відомий з метаданих Telegram - завеликий файл навіть не завантажуємо
+        if photo.file_size and photo.file_size > MAX_FILE_SIZE:
+            return None, f"❌ Файл завеликий. Максимальний розмір - {MAX_FILE_SIZE // (1024*1024)}MB."
+        
+        ocr_queue.ensure_capacity()
+        
+        file = await context.bot.get_file(photo.file_id)
+        
+        # Завантажити фото в пам'ять - без тимчасових файлів на диску
+        data = await file.download_as_bytearray()
+        
+        # Валідація файлу
+        if not self.validate_image_data(data):
+            return None, "❌ Неправильний формат файлу. Надішліть JPG або PNG."
+        
+        # OCR у пулі процесів - цикл подій продовжує обслуговувати інших користувачів.
+        # Мова телефону стрімера змінюється рідко: запам'ятована мова замінює пробу
+        language = db.get_user_ocr_language(user_id)
+        result = await ocr_queue.submit(user_id, lambda: recognize_screenshot(data, language), on_position)
+        if not result:
+            return None, "❌ Не вдалося розпізнати статистику на зображенні. Спробуйте інший скріншот."
+        
+        if result.language and '+' not in result.language and result.language != language:
+            db.set_user_ocr_language(user_id, result.language)
+        if not result.partial:
+            self.schedule_exploration(data, result)
+        
+        return result, None
+    
+    def schedule_exploration(self, data: bytearray, result: StatsResult):
+        """
+        Кожен OCR_TUNING_EXPLORE_EVERY-й розпізнаний скріншот - фоновий прохід пропущеної комбінації
+        
+        Прохід стає фоновою задачею черги OCR і починається, лише коли користувачі
+        не чекають, - відповідь користувачу від самонавчання не залежить.
+        """
+        if not OCR_TUNING or OCR_TUNING_EXPLORE_EVERY <= 0:
+            return
+        self.recognized_count += 1
+        if self.recognized_count % OCR_TUNING_EXPLORE_EVERY == 0:
+            ocr_queue.submit_background(lambda: explore_screenshot(data, result.language, result.stats))
+    
+    async def handle_photo(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обробити фото від користувача"""
+        if not update.message or not update.effective_user:
+            return
+        
+        if update.message.media_group_id:
+            await self.collect_media_group(update, context)
+            return
+        
+        user_id = update.effective_user.id
+        
+        if not await self.check_photo_access(update):
+            return
+        
+        # Отримати фото: розміри від меншого до більшого, найбільший ідентифікує фото
+        sizes = update.message.photo
+        photo = sizes[-1]
+        
+        # Переслане або повторно надіслане фото - без завантаження та OCR
+        processed = db.get_processed_photo(photo.file_unique_id)
+        if processed:
+            await update.message.reply_text(self.duplicate_message(processed, user_id))
+            return
+        
+        try:
+            ocr_queue.ensure_capacity()
+        except QueueFull as e:
+            await update.message.reply_text(self.busy_message(e))
             return
         
         try:
             # Відправити повідомлення про початок обробки
             processing_msg = await update.message.reply_text("⏳ Починаю обробку вашого скріншота...")
             
-            # Отримати фото
-            photo = update.message.photo[-1]  # Найбільший розмір
-            file = await context.bot.get_file(photo.file_id)
-            
-            # Створити унікальне ім'я файлу
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"screenshot_{user_id}_{timestamp}.jpg"
-            
-            # Завантажити файл
-            file_path = await file.download_to_drive(filename)
-            
-            # Валідація файлу
-            if not self.validate_file(filename):
-                await processing_msg.edit_text("❌ Неправильний формат файлу. Надішліть JPG або PNG.")
-                os.unlink(filename)
-                return
-            
             # Обробити фото за допомогою OCR
-            await processing_msg.edit_text("⚙️ Обробляю зображення... 🔍\n📖 Розпізнаю текст...")
+            started_text = "⚙️ Обробляю зображення... 🔍\n📖 Розпізнаю текст..."
+            await processing_msg.edit_text(started_text)
             
-            stats = ocr_processor.process_tiktok_screenshot(filename)
+            result, error = await self.recognize_photo(
+                context, sizes, user_id, self.queue_reporter(processing_msg, started_text)
+            )
             
-            if not stats:
-                await processing_msg.edit_text("❌ Не вдалося розпізнати статистику на зображенні. Спробуйте інший скріншот.")
-                os.unlink(filename)
+            if not result:
+                await processing_msg.edit_text(error)
                 return
             
-            duration, viewers, gifters, diamonds = stats
+            if result.partial:
+                await self.ask_partial_confirmation(processing_msg, user_id, result, photo.file_unique_id)
+                return
             
             # Повідомлення про успіх
             await processing_msg.edit_text("✅ Успішно оброблено! \n💾 Зберігаю дані...")
             
-            # Зберегти в базу даних
-            success = db.add_statistics(user_id, duration, viewers, gifters, diamonds)
+            await processing_msg.edit_text(self.save_statistics(user_id, result, photo.file_unique_id))
             
-            if success:
-                # Отримати статистику за сьогодні для відображення
-                today_stats = db.get_today_total_stats(user_id)
-                total_screenshots = today_stats.get('sessions_count', 1) if today_stats else 1
-                
-                # Повідомлення про успіх
-                success_message = f"""✅ Обробка завершена успішно! 
+        except Exception as e:
+            logger.error(f"Помилка обробки фото: {e}")
+            try:
+                await processing_msg.edit_text("❌ Помилка обробки фото. Спробуйте ще раз.")
+            except:
+                await update.message.reply_text("❌ Помилка обробки фото. Спробуйте ще раз.")
+    
+    def save_statistics(self, user_id: int, result: StatsResult, file_unique_id: Optional[str] = None) -> str:
+        """
+        Зберегти статистику скріншоту в базу даних
+        
+        Args:
+            file_unique_id: Фото Telegram, з якого розпізнано статистику - щоб не зарахувати його вдруге
+        
+        Returns:
+            str: Повідомлення користувачу про результат збереження
+        """
+        duration, viewers, gifters, diamonds = result.stats
+        
+        # Зберегти в базу даних; те саме фото, надіслане двічі поспіль, зараховується один раз
+        if not db.add_statistics(user_id, duration, viewers, gifters, diamonds, file_unique_id=file_unique_id):
+            processed = db.get_processed_photo(file_unique_id) if file_unique_id else None
+            if processed:
+                return self.duplicate_message(processed, user_id)
+            return "❌ Помилка збереження даних. Спробуйте ще раз."
+        
+        # Отримати статистику за сьогодні для відображення
+        today_stats = db.get_today_total_stats(user_id)
+        total_screenshots = today_stats.get('sessions_count', 1) if today_stats else 1
+        
+        # Повідомлення про успіх
+        success_message = f"""✅ Обробка завершена успішно! 
 
 📊 Поточний скріншот:
 ⏱️ Тривалість: {format_duration(duration)}
 👥 Глядачі: {format_number(viewers)}
 🎁 Дарувальники: {format_number(gifters)}
-💎 Алмази: {format_number(diamonds)}
+💎 Алмази: {format_number(diamonds)}"""
+        
+        uncertain = self.uncertain_fields(result)
+        if uncertain:
+            success_message += f"\n\n⚠️ Перевірте значення: {uncertain}\nЯкщо щось не так - надішліть чіткіший скріншот"
+        
+        success_message += f"""
 
 📈 Статистика за сьогодні:
 🎥 Скріншотів оброблено: {total_screenshots}"""
 
-                if today_stats and total_screenshots > 1:
-                    success_message += f"""
+        success_message += self.format_today_totals(today_stats, total_screenshots)
+        success_message += "\n\n📊 Дякую за використання бота!"
+        
+        logger.info(f"Статистика збережена: {user_id}, {duration}хв, {viewers} глядачів, {diamonds} алмазів")
+        return success_message
+    
+    def duplicate_message(self, processed: Dict, user_id: int) -> str:
+        """Відповідь на фото, яке вже зараховано раніше"""
+        if processed['user_id'] != user_id:
+            return "♻️ Цей скріншот уже зараховано іншому користувачу - повторно він не враховується."
+        
+        return f"""♻️ Цей скріншот уже зараховано {str(processed['timestamp'])[:16]}:
+⏱️ Тривалість: {format_duration(processed['duration_minutes'])}
+👥 Глядачі: {format_number(processed['viewers_count'])}
+🎁 Дарувальники: {format_number(processed['gifters_count'])}
+💎 Алмази: {format_number(processed['diamonds_count'])}
+
+Повторно він не враховується."""
+    
+    async def ask_partial_confirmation(self, message, user_id: int, result: StatsResult, file_unique_id: str):
+        """
+        Запропонувати зберегти частковий результат OCR
+        
+        Розпізнавання зупинилось через бюджет часу - знайдені значення показуються
+        користувачу, і в базу вони потрапляють лише після підтвердження.
+        """
+        now = time.time()
+        for message_id in [key for key, pending in pending_results.items() if now - pending['created'] > PENDING_RESULT_TTL]:
+            del pending_results[message_id]
+        pending_results[message.message_id] = {
+            'user_id': user_id, 'result': result, 'file_unique_id': file_unique_id, 'created': now,
+        }
+        
+        lines = [
+            f"{FIELD_NAMES[field]}: " + ((format_duration(value) if field == 'duration' else format_number(value)) if value else "не знайдено")
+            for field, value in zip(FIELD_NAMES, result.stats)
+        ]
+        keyboard = [[
+            InlineKeyboardButton("✅ Зберегти", callback_data=f"ocr_confirm_{message.message_id}"),
+            InlineKeyboardButton("❌ Відхилити", callback_data=f"ocr_reject_{message.message_id}"),
+        ]]
+        await message.edit_text(
+            "⏱️ Скріншот розпізнано не повністю - обробка зайняла забагато часу.\n\n"
+            "📊 Знайдено:\n" + "\n".join(lines) +
+            "\n\nЗберегти ці значення? Якщо щось не так - відхиліть і надішліть чіткіший скріншот.",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        logger.info(f"Частковий результат очікує підтвердження: {user_id}, {result.stats}")
+    
+    async def resolve_partial_result(self, query, user_id: int, message_id: str, confirmed: bool):
+        """Зберегти або відхилити частковий результат OCR за кнопкою користувача"""
+        pending = pending_results.get(int(message_id))
+        if not pending or pending['user_id'] != user_id:
+            await query.edit_message_text("⌛ Цей результат уже недоступний. Надішліть скріншот ще раз.")
+            return
+        
+        del pending_results[int(message_id)]
+        if confirmed:
+            await query.edit_message_text(self.save_statistics(user_id, pending['result'], pending['file_unique_id']))
+        else:
+            await query.edit_message_text("🗑️ Результат відхилено. Надішліть чіткіший скріншот, щоб спробувати ще раз.")
+    
+    def uncertain_fields(self, result: StatsResult) -> str:
+        """Поля з впевненістю OCR нижче OCR_LOW_CONFIDENCE, напр. «Алмази (42%)»"""
+        uncertain = []
+        for field, value in zip(FIELD_NAMES, result.stats):
+            confidence = result.confidence.get(field, 1.0)
+            if value and confidence < OCR_LOW_CONFIDENCE:
+                uncertain.append(f"{FIELD_NAMES[field]} ({confidence:.0%})")
+        return ', '.join(uncertain)
+    
+    def format_today_totals(self, today_stats: Dict, total_screenshots: int) -> str:
+        """Підсумки за сьогодні для повідомлення про успіх"""
+        if today_stats and total_screenshots > 1:
+            return f"""
 ⏱️ Загальна тривалість: {format_duration(today_stats.get('total_duration', 0))}
 👥 Всього глядачів: {format_number(today_stats.get('total_viewers', 0))}
 💎 Всього алмазів: {format_number(today_stats.get('total_diamonds', 0))}"""
-
-                success_message += "\n\n📊 Дякую за використання бота!"
-                
-                await processing_msg.edit_text(success_message)
-                
-                logger.info(f"Статистика збережена: {user_id}, {duration}хв, {viewers} глядачів, {diamonds} алмазів")
-            else:
+        return ""
+    
+    async def collect_media_group(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        Зібрати фото альбому (media group) для обробки одним пакетом
+        
+        Telegram надсилає кожне фото альбому окремим оновленням з однаковим
+        media_group_id. Перевірки доступу та rate limit виконуються один раз для
+        першого фото, а пакет обробляється після паузи без нових фото альбому.
+        Оновлення обробляються паралельно, тому перевірка зберігається як задача:
+        фото, що надійшли під час неї, чекають той самий результат.
+        """
+        group_id = update.message.media_group_id
+        group = media_groups.get(group_id)
+        
+        if group is None:
+            group = {'update': update, 'photos': [], 'task': None,
+                     'access': asyncio.create_task(self.check_photo_access(update))}
+            media_groups[group_id] = group
+        
+        if not await group['access']:
+            # Відповідь вже надіслана на перше фото альбому
+            if group['task'] is None:
+                group['task'] = asyncio.create_task(self.forget_media_group(group_id))
+            return
+        
+        group['photos'].append(update.message.photo)  # Всі розміри фото
+        
+        # Перезапускаємо таймер, поки надходять нові фото альбому
+        if group['task'] is not None:
+            group['task'].cancel()
+        group['task'] = asyncio.create_task(self.process_media_group_later(group_id, context))
+    
+    async def forget_media_group(self, group_id: str):
+        """Забути відхилений альбом, коли всі його фото вже надійшли"""
+        await asyncio.sleep(MEDIA_GROUP_WAIT * 2)
+        media_groups.pop(group_id, None)
+    
+    async def process_media_group_later(self, group_id: str, context: ContextTypes.DEFAULT_TYPE):
+        """Дочекатися останнього фото альбому та обробити пакет"""
+        try:
+            await asyncio.sleep(MEDIA_GROUP_WAIT)
+        except asyncio.CancelledError:
+            return
+        
+        group = media_groups.pop(group_id, None)
+        if group:
+            await self.process_media_group(group['update'], context, group['photos'])
+    
+    async def process_media_group(self, update: Update, context: ContextTypes.DEFAULT_TYPE, photos: list):
+        """
+        Обробити альбом скріншотів: паралельний OCR, одна транзакція, один підсумок
+        
+        Args:
+            photos: Розміри кожного фото альбому (PhotoSize від меншого до більшого)
+        """
+        user_id = update.effective_user.id
+        
+        # Вже зараховані фото (переслані або надіслані повторно) не завантажуються і не рахуються вдруге
+        # Те саме фото двічі в одному альбомі обробляється один раз
+        unique_photos = list({sizes[-1].file_unique_id: sizes for sizes in photos}.values())
+        duplicates = [sizes for sizes in unique_photos if db.get_processed_photo(sizes[-1].file_unique_id)]
+        new_photos = [sizes for sizes in unique_photos if sizes not in duplicates]
+        if not new_photos:
+            await update.message.reply_text(
+                "♻️ Усі скріншоти альбому вже зараховано раніше - повторно вони не враховуються."
+            )
+            return
+        
+        try:
+            ocr_queue.ensure_capacity(len(new_photos))
+        except QueueFull as e:
+            await update.message.reply_text(self.busy_message(e))
+            return
+        
+        try:
+            started_text = f"⏳ Обробляю альбом з {len(new_photos)} скріншотів... 🔍"
+            processing_msg = await update.message.reply_text(started_text)
+            
+            # Позицію в черзі показує останнє фото альбому - воно почне оброблятися останнім
+            reporter = self.queue_reporter(processing_msg, started_text)
+            results = await asyncio.gather(
+                *(
+                    self.recognize_photo(context, sizes, user_id, reporter if index == len(new_photos) - 1 else None)
+                    for index, sizes in enumerate(new_photos)
+                ),
+                return_exceptions=True
+            )
+            
+            recognized = []
+            file_unique_ids = []
+            partial = []
+            for sizes, result in zip(new_photos, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Помилка обробки фото альбому: {result}")
+                elif result[0] and result[0].partial:
+                    # Частковий результат не зберігається без підтвердження - як для окремого скріншоту
+                    partial.append((result[0], sizes[-1].file_unique_id))
+                elif result[0]:
+                    recognized.append(result[0])
+                    file_unique_ids.append(sizes[-1].file_unique_id)
+            
+            if not recognized:
+                if partial:
+                    failed = len(new_photos) - len(partial)
+                    await processing_msg.edit_text(
+                        f"⏱️ Скріншоти альбому розпізнано не повністю: {len(partial)} - підтвердіть значення нижче"
+                        + (f"\n⚠️ Не розпізнано скріншотів: {failed} - надішліть їх ще раз окремо" if failed else "")
+                    )
+                    await self.ask_album_partial_confirmations(update, user_id, partial)
+                else:
+                    await processing_msg.edit_text(
+                        "❌ Не вдалося розпізнати статистику на жодному скріншоті альбому. Спробуйте інші скріншоти."
+                    )
+                return
+            
+            # Всі записи альбому - однією транзакцією; фото, зараховані тим часом
+            # паралельним оновленням, пропускаються
+            skipped = db.add_statistics_batch(user_id, [result.stats for result in recognized], file_unique_ids)
+            if skipped is None:
                 await processing_msg.edit_text("❌ Помилка збереження даних. Спробуйте ще раз.")
+                return
+            recognized = [result for index, result in enumerate(recognized) if index not in skipped]
+            if not recognized and not partial:
+                await processing_msg.edit_text(
+                    "♻️ Усі скріншоти альбому вже зараховано раніше - повторно вони не враховуються."
+                )
+                return
             
-            # Видалити файл
-            os.unlink(filename)
+            today_stats = db.get_today_total_stats(user_id)
+            total_screenshots = today_stats.get('sessions_count', len(recognized)) if today_stats else len(recognized)
             
-        except Exception as e:
-            logger.error(f"Помилка обробки фото: {e}")
-            try:
-                await processing_msg.edit_text("❌ Помилка обробки фото. Спробуйте ще раз.")
-            except:
-                await update.message.reply_text("❌ Помилка обробки фото. Спробуйте ще раз.")
+            message = f"✅ Альбом оброблено: {len(recognized)} з {len(photos)} скріншотів\n\n"
+            for i, result in enumerate(recognized, 1):
+                duration, viewers, gifters, diamonds = result.stats
+                message += (
+                    f"{i}. ⏱️ {format_duration(duration)} | 👥 {format_number(viewers)} | "
+                    f"🎁 {format_number(gifters)} | 💎 {format_number(diamonds)}\n"
+                )
+                uncertain = self.uncertain_fields(result)
+                if uncertain:
+                    message += f"   ⚠️ Перевірте: {uncertain}\n"
+            
+            if partial:
+                message += f"\n⏱️ Розпізнано частково: {len(partial)} - підтвердіть значення в повідомленнях нижче\n"
+            failed = len(new_photos) - len(recognized) - len(skipped) - len(partial)
+            if failed:
+                message += f"\n⚠️ Не розпізнано скріншотів: {failed} - надішліть їх ще раз окремо\n"
+            repeated = len(duplicates) + len(skipped) + len(photos) - len(unique_photos)
+            if repeated:
+                message += f"\n♻️ Вже зараховані раніше (не враховано вдруге): {repeated}\n"
             
-            # Видалити файл якщо існує
-            if 'filename' in locals() and os.path.exists(filename):
-                os.unlink(filename)
+            message += f"\n📈 Статистика за сьогодні:\n🎥 Скріншотів оброблено: {total_screenshots}"
+            message += self.format_today_totals(today_stats, total_screenshots)
+            message += "\n\n📊 Дякую за використання бота!"
+            
+            await processing_msg.edit_text(message)
+            await self.ask_album_partial_confirmations(update, user_id, partial)
+            
+            logger.info(f"Альбом збережено: {user_id}, {len(recognized)} з {len(photos)} скріншотів")
+            
+        except Exception as e:
+            logger.error(f"Помилка обробки альбому: {e}")
+            await update.message.reply_text("❌ Помилка обробки альбому. Спробуйте ще раз.")
+    
+    async def ask_album_partial_confirmations(self, update: Update, user_id: int, partial: list):
+        """Запропонувати підтвердити кожен частковий результат альбому окремим повідомленням"""
+        for result, file_unique_id in partial:
+            message = await update.message.reply_text("⏱️ Скріншот альбому розпізнано не повністю...")
+            await self.ask_partial_confirmation(message, user_id, result, file_unique_id)
     
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обробник callback запитів"""
@@ -817,6 +1234,10 @@ class TikTokStatsBot:
             elif data and data.startswith("remove_holiday_"):
                 date = data.replace("remove_holiday_", "")
                 await self.remove_holiday(query, user_id, date)
+            elif data and data.startswith("ocr_confirm_"):
+                await self.resolve_partial_result(query, user_id, data.replace("ocr_confirm_", ""), True)
+            elif data and data.startswith("ocr_reject_"):
+                await self.resolve_partial_result(query, user_id, data.replace("ocr_reject_", ""), False)
             elif data == "download_my_report":
                 await self.download_my_report(query, user_id)
             
@@ -835,6 +1256,13 @@ class TikTokStatsBot:
                 await self.show_admin_user_activity(query)
             elif data == "admin_test_ocr" and self.is_admin(user_id):
                 await self.test_ocr(query)
+            elif data == "admin_ocr_ranking" and self.is_admin(user_id):
+                await self.show_ocr_ranking(query)
+            elif data == "admin_ocr_timings" and self.is_admin(user_id):
+                await self.show_ocr_timings(query)
+            elif data == "admin_ocr_timings_reset" and self.is_admin(user_id):
+                timing_stats.reset()
+                await self.show_ocr_timings(query)
             elif data == "admin_export_all" and self.is_admin(user_id):
                 await self.admin_export_all(query)
             elif data == "admin_cleanup" and self.is_admin(user_id):
@@ -1034,7 +1462,7 @@ class TikTokStatsBot:
     
     async def test_ocr(self, query):
         """Тест OCR"""
-        if ocr_processor.test_ocr_installation():
+        if await test_ocr_installation():
             message = "✅ OCR працює правильно!"
         else:
             message = "❌ Проблеми з OCR. Перевірте встановлення Tesseract."
@@ -1044,6 +1472,79 @@ class TikTokStatsBot:
         
         await query.edit_message_text(message, reply_markup=reply_markup)
     
+    async def show_ocr_ranking(self, query):
+        """Показати вивчений рейтинг комбінацій OCR"""
+        ranking = rank_combinations(db.get_ocr_combo_stats(), OCR_TUNING_MIN_ATTEMPTS)
+        
+        message = "🧠 Рейтинг комбінацій OCR\n\n"
+        message += f"⚙️ Самонавчання: {'✅ Увімкнено' if OCR_TUNING else '❌ Вимкнено'}\n"
+        message += f"📏 Мінімум спроб для рейтингу: {OCR_TUNING_MIN_ATTEMPTS}\n\n"
+        
+        if not ranking:
+            message += "📭 Статистики ще немає - вона з'явиться після перших скріншотів"
+        else:
+            for i, item in enumerate(ranking[:15], 1):
+                status = "⛔" if item['pruned'] else ("✅" if item['attempts'] >= OCR_TUNING_MIN_ATTEMPTS else "🆕")
+                message += (
+                    f"{status} {i}. {item['variant']} | {short_config(item['config'])}\n"
+                    f"    {item['field_hits']} полів / {item['attempts']} спроб, "
+                    f"{item['avg_ms']:.0f} мс, оцінка {item['score']:.2f}\n"
+                )
+            message += "\n✅ вивчена  🆕 мало даних  ⛔ відкладена в кінець"
+        
+        layouts = db.get_ocr_layouts()
+        message += f"\n\n🗺️ Вивчені розмітки екрану: {len(layouts)}\n"
+        for layout in layouts[:8]:
+            message += f"• {layout['name']}: ✅ {layout['hits']} / ❌ {layout['misses']}\n"
+        
+        keyboard = [
+            [InlineKeyboardButton("🔄 Оновити", callback_data="admin_ocr_ranking")],
+            [InlineKeyboardButton("🔙 Назад до адмін панелі", callback_data="admin_panel")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await query.edit_message_text(message, reply_markup=reply_markup)
+    
+    async def show_ocr_timings(self, query):
+        """Показати гістограми часу етапів розпізнавання з моменту запуску"""
+        message = "⏱️ Час розпізнавання OCR\n\n"
+        message += f"📸 Скріншотів: {timing_stats.screenshots} (з {datetime.fromtimestamp(timing_stats.started).strftime('%d.%m %H:%M')})\n\n"
+        
+        stages = timing_stats.stage_summary()
+        if not stages:
+            message += "📭 Даних ще немає - вони з'являться після перших скріншотів"
+        else:
+            message += "📊 Етапи (середнє / p50 / p95 / макс, мс):\n"
+            for item in stages:
+                message += (
+                    f"• {STAGE_NAMES.get(item['name'], item['name'])}: {item['avg_ms']:.0f} / "
+                    f"{item['p50_ms']:.0f} / {item['p95_ms']:.0f} / {item['max_ms']:.0f}\n"
+                )
+            
+            total = timing_stats.total_histogram()
+            if total and total.count:
+                message += "\n📈 Повний час скріншоту:\n"
+                widest = max(total.buckets)
+                for index, count in enumerate(total.buckets):
+                    if count:
+                        bar = '█' * max(1, round(count / widest * 12))
+                        message += f"{bucket_label(index):>8} {bar} {count}\n"
+            
+            slowest = timing_stats.slowest_calls(8)
+            if slowest:
+                message += "\n🐢 Найповільніші виклики Tesseract (середнє / p95, мс):\n"
+                for item in slowest:
+                    message += f"• {item['name']}: {item['avg_ms']:.0f} / {item['p95_ms']:.0f} ({item['count']})\n"
+        
+        keyboard = [
+            [InlineKeyboardButton("🔄 Оновити", callback_data="admin_ocr_timings"),
+             InlineKeyboardButton("🗑️ Скинути", callback_data="admin_ocr_timings_reset")],
+            [InlineKeyboardButton("🔙 Назад до адмін панелі", callback_data="admin_panel")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        
+        await query.edit_message_text(message, reply_markup=reply_markup)
+    
     async def show_main_menu(self, query, user_id: int):
         """Показати головне меню"""
         user_data = db.get_user(user_id)
@@ -1568,7 +2069,9 @@ class TikTokStatsBot:
              InlineKeyboardButton("📋 Логи системи", callback_data="admin_logs")],
             [InlineKeyboardButton("🔑 Діагностика доступу", callback_data="admin_diagnostics"),
              InlineKeyboardButton("⚙️ Системна інформація", callback_data="admin_system_info")],
-            [InlineKeyboardButton("🔧 Техобслуговування", callback_data="admin_maintenance")],
+            [InlineKeyboardButton("🔧 Техобслуговування", callback_data="admin_maintenance"),
+             InlineKeyboardButton("🧠 Рейтинг OCR", callback_data="admin_ocr_ranking")],
+            [InlineKeyboardButton("⏱️ Час OCR", callback_data="admin_ocr_timings")],
             [InlineKeyboardButton("🔙 Назад до меню", callback_data="back_to_menu")]
         ]
         
@@ -1769,6 +2272,9 @@ class TikTokStatsBot:
         """Системна інформація"""
         total_stats = db.get_total_stats()
         users = db.get_all_users()
+        plan = current_plan()
+        queue = ocr_queue.info()
+        warmup = readiness()
         
         message = f"""⚙️ Системна інформація
 
@@ -1788,6 +2294,14 @@ class TikTokStatsBot:
 • Rate Limit: {RATE_LIMIT_MESSAGES} повідомлень за {RATE_LIMIT_PERIOD}с
 • Макс розмір файлу: {MAX_FILE_SIZE // (1024*1024)}MB
 
+🧮 OCR:
+• Готовність: {self.format_readiness(warmup)}
+• Ядер (з квотою): {plan.cpus}
+• Процесів: {queue['limit']} з {plan.min_workers}-{plan.max_workers}, потоків у процесі {plan.threads_per_worker}
+• Зараз: {queue['running']} в роботі (ліміт {queue['limit']} з {queue['consumers']})
+• Черга скріншотів: {queue['waiting']} з {queue['max_size']} ({queue['users']} користувачів)
+• Середній час скріншота: {queue['job_seconds']:.1f} с, оброблено {queue['completed']}
+
 🕐 Останнє оновлення: {datetime.now().strftime('%d.%m.%Y %H:%M')}
 """
         
@@ -1796,6 +2310,14 @@ class TikTokStatsBot:
         
         await query.edit_message_text(message, reply_markup=reply_markup)
 
+    def format_readiness(self, warmup: Dict) -> str:
+        """Стан прогріву OCR для адмін-панелі"""
+        if warmup['status'] == 'ready':
+            return f"✅ готовий (прогрів {warmup['seconds']:.1f} с, процесів {warmup['workers']})"
+        if warmup['status'] == 'degraded':
+            return f"⚠️ з помилками: {warmup['error']}"
+        return "⏳ прогрівається"
+
     async def commands_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обробник команди /commands - показати список команд"""
         if not update.message or not update.effective_user:
@@ -1908,19 +2430,26 @@ class TikTokStatsBot:
         
         self.application.add_handler(CallbackQueryHandler(self.handle_callback))
     
+    async def post_init(self, application: Application):
+        """Запустити прогрів OCR у фоні: опитування Telegram не чекає на нього"""
+        application.create_task(warm_up())
+
     def run_bot(self):
-        """Запустити бота синхронно"""
-        # Тест OCR
-        if ocr_processor.test_ocr_installation():
-            logger.info("OCR тест пройшов успішно")
-        else:
-            logger.warning("Проблеми з OCR - перевірте встановлення Tesseract")
+        """
+        Запустити бота синхронно
         
+        Стек OCR (OpenCV, NumPy, Tesseract) у процес бота не імпортується - його
+        завантажують процеси-воркери, які прогріваються у фоні після старту
+        (post_init), тому обробники команд готові одразу.
+        """
         # Створити додаток
         if not BOT_TOKEN:
             logger.error("BOT_TOKEN не встановлений!")
             return
-        self.application = Application.builder().token(BOT_TOKEN).build()
+        # Паралельна обробка оновлень: OCR одного скріншота не затримує інших користувачів
+        self.application = (
+            Application.builder().token(BOT_TOKEN).concurrent_updates(True).post_init(self.post_init).build()
+        )
         
         # Налаштувати обробники
         self.setup_handlers()
@@ -1941,7 +2470,10 @@ class TikTokStatsBot:
         scheduler_thread.start()
         
         # Запустити бота
-        self.application.run_polling()
+        try:
+            self.application.run_polling()
+        finally:
+            shutdown_executor()
 
     async def download_summary_report(self, query, user_id: int):
         """Скачати зведений звіт"""
@@ -28,7 +28,48 @@ else:
 ADMIN_USER_IDS = list(map(int, os.getenv('ADMIN_USER_IDS', '').split(',') if os.getenv('ADMIN_USER_IDS') else []))
 
 # OCR налаштування
-TESSERACT_CONFIG = r'--oem 3 --psm 6 -l ukr+eng'
+TESSERACT_CONFIG = r'--oem 3 --psm 6'
+# Моделі Tesseract: для кожного скріншоту обирається одна (за мовою користувача або пробою)
+OCR_LANGUAGES = [language.strip() for language in os.getenv('OCR_LANGUAGES', 'ukr,eng').split(',') if language.strip()]
+# Паралельність OCR; 0 - автоматично за квотою CPU контейнера (cpu_planner.py)
+OCR_POOL_SIZE = int(os.getenv('OCR_POOL_SIZE', 0))  # потоки каскаду та теплі воркери Tesseract у процесі
+OCR_PROCESS_WORKERS = int(os.getenv('OCR_PROCESS_WORKERS', 0))  # максимум процесів для паралельної обробки скріншотів
+OCR_MIN_PROCESS_WORKERS = int(os.getenv('OCR_MIN_PROCESS_WORKERS', 1))  # процесів без черги
+# Черга скріншотів перед OCR: при заповненій черзі користувач одразу отримує «спробуйте пізніше»
+OCR_QUEUE_SIZE = int(os.getenv('OCR_QUEUE_SIZE', 30))  # максимум скріншотів, що очікують
+OCR_QUEUE_CONSUMERS = int(os.getenv('OCR_QUEUE_CONSUMERS', 0))  # одночасних обробників (0 - як процесів OCR)
+OCR_WARMUP_IMAGE = os.getenv('OCR_WARMUP_IMAGE', '')  # скріншот для прогріву воркерів (порожньо - синтетичний)
+OCR_TIME_BUDGET = float(os.getenv('OCR_TIME_BUDGET', 20))  # секунд на скріншот, далі - частковий результат (0 - без обмеження)
+# Кеш результатів OCR: кандидати за перцептивним хешем, влучання - лише за точним збігом вмісту
+OCR_CACHE_SIZE = int(os.getenv('OCR_CACHE_SIZE', 512))  # записів у пам'яті кожного воркера (0 - вимкнено)
+OCR_CACHE_MAX_DISTANCE = int(os.getenv('OCR_CACHE_MAX_DISTANCE', 6))  # біт різниці хешів
+OCR_CACHE_PERSIST = os.getenv('OCR_CACHE_PERSIST', 'true').lower() in ('1', 'true', 'yes')  # зберігати в БД
+# Самонавчання порядку комбінацій (варіант, конфігурація) каскаду
+OCR_TUNING = os.getenv('OCR_TUNING', 'true').lower() in ('1', 'true', 'yes')
+OCR_TUNING_MIN_ATTEMPTS = int(os.getenv('OCR_TUNING_MIN_ATTEMPTS', 20))  # спроб до участі в рейтингу
+OCR_TUNING_REFRESH = int(os.getenv('OCR_TUNING_REFRESH', 20))  # скріншотів між записом статистики та оновленням порядку
+OCR_TUNING_EXPLORE_EVERY = int(os.getenv('OCR_TUNING_EXPLORE_EVERY', 10))  # кожен N-й скріншот - фоновий прохід пропущеної комбінації (0 - ні)
+OCR_MODE = os.getenv('OCR_MODE', 'cascade')  # 'cascade' - ранній вихід, 'anchored' - вирізки за підписами, 'full' - всі варіанти x конфігурації
+# Розпізнавання слів зі впевненістю Tesseract: голоси варіантів зважуються впевненістю
+OCR_WORD_CONFIDENCE = os.getenv('OCR_WORD_CONFIDENCE', 'true').lower() in ('1', 'true', 'yes')
+OCR_LOW_CONFIDENCE = float(os.getenv('OCR_LOW_CONFIDENCE', 0.5))  # нижче - просимо користувача перевірити поле
+OCR_TARGET_GLYPH_HEIGHT = int(os.getenv('OCR_TARGET_GLYPH_HEIGHT', 32))  # висота символів для Tesseract, px (0 - не масштабувати)
+# Вибір розміру фото Telegram: найменший, на якому символи не нижчі за OCR_MIN_SOURCE_GLYPH_HEIGHT.
+# За замовчуванням потрібно 16 / 0.02 = 800 px висоти - середній розмір Telegram (800 з 1280)
+OCR_MIN_SOURCE_GLYPH_HEIGHT = int(os.getenv('OCR_MIN_SOURCE_GLYPH_HEIGHT', 16))  # px у завантаженому фото (0 - завжди найбільший)
+OCR_GLYPH_HEIGHT_RATIO = float(os.getenv('OCR_GLYPH_HEIGHT_RATIO', 0.02))  # висота символів / висота скріншоту (benchmark_ocr.py --glyph-ratio)
+OCR_REDUCED_DECODE = os.getenv('OCR_REDUCED_DECODE', 'true').lower() in ('1', 'true', 'yes')  # зменшувати великі скріншоти вже при декодуванні
+# Шаблони розмітки екрану підсумків: впізнані скріншоти розбираються прямими вирізками
+OCR_LAYOUTS = os.getenv('OCR_LAYOUTS', 'true').lower() in ('1', 'true', 'yes')
+OCR_LAYOUTS_FILE = os.getenv('OCR_LAYOUTS_FILE', '')  # JSON з ручними шаблонами (необов'язково)
+OCR_LAYOUT_LEARN = os.getenv('OCR_LAYOUT_LEARN', 'true').lower() in ('1', 'true', 'yes')  # вивчати нові розмітки
+OCR_LAYOUTS_PERSIST = os.getenv('OCR_LAYOUTS_PERSIST', 'true').lower() in ('1', 'true', 'yes')  # зберігати в БД
+OCR_LAYOUT_MIN_CORRELATION = float(os.getenv('OCR_LAYOUT_MIN_CORRELATION', 0.85))  # схожість мініатюр для впізнавання
+OCR_LAYOUT_ASPECT_TOLERANCE = float(os.getenv('OCR_LAYOUT_ASPECT_TOLERANCE', 0.03))  # відносна різниця пропорцій екрану
+OCR_LAYOUT_MAX_TEMPLATES = int(os.getenv('OCR_LAYOUT_MAX_TEMPLATES', 64))  # максимум вивчених шаблонів
+# Вбудований розпізнавач цифр для вирізок значень (модель будує train_glyphs.py)
+OCR_GLYPH_MODEL = os.getenv('OCR_GLYPH_MODEL', 'glyph_model.npz')  # порожньо або немає файлу - лише Tesseract
+OCR_GLYPH_MIN_CONFIDENCE = float(os.getenv('OCR_GLYPH_MIN_CONFIDENCE', 0.6))  # нижче - вирізка йде в Tesseract
 
 # Повідомлення бота
 MESSAGES = {
@@ -50,6 +91,7 @@ RATE_LIMIT_PERIOD = 60   # за період в секундах
 # Налаштування файлів
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
+MEDIA_GROUP_WAIT = float(os.getenv('MEDIA_GROUP_WAIT', 1.5))  # секунд очікування решти фото альбому
 
 # Час для щоденних звітів
 DAILY_REPORT_HOUR = 23
@@ -0,0 +1,191 @@
+import logging
+import math
+import os
+import time
+from functools import lru_cache
+from typing import Callable, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Файли квоти CPU: cgroup v2 та v1
+CGROUP_V2_CPU_MAX = '/sys/fs/cgroup/cpu.max'
+CGROUP_V1_QUOTA = '/sys/fs/cgroup/cpu/cpu.cfs_quota_us'
+CGROUP_V1_PERIOD = '/sys/fs/cgroup/cpu/cpu.cfs_period_us'
+
+# Скільки секунд без черги, перш ніж ліміт паралельності зменшиться на одиницю
+SHRINK_AFTER_IDLE = 30.0
+
+# Ліміт росте, лише коли в черзі не менше стількох задач і не менше, ніж сам ліміт:
+# одна задача в черзі не запускає новий процес, а зменшення чекає порожньої черги
+GROW_MIN_WAITING = 2
+
+
+class CPUPlan(NamedTuple):
+    """Узгоджений розподіл CPU між процесами OCR, їх потоками та бібліотеками"""
+    cpus: float  # доступні ядра з урахуванням квоти контейнера
+    min_workers: int  # процесів OCR, що працюють завжди
+    max_workers: int  # межа процесів OCR при довгій черзі
+    threads_per_worker: int  # потоки каскаду та теплі воркери Tesseract у процесі
+    opencv_threads: int  # внутрішні потоки OpenCV у процесі
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """
+    Квота CPU контейнера в ядрах (0.5 - половина ядра) або None, якщо квоти немає
+
+    Читає cgroup v2 (cpu.max) або v1 (cpu.cfs_quota_us / cpu.cfs_period_us).
+    """
+    cpu_max = _read(CGROUP_V2_CPU_MAX)
+    if cpu_max:
+        quota, _, period = cpu_max.partition(' ')
+        if quota != 'max' and period:
+            return int(quota) / int(period)
+        return None
+
+    quota, period = _read(CGROUP_V1_QUOTA), _read(CGROUP_V1_PERIOD)
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def available_cpus() -> float:
+    """Ядра, доступні процесу: менше з прив'язки до ядер та квоти cgroup"""
+    try:
+        cpus = float(len(os.sched_getaffinity(0)))
+    except AttributeError:  # не Linux
+        cpus = float(os.cpu_count() or 1)
+
+    try:
+        quota = cgroup_cpu_limit()
+    except ValueError as e:
+        logger.warning(f"Не вдалося прочитати квоту CPU: {e}")
+        quota = None
+    return min(cpus, quota) if quota else cpus
+
+
+def make_plan(cpus: float, min_workers: int = 0, max_workers: int = 0, threads_per_worker: int = 0) -> CPUPlan:
+    """
+    Розподілити ядра між процесами OCR
+
+    На дробовій квоті (0.5 ядра) - один процес з одним потоком; на більших
+    машинах - процес на ядро. Tesseract завжди працює в один потік OpenMP:
+    паралельність дають процеси та потоки каскаду, інакше вони конкурують.
+
+    Args:
+        cpus: Доступні ядра
+        min_workers: Мінімум процесів (0 - один)
+        max_workers: Максимум процесів (0 - за кількістю ядер)
+        threads_per_worker: Потоків у процесі (0 - ядра, що залишаються на процес)
+    """
+    slots = max(1, math.floor(cpus))
+    maximum = max_workers if max_workers > 0 else slots
+    minimum = min(max(1, min_workers), maximum)
+    threads = threads_per_worker if threads_per_worker > 0 else max(1, slots // maximum)
+    return CPUPlan(round(cpus, 2), minimum, maximum, threads, threads)
+
+
+@lru_cache(maxsize=1)
+def current_plan() -> CPUPlan:
+    """План для поточного контейнера з урахуванням налаштувань (обчислюється один раз)"""
+    from config import OCR_MIN_PROCESS_WORKERS, OCR_PROCESS_WORKERS, OCR_POOL_SIZE
+    plan = make_plan(available_cpus(), OCR_MIN_PROCESS_WORKERS, OCR_PROCESS_WORKERS, OCR_POOL_SIZE)
+    logger.info(
+        f"План CPU: {plan.cpus} ядер, процесів OCR {plan.min_workers}-{plan.max_workers}, "
+        f"потоків у процесі {plan.threads_per_worker}"
+    )
+    return plan
+
+
+def apply_thread_limits(plan: CPUPlan):
+    """
+    Обмежити внутрішні потоки бібліотек згідно з планом
+
+    OMP_THREAD_LIMIT має бути встановлений до завантаження libtesseract,
+    а процеси tesseract успадковують його від бота. Явно задане значення не змінюється.
+    """
+    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+    try:
+        import cv2
+        cv2.setNumThreads(plan.opencv_threads)
+    except ImportError:
+        pass
+
+
+class AdaptiveLimiter:
+    """
+    Ліміт одночасних задач OCR, що змінюється з глибиною черги
+
+    Ліміт зростає на одиницю, коли всі дозволені задачі в роботі, а в черзі
+    чекає щонайменше max(GROW_MIN_WAITING, ліміт) задач, і зменшується на одиницю
+    після кожних SHRINK_AFTER_IDLE секунд без черги. Задачі видає черга OCR
+    (ocr_queue.py): вона повідомляє свій стан через update і не видає задач понад
+    ліміт. Зміну ліміту отримує on_change - за ним пул процесів OCR змінює розмір.
+    """
+
+    def __init__(self, minimum: int, maximum: int, on_change: Optional[Callable[[int], None]] = None):
+        """
+        Args:
+            minimum: Початковий і найменший ліміт
+            maximum: Найбільший ліміт
+            on_change: Викликається з новим лімітом після кожної зміни
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.on_change = on_change
+        self.limit = minimum
+        self.running = 0
+        self.waiting = 0
+        self._last_busy = time.monotonic()
+
+    def _adjust(self):
+        """Перерахувати ліміт за поточною чергою"""
+        now = time.monotonic()
+        if self.waiting > 0:
+            self._last_busy = now
+            if (self.limit < self.maximum and self.running >= self.limit
+                    and self.waiting >= max(GROW_MIN_WAITING, self.limit)):
+                self.limit += 1
+                logger.info(f"Ліміт OCR збільшено до {self.limit} (у черзі {self.waiting})")
+                self._changed()
+        elif self.limit > self.minimum and self.running < self.limit and now - self._last_busy > SHRINK_AFTER_IDLE:
+            self.limit -= 1
+            self._last_busy = now
+            logger.info(f"Ліміт OCR зменшено до {self.limit}")
+            self._changed()
+
+    def _changed(self):
+        """Повідомити on_change про новий ліміт"""
+        if self.on_change is None:
+            return
+        try:
+            self.on_change(self.limit)
+        except Exception as e:
+            logger.warning(f"Не вдалося застосувати ліміт OCR {self.limit}: {e}")
+
+    def update(self, waiting: int, running: int) -> int:
+        """
+        Врахувати стан черги та повернути поточний ліміт
+
+        Args:
+            waiting: Задач, що очікують
+            running: Задач у роботі
+        """
+        self.waiting = waiting
+        self.running = running
+        self._adjust()
+        return self.limit
+
+    def info(self) -> dict:
+        """Стан ліміту для діагностики"""
+        return {
+            'limit': self.limit, 'running': self.running, 'waiting': self.waiting,
+            'minimum': self.minimum, 'maximum': self.maximum,
+        }
@@ -66,6 +66,78 @@ class Database:
             # Індекс для вихідних днів
             conn.execute('CREATE INDEX IF NOT EXISTS idx_holidays_user_date ON holidays(user_id, holiday_date)')
             
+            # Кеш результатів OCR: перцептивний хеш відбирає кандидатів, хеш вмісту підтверджує.
+            # Записи без хешу вмісту (мініатюри) не відрізняли цифр - такий кеш перебудовується
+            columns = [row['name'] for row in conn.execute('PRAGMA table_info(ocr_cache)')]
+            if columns and 'digest' not in columns:
+                conn.execute('DROP TABLE ocr_cache')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS ocr_cache (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    phash TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    duration_minutes INTEGER NOT NULL,
+                    viewers_count INTEGER NOT NULL,
+                    gifters_count INTEGER NOT NULL,
+                    diamonds_count INTEGER NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_ocr_cache_created ON ocr_cache(created_at)')
+            
+            # Статистика успішності комбінацій (варіант зображення, конфігурація) OCR
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS ocr_combo_stats (
+                    variant TEXT NOT NULL,
+                    config TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    field_hits INTEGER NOT NULL DEFAULT 0,
+                    total_ms REAL NOT NULL DEFAULT 0,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (variant, config)
+                )
+            ''')
+            
+            # Вивчені шаблони розмітки екрану підсумків TikTok LIVE
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS ocr_layouts (
+                    name TEXT PRIMARY KEY,
+                    aspect REAL NOT NULL,
+                    theme TEXT NOT NULL,
+                    fingerprint BLOB NOT NULL,
+                    regions TEXT NOT NULL,
+                    parsers TEXT NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    misses INTEGER NOT NULL DEFAULT 0,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Оброблені фото Telegram: file_unique_id однаковий для пересланих та повторно надісланих фото
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS telegram_photos (
+                    file_unique_id TEXT PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    statistics_id INTEGER NOT NULL,
+                    duration_minutes INTEGER NOT NULL,
+                    viewers_count INTEGER NOT NULL,
+                    gifters_count INTEGER NOT NULL,
+                    diamonds_count INTEGER NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (statistics_id) REFERENCES statistics (id)
+                )
+            ''')
+            
+            # Мова скріншотів користувача: модель Tesseract без проби для наступних скріншотів.
+            # Окрема таблиця, бо register_user перезаписує рядок users
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS user_ocr_languages (
+                    telegram_id INTEGER PRIMARY KEY,
+                    language TEXT NOT NULL,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
             conn.commit()
             logger.info("База даних ініціалізована успішно")
         except Exception as e:
@@ -116,23 +188,149 @@ class Database:
             conn.close()
     
     def add_statistics(self, user_id: int, duration_minutes: int, viewers_count: int, 
-                      gifters_count: int, diamonds_count: int, screenshot_path: Optional[str] = None) -> bool:
-        """Додати запис статистики"""
+                      gifters_count: int, diamonds_count: int, screenshot_path: Optional[str] = None,
+                      file_unique_id: Optional[str] = None) -> bool:
+        """
+        Додати запис статистики; file_unique_id фото Telegram запам'ятовується для пошуку повторів
+        
+        Якщо це фото вже зараховано (зокрема паралельним оновленням того ж фото),
+        запис статистики не створюється і повертається False - get_processed_photo
+        після цього знаходить попередній запис.
+        """
         conn = self.get_connection()
         try:
-            conn.execute('''
-                INSERT INTO statistics (user_id, duration_minutes, viewers_count, gifters_count, diamonds_count, screenshot_path)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, duration_minutes, viewers_count, gifters_count, diamonds_count, screenshot_path))
-            conn.commit()
+            with conn:
+                cursor = conn.execute('''
+                    INSERT INTO statistics (user_id, duration_minutes, viewers_count, gifters_count, diamonds_count, screenshot_path)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (user_id, duration_minutes, viewers_count, gifters_count, diamonds_count, screenshot_path))
+                if file_unique_id:
+                    self._index_photo(conn, file_unique_id, user_id, cursor.lastrowid,
+                                      (duration_minutes, viewers_count, gifters_count, diamonds_count))
             self.update_user_activity(user_id)
             return True
+        except sqlite3.IntegrityError as e:
+            logger.warning(f"Фото {file_unique_id} вже зараховано, запис для користувача {user_id} не додано: {e}")
+            return False
         except Exception as e:
             logger.error(f"Помилка додавання статистики для користувача {user_id}: {e}")
             return False
         finally:
             conn.close()
     
+    def add_statistics_batch(self, user_id: int, rows: List[Tuple[int, int, int, int]],
+                             file_unique_ids: Optional[List[str]] = None) -> Optional[List[int]]:
+        """
+        Додати кілька записів статистики однією транзакцією: (duration, viewers, gifters, diamonds)
+        
+        file_unique_ids - фото Telegram кожного запису (у тому ж порядку) для пошуку повторів.
+        Транзакція одразу бере блокування на запис, тому перевірка повторів і вставка
+        не перемежовуються з іншими оновленнями.
+        
+        Returns:
+            List[int]: Номери пропущених записів (фото вже зараховано) або None при помилці
+        """
+        conn = self.get_connection()
+        try:
+            skipped = []
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                for index, (row, file_unique_id) in enumerate(zip(rows, file_unique_ids or [None] * len(rows))):
+                    if file_unique_id and self._photo_indexed(conn, file_unique_id):
+                        skipped.append(index)
+                        continue
+                    cursor = conn.execute('''
+                        INSERT INTO statistics (user_id, duration_minutes, viewers_count, gifters_count, diamonds_count)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', (user_id, *row))
+                    if file_unique_id:
+                        self._index_photo(conn, file_unique_id, user_id, cursor.lastrowid, row)
+                conn.execute('UPDATE users SET last_activity = CURRENT_TIMESTAMP WHERE telegram_id = ?', (user_id,))
+            return skipped
+        except Exception as e:
+            logger.error(f"Помилка додавання пакета статистики для користувача {user_id}: {e}")
+            return None
+        finally:
+            conn.close()
+    
+    def _index_photo(self, conn, file_unique_id: str, user_id: int, statistics_id: int,
+                     stats: Tuple[int, int, int, int]):
+        """
+        Запам'ятати фото Telegram та запис статистики, який з нього створено (в транзакції conn)
+        
+        Вже зараховане фото - IntegrityError, і вся транзакція разом із записом статистики
+        відкочується. Запис про фото, статистику якого видалено, замінюється.
+        """
+        conn.execute('''
+            DELETE FROM telegram_photos
+            WHERE file_unique_id = ? AND statistics_id NOT IN (SELECT id FROM statistics)
+        ''', (file_unique_id,))
+        conn.execute('''
+            INSERT INTO telegram_photos
+                (file_unique_id, user_id, statistics_id, duration_minutes, viewers_count, gifters_count, diamonds_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (file_unique_id, user_id, statistics_id, *stats))
+    
+    def _photo_indexed(self, conn, file_unique_id: str) -> bool:
+        """Чи зараховано фото з існуючим записом статистики (в транзакції conn)"""
+        cursor = conn.execute('''
+            SELECT 1 FROM telegram_photos p
+            JOIN statistics s ON s.id = p.statistics_id
+            WHERE p.file_unique_id = ?
+        ''', (file_unique_id,))
+        return cursor.fetchone() is not None
+    
+    def get_processed_photo(self, file_unique_id: str) -> Optional[Dict]:
+        """
+        Знайти вже зарахований скріншот за file_unique_id фото Telegram
+        
+        Повертає запис лише якщо створений з фото рядок статистики ще існує.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT p.*, s.timestamp
+                FROM telegram_photos p
+                JOIN statistics s ON s.id = p.statistics_id
+                WHERE p.file_unique_id = ?
+            ''', (file_unique_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+        except Exception as e:
+            logger.error(f"Помилка пошуку обробленого фото {file_unique_id}: {e}")
+            return None
+        finally:
+            conn.close()
+    
+    def get_user_ocr_language(self, telegram_id: int) -> str:
+        """Мова скріншотів користувача або '' якщо ще не визначена"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('SELECT language FROM user_ocr_languages WHERE telegram_id = ?', (telegram_id,))
+            row = cursor.fetchone()
+            return row['language'] if row else ''
+        except Exception as e:
+            logger.error(f"Помилка отримання мови OCR користувача {telegram_id}: {e}")
+            return ''
+        finally:
+            conn.close()
+    
+    def set_user_ocr_language(self, telegram_id: int, language: str) -> bool:
+        """Запам'ятати мову, якою прочитано скріншот користувача"""
+        conn = self.get_connection()
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO user_ocr_languages (telegram_id, language, updated_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+            ''', (telegram_id, language))
+            conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Помилка збереження мови OCR користувача {telegram_id}: {e}")
+            return False
+        finally:
+            conn.close()
+    
     def get_user_statistics(self, telegram_id: int, days: int = 30) -> List[Dict]:
         """Отримати статистику користувача за останні N днів"""
         conn = self.get_connection()
@@ -572,6 +770,127 @@ class Database:
         finally:
             conn.close()
     
+    def save_ocr_cache_entry(self, phash: str, digest: str, duration_minutes: int, viewers_count: int,
+                             gifters_count: int, diamonds_count: int, keep: int = 1000) -> bool:
+        """Зберегти результат розпізнавання скріншоту в кеші OCR, залишивши keep останніх записів"""
+        conn = self.get_connection()
+        try:
+            conn.execute('''
+                INSERT INTO ocr_cache (phash, digest, duration_minutes, viewers_count, gifters_count, diamonds_count)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (phash, digest, duration_minutes, viewers_count, gifters_count, diamonds_count))
+            conn.execute('DELETE FROM ocr_cache WHERE id <= (SELECT MAX(id) FROM ocr_cache) - ?', (keep,))
+            conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Помилка збереження кешу OCR: {e}")
+            return False
+        finally:
+            conn.close()
+    
+    def get_ocr_cache_entries(self, limit: int, after_id: int = 0) -> List[Dict]:
+        """Отримати останні записи кешу OCR з id більшим за after_id (новіші першими)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('''
+                SELECT * FROM ocr_cache
+                WHERE id > ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (after_id, limit))
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Помилка отримання кешу OCR: {e}")
+            return []
+        finally:
+            conn.close()
+    
+    def update_ocr_combo_stats(self, rows: List[Tuple[str, str, int, int, float]]) -> bool:
+        """Додати приріст статистики комбінацій OCR: (variant, config, attempts, field_hits, total_ms)"""
+        conn = self.get_connection()
+        try:
+            conn.executemany('''
+                INSERT INTO ocr_combo_stats (variant, config, attempts, field_hits, total_ms)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(variant, config) DO UPDATE SET
+                    attempts = attempts + excluded.attempts,
+                    field_hits = field_hits + excluded.field_hits,
+                    total_ms = total_ms + excluded.total_ms,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', rows)
+            conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Помилка оновлення статистики комбінацій OCR: {e}")
+            return False
+        finally:
+            conn.close()
+    
+    def get_ocr_combo_stats(self) -> List[Dict]:
+        """Отримати статистику комбінацій OCR"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute('SELECT * FROM ocr_combo_stats')
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Помилка отримання статистики комбінацій OCR: {e}")
+            return []
+        finally:
+            conn.close()
+    
+    def save_ocr_layout(self, name: str, aspect: float, theme: str, fingerprint: bytes,
+                        regions: str, parsers: str) -> bool:
+        """Зберегти вивчений шаблон розмітки (області оновлюються, лічильник невдач скидається)"""
+        conn = self.get_connection()
+        try:
+            conn.execute('''
+                INSERT INTO ocr_layouts (name, aspect, theme, fingerprint, regions, parsers)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    regions = excluded.regions,
+                    parsers = excluded.parsers,
+                    misses = 0,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', (name, aspect, theme, fingerprint, regions, parsers))
+            conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Помилка збереження шаблону розмітки: {e}")
+            return False
+        finally:
+            conn.close()
+    
+    def update_ocr_layout_stats(self, name: str, hits: int, misses: int) -> bool:
+        """Додати приріст успіхів та невдач шаблону розмітки"""
+        conn = self.get_connection()
+        try:
+            conn.execute('''
+                UPDATE ocr_layouts
+                SET hits = hits + ?, misses = misses + ?, updated_at = CURRENT_TIMESTAMP
+                WHERE name = ?
+            ''', (hits, misses, name))
+            conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Помилка оновлення статистики шаблону розмітки: {e}")
+            return False
+        finally:
+            conn.close()
+    
+    def get_ocr_layouts(self, updated_since: str = '') -> List[Dict]:
+        """Отримати вивчені шаблони розмітки, змінені не раніше updated_since ('' - всі)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute(
+                'SELECT * FROM ocr_layouts WHERE updated_at >= ? ORDER BY hits DESC', (updated_since,)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Помилка отримання шаблонів розмітки: {e}")
+            return []
+        finally:
+            conn.close()
+    
     def set_maintenance_mode(self, enabled: bool, message: str = "") -> bool:
         """Встановити режим технічного обслуговування"""
         try:
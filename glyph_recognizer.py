@@ -0,0 +1,235 @@
+import logging
+import os
+from typing import List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Розмір нормованого зображення символу (сторона квадрата)
+GLYPH_SIDE = 12
+
+# Вага геометричних ознак (висота, положення, пропорції) відносно пікселів
+GEOMETRY_WEIGHT = 3.0
+
+# Проміжок між символами (у частках висоти рядка), що вважається пробілом
+SPACE_GAP = 0.45
+
+# Кількість сусідів для голосування
+NEIGHBOURS = 3
+
+# Максимум зразків одного символу в моделі
+MAX_SAMPLES_PER_LABEL = 300
+
+# Прямокутник символу: (x1, y1, x2, y2)
+GlyphBox = Tuple[int, int, int, int]
+
+
+class GlyphRead(NamedTuple):
+    """Текст вирізки та впевненість найменш певного символу від 0 до 1"""
+    text: str
+    confidence: float
+
+
+def segment(binary: np.ndarray) -> List[GlyphBox]:
+    """
+    Розбиває вирізку на символи за зв'язними компонентами
+
+    Частини одного символу (двокрапка, крапка над літерою) об'єднуються за
+    перекриттям по горизонталі. Вирізка - темний текст на білому (crop_value).
+
+    Returns:
+        List[GlyphBox]: Прямокутники символів зліва направо
+    """
+    ink = (binary < 128).astype(np.uint8)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    if count <= 1:
+        return []
+
+    boxes = [
+        [x, y, x + w, y + h]
+        for x, y, w, h, area in stats[1:]
+        if area >= 2
+    ]
+    if not boxes:
+        return []
+
+    line_height = float(np.percentile([box[3] - box[1] for box in boxes], 90))
+    # Шум від сусідніх елементів: дрібні плями та фрагменти, вищі за рядок
+    boxes = [
+        box for box in boxes
+        if (box[3] - box[1]) * (box[2] - box[0]) >= max(2.0, line_height * line_height * 0.004)
+        and box[3] - box[1] <= line_height * 1.6
+    ]
+
+    merged = []
+    for box in sorted(boxes, key=lambda item: item[0]):
+        if merged:
+            last = merged[-1]
+            overlap = min(last[2], box[2]) - max(last[0], box[0])
+            if overlap > 0.5 * min(last[2] - last[0], box[2] - box[0]):
+                merged[-1] = [min(last[0], box[0]), min(last[1], box[1]), max(last[2], box[2]), max(last[3], box[3])]
+                continue
+        merged.append(box)
+    return [tuple(box) for box in merged]
+
+
+def glyph_features(binary: np.ndarray, boxes: List[GlyphBox]) -> np.ndarray:
+    """
+    Вектори ознак символів: нормований квадрат пікселів та геометрія відносно рядка
+
+    Геометрія відрізняє крапку від коми та нуля, які після нормування розміру схожі.
+
+    Returns:
+        np.ndarray: Матриця (кількість символів, ознаки) float32
+    """
+    top = min(box[1] for box in boxes)
+    bottom = max(box[3] for box in boxes)
+    line_height = max(bottom - top, 1)
+
+    features = np.empty((len(boxes), GLYPH_SIDE * GLYPH_SIDE + 3), np.float32)
+    for index, (x1, y1, x2, y2) in enumerate(boxes):
+        patch = 255 - binary[y1:y2, x1:x2]
+        side = max(x2 - x1, y2 - y1)
+        square = np.zeros((side, side), np.uint8)
+        offset_x, offset_y = (side - (x2 - x1)) // 2, (side - (y2 - y1)) // 2
+        square[offset_y:offset_y + y2 - y1, offset_x:offset_x + x2 - x1] = patch
+        pixels = cv2.resize(square, (GLYPH_SIDE, GLYPH_SIDE), interpolation=cv2.INTER_AREA)
+
+        features[index, :-3] = pixels.flatten() / 255.0
+        features[index, -3:] = np.array([
+            (y2 - y1) / line_height,
+            ((y1 + y2) / 2 - top) / line_height,
+            (x2 - x1) / max(y2 - y1, 1),
+        ]) * GEOMETRY_WEIGHT
+    return features
+
+
+def spaces_after(boxes: List[GlyphBox]) -> List[bool]:
+    """Чи стоїть пробіл після кожного символу (за шириною проміжку)"""
+    line_height = max(box[3] for box in boxes) - min(box[1] for box in boxes)
+    return [
+        index + 1 < len(boxes) and boxes[index + 1][0] - boxes[index][2] > line_height * SPACE_GAP
+        for index in range(len(boxes))
+    ]
+
+
+class GlyphRecognizer:
+    """
+    kNN розпізнавач символів вирізок зі значеннями полів
+
+    Модель - зразки символів, вирізані з власних скріншотів (train_glyphs.py).
+    Впевненість символу - наскільки найближчий зразок ближчий за найближчий
+    зразок іншого символу; символ, далекий від усіх зразків, має впевненість 0.
+    """
+
+    def __init__(self, features: np.ndarray, labels: np.ndarray, reject_distance: float):
+        """
+        Args:
+            features: Зразки символів (glyph_features)
+            labels: Символ кожного зразка
+            reject_distance: Відстань до найближчого зразка, далі якої символ невідомий
+        """
+        self.features = features.astype(np.float32)
+        self.labels = labels
+        self.reject_distance = reject_distance
+        self._squared_norms = (self.features ** 2).sum(axis=1)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['GlyphRecognizer']:
+        """Завантажити модель з .npz файлу; None якщо файлу немає або він пошкоджений"""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as model:
+                recognizer = cls(model['features'], model['labels'], float(model['reject_distance']))
+            logger.info(f"Розпізнавач цифр: {len(recognizer.labels)} зразків, символи {''.join(sorted(set(recognizer.labels)))}")
+            return recognizer
+        except Exception as e:
+            logger.warning(f"Не вдалося завантажити модель символів {path}: {e}")
+            return None
+
+    @classmethod
+    def train(cls, features: np.ndarray, labels: List[str], seed: int = 0) -> 'GlyphRecognizer':
+        """
+        Побудувати модель зі зразків, обмеживши кількість зразків одного символу
+
+        Поріг невідомого символу - подвоєний 95-й перцентиль відстані кожного
+        зразка до найближчого сусіда з тим самим символом.
+        """
+        labels = np.array(labels)
+        rng = np.random.default_rng(seed)
+        keep = []
+        for label in np.unique(labels):
+            indices = np.flatnonzero(labels == label)
+            if len(indices) > MAX_SAMPLES_PER_LABEL:
+                indices = rng.choice(indices, MAX_SAMPLES_PER_LABEL, replace=False)
+            keep.extend(indices)
+        keep = np.sort(np.array(keep))
+        features, labels = features[keep].astype(np.float32), labels[keep]
+
+        distances = cls._distances(features, features, (features ** 2).sum(axis=1))
+        np.fill_diagonal(distances, np.inf)
+        distances[labels[:, None] != labels[None, :]] = np.inf
+        nearest = distances.min(axis=1)
+        nearest = nearest[np.isfinite(nearest)]
+        reject_distance = float(np.percentile(nearest, 95) * 2) if len(nearest) else float('inf')
+        return cls(features, labels, reject_distance)
+
+    def save(self, path: str):
+        """Зберегти модель у .npz файл"""
+        np.savez_compressed(path, features=self.features, labels=self.labels, reject_distance=self.reject_distance)
+
+    @staticmethod
+    def _distances(first: np.ndarray, second: np.ndarray, second_norms: np.ndarray) -> np.ndarray:
+        """Евклідові відстані між усіма парами рядків двох матриць"""
+        squared = (first ** 2).sum(axis=1)[:, None] + second_norms[None, :] - 2 * first @ second.T
+        return np.sqrt(np.maximum(squared, 0))
+
+    def classify(self, features: np.ndarray) -> Tuple[List[str], np.ndarray]:
+        """
+        Символи та їх впевненість для матриці ознак
+
+        Returns:
+            Tuple: (символи, впевненість кожного від 0 до 1)
+        """
+        distances = self._distances(features, self.features, self._squared_norms)
+        neighbours = np.argsort(distances, axis=1)[:, :NEIGHBOURS]
+
+        symbols = []
+        confidence = np.zeros(len(features), np.float32)
+        for row, indices in enumerate(neighbours):
+            votes = {}
+            for index in indices:
+                votes[self.labels[index]] = votes.get(self.labels[index], 0.0) + 1.0 / (distances[row, index] + 1e-6)
+            symbol = max(votes, key=votes.get)
+            symbols.append(str(symbol))
+
+            nearest = distances[row, self.labels == symbol].min()
+            other = distances[row, self.labels != symbol]
+            other = other.min() if other.size else np.inf
+            if nearest <= self.reject_distance:
+                confidence[row] = 1.0 - nearest / other if np.isfinite(other) and other > 0 else 1.0
+        return symbols, np.clip(confidence, 0.0, 1.0)
+
+    def read(self, binary: np.ndarray) -> Optional[GlyphRead]:
+        """
+        Прочитати вирізку
+
+        Args:
+            binary: Бінаризована вирізка, темний текст на білому
+
+        Returns:
+            GlyphRead: Текст і впевненість найменш певного символу або None, якщо символів немає
+        """
+        boxes = segment(binary)
+        if not boxes:
+            return None
+
+        symbols, confidence = self.classify(glyph_features(binary, boxes))
+        text = ''.join(
+            symbol + (' ' if space else '')
+            for symbol, space in zip(symbols, spaces_after(boxes))
+        )
+        return GlyphRead(text, float(confidence.min()))
@@ -7,7 +7,6 @@ import os
 import threading
 import time
 from flask import Flask, jsonify
-from bot import main as bot_main
 from config import PORT, IS_HEROKU, BOT_TOKEN
 import logging
 
@@ -30,9 +29,13 @@ def index():
 @app.route('/health')
 def health():
     """Health check endpoint"""
+    # Лёгкий модуль без стека OCR: только состояние прогрева воркеров
+    # (starting/warming/ready/degraded); сам сервис здоров при любом состоянии OCR
+    from ocr_workers import readiness
     return jsonify({
         'status': 'healthy',
         'service': 'telegram-bot',
+        'ocr': readiness(),
         'timestamp': time.time()
     })
 
@@ -44,6 +47,9 @@ def ping():
 def run_bot():
     """Запустить Telegram бота в отдельном потоке"""
     try:
+        # Бот (и его зависимости) импортируется в потоке бота, чтобы веб-сервер
+        # отвечал на healthcheck, не дожидаясь загрузки модулей
+        from bot import main as bot_main
         logger.info("🤖 Запуск Telegram бота...")
         bot_main()
     except Exception as e:
@@ -69,10 +75,7 @@ def main():
     bot_thread = threading.Thread(target=run_bot, daemon=True)
     bot_thread.start()
     
-    # Небольшая задержка
-    time.sleep(2)
-    
-    # Запустить веб-сервер в основном потоке
+    # Запустить веб-сервер в основном потоке сразу - healthcheck не ждёт бота
     run_web()
 
 if __name__ == "__main__":
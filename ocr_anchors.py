@@ -0,0 +1,102 @@
+import re
+import logging
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Поля статистики в порядку кортежу результату
+FIELDS = ('duration', 'viewers', 'gifters', 'diamonds')
+
+# Основи підписів полів на екрані підсумків TikTok LIVE (українською та англійською)
+FIELD_LABELS = {
+    'duration': ('тривал', 'duration'),
+    'viewers': ('глядач', 'viewer', 'views'),
+    'gifters': ('дарувальн', 'gifter'),
+    'diamonds': ('алмаз', 'діамант', 'diamond'),
+}
+
+# Прямокутник на зображенні: (x1, y1, x2, y2)
+Box = Tuple[int, int, int, int]
+
+NUMERIC_PATTERN = re.compile(r'\d')
+
+
+def find_labels(words: List[Dict]) -> Dict[str, Dict]:
+    """
+    Знаходить підписи полів серед розпізнаних слів
+
+    Args:
+        words: Слова з координатами (ocr_engine.image_to_data)
+
+    Returns:
+        Dict: поле -> слово-підпис з найбільшою впевненістю
+    """
+    labels = {}
+
+    for word in words:
+        text = word['text'].lower()
+        for field, stems in FIELD_LABELS.items():
+            if any(stem in text for stem in stems):
+                if field not in labels or word['conf'] > labels[field]['conf']:
+                    labels[field] = word
+
+    logger.info(f"Знайдено підписи полів: {sorted(labels)}")
+    return labels
+
+
+def _clip(box: Tuple[float, float, float, float], shape: Tuple[int, ...]) -> Box:
+    """Обрізати прямокутник межами зображення"""
+    height, width = shape[:2]
+    x1, y1, x2, y2 = box
+    return (max(0, int(x1)), max(0, int(y1)), min(width, int(x2)), min(height, int(y2)))
+
+
+def value_boxes(label: Dict, words: List[Dict], shape: Tuple[int, ...]) -> List[Box]:
+    """
+    Визначає, де шукати значення поля відносно його підпису
+
+    Значення в TikTok LIVE розташоване над підписом (сітка підсумків), праворуч
+    (рядок «Тривалість: 3 год 25 хв») або під ним. Області, де розмітка вже
+    знайшла слова з цифрами, звужуються до цих слів і перевіряються першими.
+
+    Args:
+        label: Слово-підпис
+        words: Всі слова розмітки
+        shape: Розмір зображення
+
+    Returns:
+        List[Box]: Області для OCR у порядку пріоритету
+    """
+    left, top = label['left'], label['top']
+    right, bottom = left + label['width'], top + label['height']
+    h, w = max(label['height'], 1), label['width']
+
+    regions = [
+        (left - w * 0.5, top - h * 3.5, right + w * 0.5, top - h * 0.1),    # над підписом
+        (right + h * 0.2, top - h * 0.5, right + h * 12, bottom + h * 0.5),  # праворуч
+        (left - w * 0.5, bottom + h * 0.1, right + w * 0.5, bottom + h * 3.5),  # під підписом
+    ]
+
+    anchored = []
+    fallback = []
+    for region in regions:
+        x1, y1, x2, y2 = region
+        inside = [
+            word for word in words
+            if word is not label and NUMERIC_PATTERN.search(word['text'])
+            and x1 <= word['left'] + word['width'] / 2 <= x2
+            and y1 <= word['top'] + word['height'] / 2 <= y2
+        ]
+        if inside:
+            pad = h * 0.3
+            tight = (
+                min(word['left'] for word in inside) - pad,
+                min(word['top'] for word in inside) - pad,
+                max(word['left'] + word['width'] for word in inside) + pad,
+                max(word['top'] + word['height'] for word in inside) + pad,
+            )
+            anchored.append(_clip(tight, shape))
+        else:
+            fallback.append(_clip(region, shape))
+
+    return [box for box in anchored + fallback if box[2] - box[0] > 2 and box[3] - box[1] > 2]
@@ -0,0 +1,151 @@
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+Stats = Tuple[int, int, int, int]
+
+
+def perceptual_hash(gray: np.ndarray) -> int:
+    """
+    64-бітний перцептивний хеш (DCT) зображення
+
+    Хеш стійкий до повторного JPEG стиснення та зміни розміру.
+    """
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low_frequencies = cv2.dct(small)[:8, :8].flatten()
+    bits = low_frequencies > np.median(low_frequencies[1:])
+
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def content_digest(gray: np.ndarray) -> str:
+    """
+    Точний хеш вмісту декодованого сірого зображення
+
+    Перцептивний хеш і мініатюри не розрізняють скріншоти, що відрізняються
+    однією цифрою, тому влучання підтверджується лише збігом усіх пікселів.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.array(gray.shape, np.int64).tobytes())
+    digest.update(np.ascontiguousarray(gray).tobytes())
+    return digest.hexdigest()
+
+
+def hamming_distance(first: int, second: int) -> int:
+    """Кількість різних бітів двох хешів"""
+    return bin(first ^ second).count('1')
+
+
+class ScreenshotCache:
+    """
+    LRU кеш результатів розпізнавання скріншотів
+
+    Екрани підсумків TikTok LIVE мають однакову розмітку: перцептивні хеші ефірів
+    з різними значеннями відрізняються на 0-2 біти. Тому перцептивний хеш лише
+    відбирає кандидатів, а влучання підтверджує точний хеш вмісту (content_digest) -
+    скріншот з іншою цифрою завжди промахується.
+    """
+
+    def __init__(self, max_size: int, max_distance: int, persist: bool):
+        """
+        Args:
+            max_size: Максимальна кількість записів у пам'яті
+            max_distance: Максимальна відстань Хеммінга між хешами кандидата
+            persist: Зберігати записи в базі даних
+        """
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self.persist = persist
+        self._entries: OrderedDict = OrderedDict()
+        self._next_key = 0
+        self._loaded_id = 0  # найбільший id запису БД, вже завантаженого в пам'ять
+        self.hits = 0
+        self.misses = 0
+
+        if self.persist:
+            self._load_from_database()
+
+    def _add(self, image_hash: int, digest: str, stats: Stats):
+        """Додати запис у пам'ять з витісненням найстаріших"""
+        self._entries[self._next_key] = (image_hash, digest, stats)
+        self._next_key += 1
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _load_from_database(self):
+        """Підвантажити записи бази даних, додані після попереднього завантаження"""
+        try:
+            from database import db
+            rows = db.get_ocr_cache_entries(self.max_size, self._loaded_id)
+            if not rows:
+                return
+            self._loaded_id = rows[0]['id']
+            known = {entry[1] for entry in self._entries.values()}
+            for row in reversed(rows):
+                if row['digest'] in known:
+                    continue
+                stats = (row['duration_minutes'], row['viewers_count'], row['gifters_count'], row['diamonds_count'])
+                self._add(int(row['phash'], 16), row['digest'], stats)
+        except Exception as e:
+            logger.warning(f"Не вдалося завантажити кеш OCR з бази даних: {e}")
+
+    def _find(self, image_hash: int, digest: str) -> Optional[Stats]:
+        """Знайти запис з близьким перцептивним хешем і тим самим вмістом"""
+        for key, (entry_hash, entry_digest, stats) in self._entries.items():
+            if entry_digest == digest and hamming_distance(image_hash, entry_hash) <= self.max_distance:
+                self._entries.move_to_end(key)
+                return stats
+        return None
+
+    def get(self, gray: np.ndarray) -> Tuple[Optional[Stats], int, np.ndarray]:
+        """
+        Знайти результат для скріншоту
+
+        Args:
+            gray: Сіре зображення скріншоту
+
+        Returns:
+            Tuple: (збережена статистика або None, перцептивний хеш, хеш вмісту) - хеші
+            варто передати в put(), щоб не рахувати їх повторно
+        """
+        image_hash = perceptual_hash(gray)
+        digest = content_digest(gray)
+
+        stats = self._find(image_hash, digest)
+        if stats is None and self.persist:
+            # Інші процеси-воркери могли вже розпізнати цей скріншот - читаються лише нові записи
+            self._load_from_database()
+            stats = self._find(image_hash, digest)
+
+        if stats is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            logger.info(f"Кеш OCR: влучання {image_hash:016x} -> {stats}")
+        return stats, image_hash, digest
+
+    def put(self, image_hash: int, digest: str, stats: Stats):
+        """Зберегти результат розпізнавання"""
+        if self._find(image_hash, digest) == stats:
+            return
+
+        self._add(image_hash, digest, stats)
+        if self.persist:
+            try:
+                from database import db
+                db.save_ocr_cache_entry(f'{image_hash:016x}', digest, *stats, keep=self.max_size)
+            except Exception as e:
+                logger.warning(f"Не вдалося зберегти кеш OCR у базі даних: {e}")
+
+    def info(self) -> Dict:
+        """Стан кешу для діагностики"""
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
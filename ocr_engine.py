@@ -0,0 +1,403 @@
+import logging
+import shlex
+import subprocess
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import pytesseract
+
+from cpu_planner import apply_thread_limits, current_plan
+
+# Ліміти потоків OpenMP та OpenCV мають діяти до завантаження libtesseract
+apply_thread_limits(current_plan())
+
+try:
+    import tesserocr
+except ImportError:  # tesserocr опціональний, без нього працюємо через CLI
+    tesserocr = None
+
+logger = logging.getLogger(__name__)
+
+
+class OCRTimeout(Exception):
+    """Виклик Tesseract не вклався в тайм-аут (процес tesseract завершено примусово)"""
+
+
+def _check_timeout(timeout: Optional[float]):
+    """Не починати виклик, якщо бюджет часу вже вичерпано"""
+    if timeout is not None and timeout <= 0:
+        raise OCRTimeout("Бюджет часу вичерпано до початку виклику")
+
+
+def encode_image(image: np.ndarray) -> bytes:
+    """
+    Кодує зображення у нестиснений PNM буфер для передачі в Tesseract
+
+    PNM не потребує стиснення, тому кодування в пам'яті значно дешевше за PNG.
+
+    Args:
+        image: Зображення OpenCV (сіре або BGR)
+
+    Returns:
+        bytes: Вміст PGM/PPM файлу
+    """
+    extension = '.pgm' if image.ndim == 2 else '.ppm'
+    success, buffer = cv2.imencode(extension, image)
+    if not success:
+        raise ValueError(f"Не вдалося закодувати зображення {image.shape} у {extension}")
+    return buffer.tobytes()
+
+
+def parse_config(config: str) -> Tuple[str, int, Optional[int], Dict[str, str]]:
+    """
+    Розбирає рядок параметрів Tesseract CLI
+
+    Args:
+        config: Параметри командного рядка, напр. '--oem 3 --psm 7 -c key=value'
+
+    Returns:
+        Tuple: (мова, oem, psm або None, словник змінних -c)
+    """
+    lang = 'eng'
+    oem = 3
+    psm = None
+    variables = {}
+
+    args = shlex.split(config)
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        value = args[i + 1] if i + 1 < len(args) else ''
+        if arg == '-l':
+            lang = value
+        elif arg == '--oem':
+            oem = int(value)
+        elif arg == '--psm':
+            psm = int(value)
+        elif arg == '-c' and '=' in value:
+            key, _, var_value = value.partition('=')
+            variables[key] = var_value
+        else:
+            i += 1
+            continue
+        i += 2
+
+    return lang, oem, psm, variables
+
+
+def _run_cli(image: np.ndarray, config: str, *outputs: str, timeout: Optional[float] = None) -> str:
+    """Запустити процес tesseract, передавши зображення через stdin; після тайм-ауту процес вбивається"""
+    _check_timeout(timeout)
+    command = [pytesseract.pytesseract.tesseract_cmd, 'stdin', 'stdout', *shlex.split(config), *outputs]
+    try:
+        result = subprocess.run(command, input=encode_image(image), capture_output=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise OCRTimeout(f"tesseract не завершився за {timeout:.1f} с")
+
+    if result.returncode != 0:
+        message = result.stderr.decode('utf-8', errors='ignore').strip()
+        raise pytesseract.TesseractError(result.returncode, message)
+
+    return result.stdout.decode('utf-8', errors='ignore')
+
+
+def run_tesseract_cli(image: np.ndarray, config: str = '', timeout: Optional[float] = None) -> str:
+    """
+    Розпізнає текст окремим процесом tesseract без тимчасових файлів
+
+    Зображення передається через stdin, результат читається зі stdout.
+
+    Args:
+        image: Зображення OpenCV (сіре або BGR)
+        config: Параметри командного рядка Tesseract
+        timeout: Максимальний час у секундах (None - без обмеження)
+
+    Returns:
+        str: Розпізнаний текст
+
+    Raises:
+        OCRTimeout: Процес не завершився за timeout і був зупинений
+    """
+    return _run_cli(image, config, timeout=timeout)
+
+
+def parse_tsv(tsv: str) -> List[Dict]:
+    """
+    Перетворює TSV вивід Tesseract у список слів
+
+    Returns:
+        List[Dict]: Слова з ключами text, left, top, width, height, conf, line
+    """
+    words = []
+    lines = {}
+
+    for row in tsv.splitlines()[1:]:
+        columns = row.split('\t')
+        if len(columns) < 12 or columns[0] != '5':
+            continue
+        text = columns[11].strip()
+        if not text:
+            continue
+
+        line_key = (columns[2], columns[3], columns[4])
+        words.append({
+            'text': text,
+            'left': int(columns[6]),
+            'top': int(columns[7]),
+            'width': int(columns[8]),
+            'height': int(columns[9]),
+            'conf': float(columns[10]),
+            'line': lines.setdefault(line_key, len(lines)),
+        })
+
+    return words
+
+
+def run_tesseract_cli_data(image: np.ndarray, config: str = '', timeout: Optional[float] = None) -> List[Dict]:
+    """Розпізнає слова з координатами та впевненістю окремим процесом tesseract"""
+    return parse_tsv(_run_cli(image, config, 'tsv', timeout=timeout))
+
+
+class TesseractWorkerPool:
+    """Пул «теплих» екземплярів Tesseract API з уже завантаженими traineddata"""
+
+    def __init__(self, size: int):
+        """
+        Args:
+            size: Максимальна кількість одночасно завантажених екземплярів
+        """
+        self.size = max(1, size)
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._idle: Dict[Tuple[str, int], List] = defaultdict(list)
+        self._loaded = 0
+
+    def _acquire(self, lang: str, oem: int):
+        """Взяти вільний екземпляр для мови/режиму або завантажити новий"""
+        self._slots.acquire()
+        key = (lang, oem)
+        with self._lock:
+            if self._idle[key]:
+                return self._idle[key].pop()
+
+            # Звільняємо місце, якщо пул заповнений екземплярами інших мов
+            if self._loaded >= self.size:
+                for apis in self._idle.values():
+                    if apis:
+                        apis.pop().End()
+                        self._loaded -= 1
+                        break
+            self._loaded += 1
+
+        try:
+            api = tesserocr.PyTessBaseAPI(lang=lang, oem=oem)
+            logger.info(f"Завантажено Tesseract воркер (lang={lang}, oem={oem})")
+            return api
+        except Exception:
+            with self._lock:
+                self._loaded -= 1
+            self._slots.release()
+            raise
+
+    def _release(self, api, lang: str, oem: int):
+        """Повернути екземпляр у пул"""
+        with self._lock:
+            self._idle[(lang, oem)].append(api)
+        self._slots.release()
+
+    @contextmanager
+    def session(self, image: np.ndarray, config: str):
+        """
+        Видає екземпляр API з уже встановленими параметрами та зображенням
+
+        Args:
+            image: Зображення OpenCV (сіре або BGR)
+            config: Параметри у форматі Tesseract CLI
+        """
+        lang, oem, psm, variables = parse_config(config)
+        api = self._acquire(lang, oem)
+        defaults = {}
+        try:
+            for key, value in variables.items():
+                defaults[key] = api.GetVariableAsString(key) or ''
+                api.SetVariable(key, value)
+            api.SetPageSegMode(psm if psm is not None else tesserocr.PSM.AUTO)
+
+            if image.ndim == 3:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            image = np.ascontiguousarray(image)
+            height, width = image.shape[:2]
+            channels = 1 if image.ndim == 2 else image.shape[2]
+            api.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+
+            yield api
+        finally:
+            # Повертаємо змінні до стандартних, щоб наступний виклик мав чистий стан
+            for key, value in defaults.items():
+                api.SetVariable(key, value)
+            api.Clear()
+            self._release(api, lang, oem)
+
+    @staticmethod
+    def _recognize(api, timeout: Optional[float]):
+        """Розпізнати встановлене зображення, перервавши Tesseract після тайм-ауту"""
+        if not api.Recognize(int(timeout * 1000) if timeout is not None else 0):
+            if timeout is not None:
+                raise OCRTimeout(f"Tesseract API не завершився за {timeout:.1f} с")
+            raise RuntimeError("Tesseract API не зміг розпізнати зображення")
+
+    def image_to_string(self, image: np.ndarray, config: str = '', timeout: Optional[float] = None) -> str:
+        """
+        Розпізнає текст одним із завантажених екземплярів
+
+        Args:
+            image: Зображення OpenCV (сіре або BGR)
+            config: Параметри у форматі Tesseract CLI
+            timeout: Максимальний час у секундах (None - без обмеження)
+
+        Returns:
+            str: Розпізнаний текст
+        """
+        with self.session(image, config) as api:
+            self._recognize(api, timeout)
+            return api.GetUTF8Text()
+
+    def image_to_data(self, image: np.ndarray, config: str = '', timeout: Optional[float] = None) -> List[Dict]:
+        """
+        Розпізнає слова з координатами та впевненістю
+
+        Returns:
+            List[Dict]: Слова з ключами text, left, top, width, height, conf, line
+        """
+        words = []
+        with self.session(image, config) as api:
+            self._recognize(api, timeout)
+            iterator = api.GetIterator()
+            level = tesserocr.RIL.WORD
+            line = -1
+            for word in tesserocr.iterate_level(iterator, level):
+                if word.IsAtBeginningOf(tesserocr.RIL.TEXTLINE):
+                    line += 1
+                text = (word.GetUTF8Text(level) or '').strip()
+                box = word.BoundingBox(level)
+                if not text or not box:
+                    continue
+                left, top, right, bottom = box
+                words.append({
+                    'text': text,
+                    'left': left,
+                    'top': top,
+                    'width': right - left,
+                    'height': bottom - top,
+                    'conf': word.Confidence(level),
+                    'line': max(line, 0),
+                })
+        return words
+
+    def close(self):
+        """Вивантажити всі екземпляри"""
+        with self._lock:
+            for apis in self._idle.values():
+                while apis:
+                    apis.pop().End()
+                    self._loaded -= 1
+
+
+# Глобальний пул воркерів (створюється через configure_pool)
+_pool: Optional[TesseractWorkerPool] = None
+
+
+def configure_pool(size: int) -> bool:
+    """
+    Створити пул теплих воркерів Tesseract
+
+    Args:
+        size: Розмір пулу
+
+    Returns:
+        bool: True якщо пул доступний, False якщо використовується CLI
+    """
+    global _pool
+
+    if tesserocr is None:
+        logger.info("tesserocr не встановлено - OCR працює через процес tesseract")
+        return False
+
+    if _pool is not None:
+        _pool.close()
+    _pool = TesseractWorkerPool(size)
+    logger.info(f"Пул Tesseract воркерів: {_pool.size}")
+    return True
+
+
+# Лічильники викликів Tesseract за типом запиту (для бенчмарків та діагностики)
+_call_counts: Dict[str, int] = defaultdict(int)
+_call_counts_lock = threading.Lock()
+
+
+def count_call(kind: str):
+    """Врахувати один виклик Tesseract"""
+    with _call_counts_lock:
+        _call_counts[kind] += 1
+
+
+def call_counts() -> Dict[str, int]:
+    """Кількість викликів Tesseract за типом: string, data"""
+    with _call_counts_lock:
+        return dict(_call_counts)
+
+
+def reset_call_counts():
+    """Обнулити лічильники викликів Tesseract"""
+    with _call_counts_lock:
+        _call_counts.clear()
+
+
+def image_to_string(image: np.ndarray, config: str = '', timeout: Optional[float] = None) -> str:
+    """
+    Розпізнає текст із зображення в пам'яті
+
+    Використовує пул теплих воркерів, якщо він налаштований, інакше процес tesseract.
+
+    Args:
+        image: Зображення OpenCV (сіре або BGR)
+        config: Параметри командного рядка Tesseract
+        timeout: Максимальний час у секундах (None - без обмеження)
+
+    Returns:
+        str: Розпізнаний текст
+
+    Raises:
+        OCRTimeout: Виклик перервано або не розпочато через тайм-аут
+    """
+    _check_timeout(timeout)
+    count_call('string')
+    if _pool is not None:
+        return _pool.image_to_string(image, config, timeout)
+    return run_tesseract_cli(image, config, timeout)
+
+
+def image_to_data(image: np.ndarray, config: str = '', timeout: Optional[float] = None) -> List[Dict]:
+    """
+    Розпізнає слова з координатами та впевненістю (для аналізу розмітки)
+
+    Args:
+        image: Зображення OpenCV (сіре або BGR)
+        config: Параметри командного рядка Tesseract
+        timeout: Максимальний час у секундах (None - без обмеження)
+
+    Returns:
+        List[Dict]: Слова з ключами text, left, top, width, height, conf, line
+
+    Raises:
+        OCRTimeout: Виклик перервано або не розпочато через тайм-аут
+    """
+    _check_timeout(timeout)
+    count_call('data')
+    if _pool is not None:
+        return _pool.image_to_data(image, config, timeout)
+    return run_tesseract_cli_data(image, config, timeout)
@@ -0,0 +1,55 @@
+import re
+import logging
+from typing import Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Літери письма кожної мови Tesseract: мова скріншоту визначається за тим,
+# літер якого письма в тексті найбільше. Мови одного письма розрізняються
+# лише порядком у OCR_LANGUAGES - перемагає перша.
+SCRIPT_LETTERS = {
+    'ukr': re.compile(r'[а-яіїєґ]', re.IGNORECASE),
+    'rus': re.compile(r'[а-яё]', re.IGNORECASE),
+    'eng': re.compile(r'[a-z]', re.IGNORECASE),
+}
+
+# Мінімум літер у тексті проби, щоб довіряти визначеній мові
+PROBE_MIN_LETTERS = 6
+
+# Масштаб зображення для проби: підписам вистачає половини цільової висоти символів
+PROBE_SCALE = 0.5
+
+LANGUAGE_PATTERN = re.compile(r'\s*-l\s+\S+')
+
+
+def with_language(config: str, language: str) -> str:
+    """Параметри Tesseract з моделлю language замість указаної в config (порожня мова - без змін)"""
+    if not language:
+        return config
+    return f"{LANGUAGE_PATTERN.sub('', config).rstrip()} -l {language}"
+
+
+def probe_config(languages: Sequence[str]) -> str:
+    """Параметри проби: розріджений текст (підписи в будь-якому місці екрану) всіма мовами"""
+    return f"--oem 3 --psm 11 -l {'+'.join(languages)}"
+
+
+def detect_language(text: str, languages: Sequence[str]) -> Optional[str]:
+    """
+    Мова з languages, письмом якої написано найбільше літер тексту
+
+    Returns:
+        str: Мова або None, якщо літер знайомого письма менше PROBE_MIN_LETTERS
+    """
+    counts = {
+        language: len(SCRIPT_LETTERS[language].findall(text))
+        for language in languages if language in SCRIPT_LETTERS
+    }
+    if not counts:
+        return None
+
+    language = max(counts, key=counts.get)  # перша з однаковою кількістю
+    if counts[language] < PROBE_MIN_LETTERS:
+        return None
+    logger.debug(f"Літери за мовами: {counts}")
+    return language
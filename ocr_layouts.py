@@ -0,0 +1,280 @@
+import json
+import logging
+import zlib
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from ocr_anchors import FIELDS, Box
+
+logger = logging.getLogger(__name__)
+
+# Розмір мініатюри-відбитка розмітки (ширина, висота)
+FINGERPRINT_SIZE = (16, 32)
+
+# Середня яскравість, нижче якої екран вважається темною темою
+DARK_THEME_BRIGHTNESS = 110
+
+# Невдач поспіль (понад кількість успіхів), після яких шаблон не використовується
+MAX_MISSES = 3
+
+# Запас навколо вивченої області значення: частка ширини та висоти
+REGION_PAD_X = 0.35
+REGION_PAD_Y = 0.15
+
+# Область у частках розміру зображення: (x1, y1, x2, y2) від 0 до 1
+Region = Tuple[float, float, float, float]
+
+
+class LayoutFeatures(NamedTuple):
+    """Дешеві ознаки розмітки скріншоту"""
+    aspect: float
+    theme: str
+    fingerprint: np.ndarray
+
+
+class LayoutTemplate:
+    """
+    Відома розмітка екрану підсумків TikTok LIVE
+
+    Шаблон зберігає області значень кожного поля та спосіб їх розбору
+    ('duration' або 'number'), тому для впізнаного скріншоту достатньо
+    чотирьох вирізок замість каскаду по всьому зображенню.
+    """
+
+    def __init__(self, name: str, aspect: float, theme: str, fingerprint: Optional[np.ndarray],
+                 regions: Dict[str, Region], parsers: Optional[Dict[str, str]] = None,
+                 hits: int = 0, misses: int = 0, source: str = 'learned'):
+        self.name = name
+        self.aspect = aspect
+        self.theme = theme
+        self.fingerprint = fingerprint
+        self.regions = regions
+        self.parsers = {field: 'duration' if field == 'duration' else 'number' for field in FIELDS}
+        self.parsers.update(parsers or {})
+        self.hits = hits
+        self.misses = misses
+        self.source = source
+
+    @property
+    def usable(self) -> bool:
+        """Чи не накопичив шаблон забагато невдач"""
+        return self.misses < MAX_MISSES or self.misses <= self.hits
+
+    def boxes(self, shape: Tuple[int, ...]) -> Dict[str, Box]:
+        """Області значень у пікселях зображення заданого розміру"""
+        height, width = shape[:2]
+        return {
+            field: (int(x1 * width), int(y1 * height), int(x2 * width), int(y2 * height))
+            for field, (x1, y1, x2, y2) in self.regions.items()
+        }
+
+
+def layout_features(gray: np.ndarray) -> LayoutFeatures:
+    """
+    Ознаки розмітки: пропорції екрану, тема та нормована мініатюра яскравості
+
+    Мініатюра нормується за середнім і відхиленням, тому однакова розмітка
+    з різними аватарами та цифрами дає високу кореляцію.
+    """
+    height, width = gray.shape[:2]
+    small = cv2.resize(gray, FINGERPRINT_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+    theme = 'dark' if small.mean() < DARK_THEME_BRIGHTNESS else 'light'
+    fingerprint = (small - small.mean()) / max(float(small.std()), 1.0)
+    return LayoutFeatures(height / max(width, 1), theme, fingerprint.flatten())
+
+
+def correlation(first: np.ndarray, second: np.ndarray) -> float:
+    """Кореляція двох нормованих відбитків від -1 до 1"""
+    return float(np.dot(first, second) / first.size)
+
+
+def region_from_box(box: Box, shape: Tuple[int, ...]) -> Region:
+    """Область у частках зображення з запасом навколо вирізки значення"""
+    height, width = shape[:2]
+    x1, y1, x2, y2 = box
+    pad_x, pad_y = (x2 - x1) * REGION_PAD_X, (y2 - y1) * REGION_PAD_Y
+    return (
+        round(max(0.0, (x1 - pad_x) / width), 4), round(max(0.0, (y1 - pad_y) / height), 4),
+        round(min(1.0, (x2 + pad_x) / width), 4), round(min(1.0, (y2 + pad_y) / height), 4),
+    )
+
+
+def load_templates_file(path: str) -> List[LayoutTemplate]:
+    """
+    Завантажити шаблони з JSON файлу
+
+    Формат: список об'єктів {"name", "aspect", "theme", "regions": {поле: [x1, y1, x2, y2]},
+    "parsers": {поле: "duration"|"number"}}; області - в частках розміру зображення.
+    Шаблон без "fingerprint" впізнається лише за пропорціями та темою.
+    """
+    try:
+        with open(path, encoding='utf-8') as templates_file:
+            items = json.load(templates_file)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Не вдалося завантажити шаблони розмітки з {path}: {e}")
+        return []
+
+    templates = []
+    for item in items:
+        try:
+            fingerprint = item.get('fingerprint')
+            templates.append(LayoutTemplate(
+                item['name'], float(item['aspect']), item.get('theme', 'light'),
+                np.array(fingerprint, np.float32) if fingerprint else None,
+                {field: tuple(map(float, region)) for field, region in item['regions'].items()},
+                item.get('parsers'), source='file',
+            ))
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Некоректний шаблон розмітки {item!r}: {e}")
+    return templates
+
+
+class LayoutRegistry:
+    """
+    Відомі розмітки екрану підсумків: ручні з JSON файлу та вивчені з успішних розпізнавань
+
+    Шаблон впізнається за пропорціями екрану, темою та кореляцією мініатюр.
+    Вивчені шаблони зберігаються в БД, щоб ними користувались усі процеси-воркери.
+    """
+
+    def __init__(self, min_correlation: float, aspect_tolerance: float, max_templates: int,
+                 templates_file: str = '', persist: bool = True):
+        """
+        Args:
+            min_correlation: Мінімальна кореляція мініатюр для впізнавання
+            aspect_tolerance: Допустима відносна різниця пропорцій екрану
+            max_templates: Максимум вивчених шаблонів
+            templates_file: JSON файл з ручними шаблонами
+            persist: Зберігати вивчені шаблони в базі даних
+        """
+        self.min_correlation = min_correlation
+        self.aspect_tolerance = aspect_tolerance
+        self.max_templates = max_templates
+        self.persist = persist
+        self._templates: Dict[str, LayoutTemplate] = {}
+        self._loaded_at = ''  # найпізніший updated_at шаблону, вже завантаженого з БД
+
+        if templates_file:
+            for template in load_templates_file(templates_file):
+                self._templates[template.name] = template
+            logger.info(f"Шаблонів розмітки з файлу: {len(self._templates)}")
+        if self.persist:
+            self._load_from_database()
+
+    def _load_from_database(self):
+        """
+        Підвантажити вивчені шаблони, змінені після попереднього завантаження
+
+        updated_at має точність до секунди, тому шаблони останньої секунди
+        перечитуються - їх одиниці, а не вся таблиця.
+        """
+        try:
+            from database import db
+            rows = db.get_ocr_layouts(self._loaded_at)
+            if rows:
+                self._loaded_at = max(row['updated_at'] for row in rows)
+            for row in rows:
+                regions = {field: tuple(region) for field, region in json.loads(row['regions']).items()}
+                self._templates[row['name']] = LayoutTemplate(
+                    row['name'], row['aspect'], row['theme'], np.frombuffer(row['fingerprint'], np.float32),
+                    regions, json.loads(row['parsers']), row['hits'], row['misses'],
+                )
+        except Exception as e:
+            logger.warning(f"Не вдалося завантажити шаблони розмітки з бази даних: {e}")
+
+    def _find(self, features: LayoutFeatures, usable_only: bool = True) -> Optional[LayoutTemplate]:
+        """Шаблон з найвищою кореляцією серед сумісних за пропорціями та темою"""
+        best, best_score = None, self.min_correlation
+        for template in self._templates.values():
+            if usable_only and not template.usable:
+                continue
+            if template.theme != features.theme:
+                continue
+            if abs(template.aspect - features.aspect) > template.aspect * self.aspect_tolerance:
+                continue
+            if template.fingerprint is None:
+                score = self.min_correlation
+            else:
+                score = correlation(template.fingerprint, features.fingerprint)
+            if score >= best_score:
+                best, best_score = template, score
+        return best
+
+    def match(self, features: LayoutFeatures) -> Optional[LayoutTemplate]:
+        """Знайти шаблон для скріншоту або None для невідомої розмітки"""
+        template = self._find(features)
+        if template is None and self.persist:
+            # Інші процеси-воркери могли вже вивчити цю розмітку - читаються лише змінені шаблони
+            self._load_from_database()
+            template = self._find(features)
+        if template is not None:
+            logger.info(f"Розмітка скріншоту: {template.name}")
+        return template
+
+    def record(self, template: LayoutTemplate, success: bool):
+        """Врахувати результат розпізнавання за шаблоном"""
+        if success:
+            template.hits += 1
+        else:
+            template.misses += 1
+            if not template.usable:
+                logger.warning(f"Шаблон розмітки {template.name} вимкнено: {template.misses} невдач")
+
+        if self.persist and template.source == 'learned':
+            try:
+                from database import db
+                db.update_ocr_layout_stats(template.name, int(success), int(not success))
+            except Exception as e:
+                logger.warning(f"Не вдалося зберегти статистику шаблону розмітки: {e}")
+
+    def learn(self, features: LayoutFeatures, boxes: Dict[str, Box], shape: Tuple[int, ...]) -> Optional[LayoutTemplate]:
+        """
+        Запам'ятати розмітку з областей значень, підтверджених успішним розпізнаванням
+
+        Шаблон, який вже відповідає цим ознакам (зокрема вимкнений), оновлюється:
+        області розширюються, лічильники невдач скидаються.
+
+        Args:
+            features: Ознаки розмітки скріншоту
+            boxes: Області значень усіх полів у пікселях зображення розміру shape
+            shape: Розмір зображення, в якому задані області
+        """
+        regions = {field: region_from_box(box, shape) for field, box in boxes.items()}
+        template = self._find(features, usable_only=False)
+
+        if template is not None and template.source == 'learned':
+            for field, (x1, y1, x2, y2) in regions.items():
+                old = template.regions.get(field, (x1, y1, x2, y2))
+                template.regions[field] = (min(old[0], x1), min(old[1], y1), max(old[2], x2), max(old[3], y2))
+            template.misses = 0
+        else:
+            learned = [item for item in self._templates.values() if item.source == 'learned']
+            if len(learned) >= self.max_templates:
+                return None
+            digest = zlib.crc32(features.fingerprint.astype(np.float32).tobytes()) & 0xffff
+            name = f"{features.theme}-{features.aspect:.2f}-{digest:04x}"
+            template = LayoutTemplate(name, round(features.aspect, 4), features.theme,
+                                      features.fingerprint.astype(np.float32), regions)
+            self._templates[name] = template
+
+        logger.info(f"Вивчено шаблон розмітки {template.name}: {template.regions}")
+        if self.persist:
+            try:
+                from database import db
+                db.save_ocr_layout(template.name, template.aspect, template.theme, template.fingerprint.tobytes(),
+                                   json.dumps(template.regions), json.dumps(template.parsers))
+            except Exception as e:
+                logger.warning(f"Не вдалося зберегти шаблон розмітки в базі даних: {e}")
+        return template
+
+    def info(self) -> Dict:
+        """Стан шаблонів для діагностики"""
+        templates = list(self._templates.values())
+        return {
+            'templates': len(templates),
+            'usable': sum(1 for template in templates if template.usable),
+            'hits': sum(template.hits for template in templates),
+            'misses': sum(template.misses for template in templates),
+        }
@@ -2,16 +2,172 @@ import cv2
 import numpy as np
 import pytesseract
 from PIL import Image, ImageEnhance, ImageFilter
+import io
 import logging
 import os
-from typing import Optional, Tuple, List
-import tempfile
+from typing import Callable, Dict, Optional, Tuple, List, Union
 import re
+import time
+from collections import defaultdict
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 
-from config import TESSERACT_PATH, TESSERACT_CONFIG
+from config import (
+    TESSERACT_PATH, TESSERACT_CONFIG, OCR_MODE, OCR_CACHE_SIZE,
+    OCR_CACHE_MAX_DISTANCE, OCR_CACHE_PERSIST,
+    OCR_TUNING, OCR_TUNING_MIN_ATTEMPTS, OCR_TUNING_REFRESH, OCR_WORD_CONFIDENCE,
+    OCR_TARGET_GLYPH_HEIGHT, OCR_LAYOUTS, OCR_LAYOUTS_FILE, OCR_LAYOUT_LEARN, OCR_LAYOUTS_PERSIST,
+    OCR_LAYOUT_MIN_CORRELATION, OCR_LAYOUT_ASPECT_TOLERANCE, OCR_LAYOUT_MAX_TEMPLATES,
+    OCR_GLYPH_MODEL, OCR_GLYPH_MIN_CONFIDENCE, OCR_TIME_BUDGET, OCR_WARMUP_IMAGE,
+    OCR_LANGUAGES, OCR_GLYPH_HEIGHT_RATIO, OCR_REDUCED_DECODE
+)
+from cpu_planner import current_plan
+from ocr_engine import OCRTimeout, image_to_string, image_to_data, configure_pool
+from ocr_anchors import FIELDS, find_labels, value_boxes
+from ocr_cache import ScreenshotCache
+from ocr_language import PROBE_SCALE, detect_language, probe_config, with_language
+from glyph_recognizer import GlyphRecognizer
+from ocr_layouts import LayoutFeatures, LayoutRegistry, LayoutTemplate, layout_features
+from ocr_scale import decode_reduction, measure_glyph_height, normalization_scale, rescale
+from ocr_timing import Deadline, StageTimings, timing_stats
+from ocr_tuning import CombinationTuner, short_config
+from stats_parser import OCRText, StatsResult, analyze, extract_candidates, words_to_text
 
 logger = logging.getLogger(__name__)
 
+# Варіант зображення для OCR: (назва, масив OpenCV)
+ImageVariant = Tuple[str, np.ndarray]
+
+# Комбінація для одного проходу OCR: (назва варіанту, індекс конфігурації)
+OCRCombination = Tuple[str, int]
+
+# Результат одного проходу OCR: простий текст або текст зі впевненістю слів
+RecognizedText = Union[str, OCRText]
+
+# Скріншот для розпізнавання: шлях до файлу або вміст файлу в пам'яті (завантажений з Telegram)
+ImageSource = Union[str, bytes, bytearray]
+
+# Вирізки полів, що дали значення: поле -> ((x1, y1, x2, y2), значення)
+FieldBoxes = Dict[str, Tuple[Tuple[int, int, int, int], int]]
+
+# Прапорці сірого декодування OpenCV за кратністю зменшення
+GRAY_DECODE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+# Скільки байтів буфера передати PIL для читання розміру з заголовка (JPEG з EXIF)
+HEADER_BYTES = 256 * 1024
+
+
+class ImageVariants:
+    """
+    Ліниво створювані варіанти одного зображення зі спільними проміжними результатами
+    
+    Перед створенням варіантів зображення масштабується так, щоб висота символів
+    була близькою до цільової для Tesseract: знімки з телефонів з високою
+    щільністю пікселів зменшуються, дрібні скріншоти - збільшуються.
+    Усі варіанти будуються з одного сірого зображення: Tesseract однаково
+    переводить кольорове зображення в сіре перед розпізнаванням.
+    """
+    
+    NAMES = ('original', 'contrast', 'binary', 'cleaned', 'inverted', 'otsu')
+    
+    def __init__(self, img: Optional[np.ndarray], target_glyph_height: int = 0, timings: Optional[StageTimings] = None,
+                 deadline: Optional[Deadline] = None, language: str = '', source_gray: Optional[np.ndarray] = None):
+        """
+        Args:
+            img: Оригінальне зображення OpenCV (BGR) або None, якщо задано source_gray
+            target_glyph_height: Цільова висота символів у пікселях (0 - без нормалізації)
+            timings: Час етапів розпізнавання цього зображення
+            deadline: Бюджет часу на розпізнавання цього зображення (None - без обмеження)
+            language: Модель Tesseract для всіх проходів ('' - з параметрів конфігурації)
+            source_gray: Уже декодоване сіре зображення
+        """
+        self.img = img
+        self.target_glyph_height = target_glyph_height
+        self.timings = timings or StageTimings()
+        self.deadline = deadline or Deadline()
+        self.language = language
+        # Відкладене навчання проходу (тюнер, шаблони): застосовується лише для прийнятого результату
+        self.lessons: List[Callable[[], None]] = []
+        self._scale = None
+        self._cache = {} if source_gray is None else {'source_gray': source_gray}
+        self._building = 0
+    
+    def get(self, name: str) -> np.ndarray:
+        """Отримати варіант, створивши його (і його залежності) при першому зверненні"""
+        if name not in self._cache:
+            # Залежності будуються всередині зовнішнього варіанту - час рахується один раз
+            if self._building:
+                self._cache[name] = getattr(self, f'_build_{name}')()
+            else:
+                self._building += 1
+                try:
+                    with self.timings.stage('preprocess'):
+                        self._cache[name] = getattr(self, f'_build_{name}')()
+                finally:
+                    self._building -= 1
+        return self._cache[name]
+    
+    def all(self) -> List[ImageVariant]:
+        """Створити всі варіанти"""
+        return [(name, self.get(name)) for name in self.NAMES]
+    
+    @property
+    def scale(self) -> float:
+        """Масштаб нормалізації (вимірюється при першому зверненні)"""
+        if self._scale is None:
+            self._scale = 1.0
+            if self.target_glyph_height > 0:
+                glyph_height = measure_glyph_height(self.get('source_gray'))
+                self._scale = normalization_scale(glyph_height, self.target_glyph_height)
+                if glyph_height:
+                    logger.info(f"Висота символів {glyph_height:.1f}px, масштаб {self._scale:.2f}")
+        return self._scale
+    
+    # Сіре зображення у вихідному розмірі - для вимірювання символів та кешу
+    def _build_source_gray(self) -> np.ndarray:
+        return cv2.cvtColor(self.img, cv2.COLOR_BGR2GRAY)
+    
+    # 1. Оригінал (після нормалізації розміру) - той самий масив, що й gray
+    def _build_original(self) -> np.ndarray:
+        return self.get('gray')
+    
+    # 2. Збільшення контрасту
+    def _build_contrast(self) -> np.ndarray:
+        enhancer = ImageEnhance.Contrast(Image.fromarray(self.get('gray')))
+        return np.asarray(enhancer.enhance(2.0))
+    
+    # Сіре зображення - спільна основа для бінарних варіантів та вирізок полів
+    def _build_gray(self) -> np.ndarray:
+        return rescale(self.get('source_gray'), self.scale)
+    
+    # 3. Чорно-біле з високим контрастом (CLAHE + Otsu)
+    def _build_binary(self) -> np.ndarray:
+        gray = self.get('gray')
+        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
+        gray_enhanced = clahe.apply(gray)
+        _, binary = cv2.threshold(gray_enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        return binary
+    
+    # 4. Морфологічна обробка для видалення шуму
+    def _build_cleaned(self) -> np.ndarray:
+        kernel = np.ones((2,2), np.uint8)
+        cleaned = cv2.morphologyEx(self.get('binary'), cv2.MORPH_CLOSE, kernel)
+        return cv2.morphologyEx(cleaned, cv2.MORPH_OPEN, kernel)
+    
+    # 5. Інверсія кольорів (білий текст на чорному фоні)
+    def _build_inverted(self) -> np.ndarray:
+        return cv2.bitwise_not(self.get('binary'))
+    
+    # 6. Чорно-біле без вирівнювання контрасту (Otsu) - замість колишнього
+    # збільшення вдвічі: розмір символів уже нормалізовано для всіх варіантів
+    def _build_otsu(self) -> np.ndarray:
+        _, binary = cv2.threshold(self.get('gray'), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        return binary
+
+
 class TikTokOCRProcessor:
     def __init__(self):
         """Ініціалізація OCR процесора для TikTok Live"""
@@ -28,120 +184,493 @@ class TikTokOCRProcessor:
             '--oem 3 --psm 6',
         ]
         
-        logger.info("TikTok OCR процесор ініціалізований")
+        # Мови скріншотів: кожен прохід використовує одну модель, обрану для скріншоту
+        self.languages = OCR_LANGUAGES
+        
+        # Режим розпізнавання: cascade, anchored або full
+        self.mode = OCR_MODE
+        
+        # Порядок комбінацій для каскадного режиму: спочатку дешеві варіанти
+        # без збільшення та блокові режими, що найчастіше дають повний результат
+        preferred = [
+            ('binary', 0), ('original', 4), ('binary', 4), ('inverted', 0),
+            ('cleaned', 0), ('contrast', 4), ('original', 0), ('otsu', 0),
+        ]
+        self.default_cascade_order = preferred + [
+            combination for combination in self.all_combinations() if combination not in preferred
+        ]
+        self.cascade_order = list(self.default_cascade_order)
+        
+        # Статистика успішності комбінацій для автоматичного впорядкування каскаду
+        self.tuner = None
+        if OCR_TUNING:
+            self.tuner = CombinationTuner(OCR_TUNING_MIN_ATTEMPTS, OCR_TUNING_REFRESH)
+            self.reorder_cascade()
+        
+        # Режим прив'язки до підписів: один прохід розмітки та OCR лише вирізок значень
+        self.layout_config = '--oem 3 --psm 11'
+        self.value_configs = {
+            'duration': '--oem 3 --psm 7 -c tessedit_char_whitelist=0123456789:годхвhoursmin ',
+            'number': '--oem 3 --psm 7 -c tessedit_char_whitelist=0123456789KkMmКМ., ',
+        }
+        
+        # Вбудований розпізнавач цифр для вирізок значень (модель з train_glyphs.py)
+        self.glyphs = GlyphRecognizer.load(OCR_GLYPH_MODEL)
+        
+        # Шаблони відомих розміток: впізнаний скріншот розбирається прямими вирізками
+        self.layouts = None
+        if OCR_LAYOUTS:
+            self.layouts = LayoutRegistry(
+                OCR_LAYOUT_MIN_CORRELATION, OCR_LAYOUT_ASPECT_TOLERANCE, OCR_LAYOUT_MAX_TEMPLATES,
+                OCR_LAYOUTS_FILE, OCR_LAYOUTS_PERSIST,
+            )
+        
+        # Кеш результатів для повторно надісланих скріншотів
+        self.cache = None
+        if OCR_CACHE_SIZE > 0:
+            self.cache = ScreenshotCache(OCR_CACHE_SIZE, OCR_CACHE_MAX_DISTANCE, OCR_CACHE_PERSIST)
+        
+        # Теплі воркери Tesseract та потоки, що розподіляють між ними роботу
+        self.pool_size = current_plan().threads_per_worker
+        configure_pool(self.pool_size)
+        self.executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='ocr')
+        
+        logger.info(f"TikTok OCR процесор ініціалізований (режим: {self.mode})")
+    
+    def all_combinations(self) -> List[OCRCombination]:
+        """Всі комбінації (варіант, конфігурація) у канонічному порядку повного режиму"""
+        return [(name, index) for name in ImageVariants.NAMES for index in range(len(self.ocr_configs))]
+    
+    def load_image(self, image: ImageSource, flags: int = cv2.IMREAD_COLOR) -> Optional[np.ndarray]:
+        """Декодувати зображення з файлу або з буфера в пам'яті (без запису на диск і копіювання буфера)"""
+        if isinstance(image, str):
+            img = cv2.imread(image, flags)
+        else:
+            img = cv2.imdecode(np.frombuffer(image, np.uint8), flags)
+        if img is None:
+            logger.error(f"Не вдалося завантажити зображення: {self.describe_source(image)}")
+        return img
+    
+    def image_height(self, image: ImageSource) -> int:
+        """Висота зображення з заголовка файлу без декодування пікселів (0 - не вдалося прочитати)"""
+        try:
+            with Image.open(image if isinstance(image, str) else io.BytesIO(bytes(memoryview(image)[:HEADER_BYTES]))) as header:
+                return header.height
+        except Exception as e:
+            logger.debug(f"Не вдалося прочитати розмір зображення: {e}")
+            return 0
+    
+    def decode_variants(self, image: ImageSource, timings: Optional[StageTimings] = None,
+                        deadline: Optional[Deadline] = None) -> Optional[ImageVariants]:
+        """
+        Декодувати скріншот у варіанти зображення
+        
+        Декодується лише сіре зображення, один раз - з нього будуються кеш, шаблони
+        та всі варіанти. Великий файл, на якому символи за OCR_GLYPH_HEIGHT_RATIO
+        щонайменше вдвічі вищі за цільові з запасом (decode_reduction), зменшується
+        декодером у 2, 4 або 8 разів (JPEG - без розпакування повного розміру).
+        
+        Returns:
+            ImageVariants: Варіанти зображення або None, якщо декодувати не вдалося
+        """
+        reduction = 1
+        if OCR_REDUCED_DECODE:
+            reduction = decode_reduction(self.image_height(image), OCR_GLYPH_HEIGHT_RATIO, OCR_TARGET_GLYPH_HEIGHT)
+        
+        gray = self.load_image(image, GRAY_DECODE_FLAGS[reduction])
+        if gray is None:
+            return None
+        if reduction > 1:
+            logger.info(f"Декодування зі зменшенням у {reduction} рази: {gray.shape[1]}x{gray.shape[0]}")
+        
+        return ImageVariants(None, OCR_TARGET_GLYPH_HEIGHT, timings, deadline, source_gray=gray)
+    
+    def describe_source(self, image: ImageSource) -> str:
+        """Опис скріншоту для логів: шлях або розмір буфера"""
+        return image if isinstance(image, str) else f"<{len(image)} байт у пам'яті>"
     
-    def preprocess_image(self, image_path: str) -> List[str]:
+    def preprocess_image(self, image_path: str) -> List[ImageVariant]:
         """
         Обробляє зображення різними способами для кращого OCR
         
+        Всі варіанти залишаються в пам'яті як масиви NumPy, без запису на диск.
+        
         Args:
             image_path: Шлях до зображення
             
         Returns:
-            List[str]: Список шляхів до оброблених зображень
+            List[ImageVariant]: Список пар (назва варіанту, зображення)
         """
-        processed_images = []
-        
         try:
-            # Завантажуємо оригінальне зображення
-            img = cv2.imread(image_path)
-            if img is None:
-                logger.error(f"Не вдалося завантажити зображення: {image_path}")
+            variants = self.decode_variants(image_path)
+            if variants is None:
                 return []
             
-            # Конвертуємо в RGB для PIL
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(img_rgb)
-            
-            # 1. Оригінал
-            orig_path = tempfile.mktemp(suffix='_orig.png')
-            pil_image.save(orig_path)
-            processed_images.append(orig_path)
-            
-            # 2. Збільшення контрасту
-            enhancer = ImageEnhance.Contrast(pil_image)
-            high_contrast = enhancer.enhance(2.0)
-            contrast_path = tempfile.mktemp(suffix='_contrast.png')
-            high_contrast.save(contrast_path)
-            processed_images.append(contrast_path)
-            
-            # 3. Чорно-біле з високим контрастом
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
-            # Підвищуємо контраст
-            clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-            gray_enhanced = clahe.apply(gray)
-            
-            # Бінаризація
-            _, binary = cv2.threshold(gray_enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            processed_images = variants.all()
+            logger.info(f"Створено {len(processed_images)} варіантів зображення для OCR")
+            return processed_images
             
-            binary_path = tempfile.mktemp(suffix='_binary.png')
-            cv2.imwrite(binary_path, binary)
-            processed_images.append(binary_path)
+        except Exception as e:
+            logger.error(f"Помилка обробки зображення: {e}")
+            return []
+    
+    def extract_text_variants(self, images: List[ImageVariant], timings: Optional[StageTimings] = None,
+                              deadline: Optional[Deadline] = None, language: str = '') -> List[RecognizedText]:
+        """
+        Витягує текст з різних варіантів зображення
+        
+        Args:
+            images: Список пар (назва варіанту, зображення) з preprocess_image
+            timings: Куди записати час кожного виклику Tesseract
+            deadline: Бюджет часу - проходи після його вичерпання пропускаються
+            language: Модель Tesseract для всіх проходів ('' - з параметрів конфігурації)
             
-            # 4. Морфологічна обробка для видалення шуму
-            kernel = np.ones((2,2), np.uint8)
-            cleaned = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
-            cleaned = cv2.morphologyEx(cleaned, cv2.MORPH_OPEN, kernel)
+        Returns:
+            List[RecognizedText]: Список розпізнаних текстів
+        """
+        tasks = [
+            (name, image, with_language(config, language), deadline)
+            for name, image in images for config in self.ocr_configs
+        ]
+        
+        # Порядок результатів зберігається - від нього залежить find_tiktok_statistics
+        all_texts = []
+        for (name, _, config, _), (text, seconds) in zip(tasks, self.executor.map(lambda task: self.timed_recognize(*task), tasks)):
+            if timings is not None:
+                timings.add_call(name, config, seconds)
+            if text:
+                all_texts.append(text)
+        
+        return all_texts
+    
+    def recognize(self, name: str, image: np.ndarray, config: str, deadline: Optional[Deadline] = None) -> str:
+        """Один прохід Tesseract для варіанту зображення; порожній рядок при помилці або вичерпаному бюджеті"""
+        try:
+            text = image_to_string(image, config=config, timeout=deadline.remaining() if deadline else None)
+            if text and text.strip():
+                logger.debug(f"OCR результат ({name}, {config[:20]}...): {text[:50]}...")
+                return text.strip()
+        except OCRTimeout as e:
+            logger.debug(f"OCR перервано ({name}): {e}")
+        except Exception as e:
+            logger.debug(f"OCR помилка ({name}) з конфігом {config[:20]}...: {e}")
+        return ''
+    
+    def recognize_words(self, name: str, image: np.ndarray, config: str, deadline: Optional[Deadline] = None) -> Optional[OCRText]:
+        """Один прохід Tesseract зі словами та їх впевненістю; None якщо слів немає, сталася помилка або вичерпано бюджет"""
+        try:
+            words = image_to_data(image, config=config, timeout=deadline.remaining() if deadline else None)
+            if words:
+                text = words_to_text(words)
+                logger.debug(f"OCR слова ({name}, {config[:20]}...): {text.text[:50]}...")
+                return text
+        except OCRTimeout as e:
+            logger.debug(f"OCR перервано ({name}): {e}")
+        except Exception as e:
+            logger.debug(f"OCR помилка ({name}) з конфігом {config[:20]}...: {e}")
+        return None
+    
+    def recognize_variant(self, name: str, image: np.ndarray, config: str,
+                          deadline: Optional[Deadline] = None) -> Optional[RecognizedText]:
+        """Прохід OCR згідно з OCR_WORD_CONFIDENCE: слова зі впевненістю або простий текст"""
+        if OCR_WORD_CONFIDENCE:
+            return self.recognize_words(name, image, config, deadline)
+        return self.recognize(name, image, config, deadline)
+    
+    def timed_recognize(self, name: str, image: np.ndarray, config: str,
+                        deadline: Optional[Deadline] = None) -> Tuple[Optional[RecognizedText], float]:
+        """Прохід OCR з вимірюванням часу"""
+        started = time.perf_counter()
+        text = self.recognize_variant(name, image, config, deadline)
+        return text, time.perf_counter() - started
+    
+    def reorder_cascade(self):
+        """Перевпорядкувати каскад за рейтингом комбінацій з БД"""
+        by_config = {config: index for index, config in enumerate(self.ocr_configs)}
+        learned = self.tuner.order([
+            (name, self.ocr_configs[index]) for name, index in self.default_cascade_order
+        ])
+        self.cascade_order = [(name, by_config[config]) for name, config in learned]
+    
+    def learn_from_result(self, texts: Dict[OCRCombination, RecognizedText], durations: Dict[OCRCombination, float],
+                          stats: Optional[Tuple[int, int, int, int]]):
+        """
+        Записати час кожної комбінації та зарахувати їй поля прийнятого результату
+        
+        Поле зараховується комбінації, якщо її текст дав кандидата з прийнятим значенням.
+        """
+        for (name, index), seconds in durations.items():
+            self.tuner.record((name, self.ocr_configs[index]), seconds)
+        
+        if stats and any(stats) and self.validate_stats(*stats):
+            combinations = list(texts)
+            credited = defaultdict(set)
+            for candidate in extract_candidates(texts[combination] for combination in combinations):
+                if candidate.value == stats[FIELDS.index(candidate.field)]:
+                    credited[combinations[candidate.source]].add(candidate.field)
+            for (name, index), fields in credited.items():
+                self.tuner.credit((name, self.ocr_configs[index]), len(fields))
+        
+        if self.tuner.flush():
+            self.reorder_cascade()
+    
+    def probe_language(self, variants: ImageVariants) -> str:
+        """
+        Визначити мову скріншоту одним дешевим проходом
+        
+        Зменшений бінарний варіант читається розрідженим режимом усіма мовами
+        OCR_LANGUAGES, мова визначається за письмом більшості літер (підписи полів).
+        Решта проходів скріншоту працює з однією моделлю - швидше і точніше.
+        
+        Returns:
+            str: Одна мова або всі через '+', якщо проба не знайшла літер
+        """
+        if len(self.languages) <= 1:
+            return ''.join(self.languages)
+        
+        combined = '+'.join(self.languages)
+        config = probe_config(self.languages)
+        image = rescale(variants.get('binary'), PROBE_SCALE)
+        text = ''
+        started = time.perf_counter()
+        with variants.timings.stage('language'):
+            try:
+                text = image_to_string(image, config, timeout=variants.deadline.remaining())
+            except Exception as e:
+                logger.debug(f"Проба мови не вдалася: {e}")
+        variants.timings.add_call('language', config, time.perf_counter() - started)
+        
+        language = detect_language(text, self.languages)
+        logger.info(f"Мова скріншоту: {language or combined}")
+        return language or combined
+    
+    def is_complete(self, stats: Tuple[int, int, int, int]) -> bool:
+        """Чи знайдені всі чотири поля і чи проходять вони валідацію"""
+        return all(value > 0 for value in stats) and self.validate_stats(*stats)
+    
+    def run_cascade(self, variants: ImageVariants) -> Optional[StatsResult]:
+        """
+        Каскадне розпізнавання з раннім виходом
+        
+        Комбінації (варіант, конфігурація) запускаються в порядку self.cascade_order
+        (з OCR_TUNING він вивчається з історії успіхів) порціями за розміром пулу; після кожної порції текст аналізується, і як тільки
+        всі чотири поля знайдені та валідні - робота припиняється. Варіанти зображення
+        створюються тільки коли до них дійде черга. Коли бюджет часу вичерпано,
+        повертається найкращий результат з уже розпізнаних текстів.
+        
+        Args:
+            variants: Варіанти зображення
             
-            cleaned_path = tempfile.mktemp(suffix='_cleaned.png')
-            cv2.imwrite(cleaned_path, cleaned)
-            processed_images.append(cleaned_path)
+        Returns:
+            StatsResult: Статистика та впевненість у полях або None якщо текст не розпізнано
+        """
+        texts = {}
+        durations = {}
+        result = None
+        batch_size = self.pool_size
+        cascade_order = self.cascade_order
+        timings = variants.timings
+        deadline = variants.deadline
+        
+        for start in range(0, len(cascade_order), batch_size):
+            if deadline.expired:
+                logger.warning(f"Бюджет часу вичерпано після {start} проходів OCR каскаду")
+                break
             
-            # 5. Інверсія кольорів (білий текст на чорному фоні)
-            inverted = cv2.bitwise_not(binary)
-            inverted_path = tempfile.mktemp(suffix='_inverted.png')
-            cv2.imwrite(inverted_path, inverted)
-            processed_images.append(inverted_path)
+            batch = cascade_order[start:start + batch_size]
+            tasks = [
+                (name, variants.get(name), with_language(self.ocr_configs[index], variants.language), deadline)
+                for name, index in batch
+            ]
             
-            # 6. Збільшення розміру зображення
-            height, width = img.shape[:2]
-            enlarged = cv2.resize(img, (width * 2, height * 2), interpolation=cv2.INTER_CUBIC)
-            enlarged_gray = cv2.cvtColor(enlarged, cv2.COLOR_BGR2GRAY)
-            _, enlarged_binary = cv2.threshold(enlarged_gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            with timings.stage('ocr'):
+                recognized = list(self.executor.map(lambda task: self.timed_recognize(*task), tasks))
+            for (name, index), (text, seconds) in zip(batch, recognized):
+                durations[(name, index)] = seconds
+                timings.add_call(name, self.ocr_configs[index], seconds)
+                if text:
+                    texts[(name, index)] = text
             
-            enlarged_path = tempfile.mktemp(suffix='_enlarged.png')
-            cv2.imwrite(enlarged_path, enlarged_binary)
-            processed_images.append(enlarged_path)
+            if not texts:
+                continue
             
-            logger.info(f"Створено {len(processed_images)} варіантів зображення для OCR")
-            return processed_images
+            with timings.stage('parse'):
+                result = self.analyze_texts(list(texts.values()))
+            if self.is_complete(result.stats):
+                logger.info(f"Каскад завершено після {start + len(batch)} проходів OCR")
+                break
+        else:
+            # Нічого повного не знайшли - аналізуємо всі тексти в порядку повного режиму
+            ordered = [texts[combination] for combination in self.all_combinations() if combination in texts]
+            with timings.stage('parse'):
+                result = self.analyze_texts(ordered) if ordered else None
+        
+        if self.tuner is not None:
+            variants.lessons.append(partial(self.learn_from_result, texts, durations, result.stats if result else None))
+        
+        return result
+    
+    def crop_value(self, gray: np.ndarray, box: Tuple[int, int, int, int]) -> np.ndarray:
+        """Вирізати область значення: бінаризація, темний текст на білому, поля навколо"""
+        x1, y1, x2, y2 = box
+        crop = gray[y1:y2, x1:x2]
+        _, crop = cv2.threshold(crop, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        if crop.mean() < 127:
+            crop = cv2.bitwise_not(crop)
+        return cv2.copyMakeBorder(crop, 10, 10, 10, 10, cv2.BORDER_CONSTANT, value=255)
+    
+    def parse_field_value(self, field: str, text: str) -> int:
+        """Розпізнати значення поля з тексту вирізки"""
+        if field == 'duration':
+            return self.parse_duration(text)
+        
+        # Беремо перше число, щоб сусіднє значення не злилося з ним
+        match = re.search(r'\d+(?:[.,]\d+)?\s*[KkMmКкМм]?', text)
+        return self.parse_number_value(match.group(0)) if match else 0
+    
+    def run_anchored(self, variants: ImageVariants, boxes: Optional[FieldBoxes] = None) -> StatsResult:
+        """
+        Витягує поля через підписи: один прохід розмітки знаходить «Тривалість»,
+        «Глядачі», «Алмази» тощо, після чого OCR виконується лише для невеликих
+        вирізок зі значеннями з цифровою конфігурацією.
+        
+        Args:
+            variants: Варіанти зображення
+            boxes: Куди записати вирізку (у координатах варіанту 'gray') та значення кожного знайденого поля
             
+        Returns:
+            StatsResult: Статистика (0 для незнайдених полів) та впевненість у полях
+        """
+        stats = dict.fromkeys(FIELDS, 0)
+        confidence = dict.fromkeys(FIELDS, 0.0)
+        timings = variants.timings
+        
+        binary = variants.get('binary')
+        layout_config = with_language(self.layout_config, variants.language)
+        try:
+            started = time.perf_counter()
+            with timings.stage('ocr'):
+                words = image_to_data(binary, layout_config, timeout=variants.deadline.remaining())
+            timings.add_call('layout', layout_config, time.perf_counter() - started)
         except Exception as e:
-            logger.error(f"Помилка обробки зображення: {e}")
-            # Очищуємо створені файли при помилці
-            for img_path in processed_images:
-                try:
-                    if os.path.exists(img_path):
-                        os.unlink(img_path)
-                except:
-                    pass
-            return []
+            logger.warning(f"Не вдалося отримати розмітку: {e}")
+            return StatsResult(tuple(stats.values()), confidence)
+        
+        gray = variants.get('gray')
+        for field, label in find_labels(words).items():
+            parser = 'duration' if field == 'duration' else 'number'
+            for box in value_boxes(label, words, gray.shape):
+                with timings.stage('ocr'):
+                    value, text, field_confidence = self.read_crop(
+                        f'{field}_value', self.crop_value(gray, box), parser, timings, variants.deadline,
+                        variants.language,
+                    )
+                if value > 0:
+                    stats[field] = value
+                    confidence[field] = round(field_confidence, 3)
+                    if boxes is not None:
+                        boxes[field] = (box, value)
+                    logger.info(f"Поле {field} з вирізки {box}: {text!r} -> {value}")
+                    break
+        
+        return StatsResult(tuple(stats.values()), confidence)
     
-    def extract_text_variants(self, image_paths: List[str]) -> List[str]:
+    def read_crop(self, name: str, crop: np.ndarray, parser: str, timings: StageTimings,
+                  deadline: Optional[Deadline] = None, language: str = '') -> Tuple[int, str, float]:
         """
-        Витягує текст з різних варіантів зображення
+        Прочитати вирізку значення поля
+        
+        Спершу вбудований розпізнавач цифр (мілісекунди); Tesseract - якщо моделі
+        немає, розпізнавач не впевнений або його текст не розбирається.
         
         Args:
-            image_paths: Список шляхів до оброблених зображень
+            name: Назва вирізки для статистики часу
+            crop: Вирізка з crop_value
+            parser: Спосіб розбору: 'duration' або 'number'
+            timings: Куди записати час читання
+            deadline: Бюджет часу для проходу Tesseract
+            language: Модель Tesseract ('' - з параметрів конфігурації)
             
         Returns:
-            List[str]: Список розпізнаних текстів
+            Tuple: (значення або 0, текст, впевненість від 0 до 1)
         """
-        all_texts = []
+        if self.glyphs is not None:
+            started = time.perf_counter()
+            read = self.glyphs.read(crop)
+            timings.add_call(name, 'glyphs', time.perf_counter() - started)
+            if read is not None and read.confidence >= OCR_GLYPH_MIN_CONFIDENCE:
+                value = self.parse_field_value(parser, read.text)
+                if value > 0:
+                    return value, read.text, read.confidence
         
-        for img_path in image_paths:
-            for config in self.ocr_configs:
-                try:
-                    text = pytesseract.image_to_string(img_path, config=config)
-                    if text and text.strip():
-                        all_texts.append(text.strip())
-                        logger.debug(f"OCR результат ({config[:20]}...): {text[:50]}...")
-                except Exception as e:
-                    logger.debug(f"OCR помилка з конфігом {config[:20]}...: {e}")
-                    continue
+        config = with_language(self.value_configs[parser], language)
+        recognized, seconds = self.timed_recognize(name, crop, config, deadline)
+        timings.add_call(name, config, seconds)
+        text, confidence = self.crop_text(recognized)
+        return self.parse_field_value(parser, text), text, confidence
+    
+    def crop_text(self, recognized: Optional[RecognizedText]) -> Tuple[str, float]:
+        """Текст вирізки та середня впевненість його слів від 0 до 1"""
+        if isinstance(recognized, OCRText):
+            return recognized.text, sum(word[2] for word in recognized.words) / len(recognized.words) / 100
+        return recognized or '', 1.0
+    
+    def run_layout(self, variants: ImageVariants, template: LayoutTemplate) -> StatsResult:
+        """
+        Розбір скріншоту відомої розмітки: по одній вирізці на поле з областей шаблону
         
-        return all_texts
+        Вирізки розпізнаються паралельно цифровими конфігураціями та розбираються
+        способом, заданим у шаблоні для кожного поля.
+        
+        Args:
+            variants: Варіанти зображення
+            template: Впізнаний шаблон розмітки
+            
+        Returns:
+            StatsResult: Статистика (0 для незнайдених полів) та впевненість у полях
+        """
+        stats = dict.fromkeys(FIELDS, 0)
+        confidence = dict.fromkeys(FIELDS, 0.0)
+        gray = variants.get('gray')
+        
+        tasks = [
+            (field, self.crop_value(gray, box), template.parsers[field])
+            for field, box in template.boxes(gray.shape).items()
+            if field in stats and box[2] - box[0] > 2 and box[3] - box[1] > 2
+        ]
+        with variants.timings.stage('ocr'):
+            recognized = list(self.executor.map(
+                lambda task: self.read_crop(
+                    f'{task[0]}_layout', task[1], task[2], variants.timings, variants.deadline, variants.language
+                ), tasks
+            ))
+        
+        for (field, _, _), (value, _, field_confidence) in zip(tasks, recognized):
+            if value > 0:
+                stats[field] = value
+                confidence[field] = round(field_confidence, 3)
+        
+        logger.info(f"Шаблон {template.name}: {stats}")
+        return StatsResult(tuple(stats.values()), confidence)
+    
+    def learn_layout(self, variants: ImageVariants, features: LayoutFeatures, result: StatsResult,
+                     boxes: FieldBoxes):
+        """
+        Вивчити розмітку скріншоту з підтвердженим результатом
+        
+        Області значень беруться з прив'язки до підписів; в шаблон потрапляють лише
+        якщо вирізки всіх чотирьох полів дали ті самі значення, що й прийнятий результат.
+        Поза режимом anchored це один додатковий прохід розмітки - лише для невідомих розміток.
+        """
+        if not boxes and self.mode != 'anchored':
+            self.run_anchored(variants, boxes)
+        
+        confirmed = {
+            field: box for field, (box, value) in boxes.items()
+            if value == result.stats[FIELDS.index(field)]
+        }
+        if len(confirmed) == len(FIELDS):
+            self.layouts.learn(features, confirmed, variants.get('gray').shape)
     
     def parse_duration(self, text: str) -> int:
         """Розпізнає тривалість ефіру"""
@@ -236,332 +765,229 @@ class TikTokOCRProcessor:
         logger.info(f"Не вдалося розпізнати число з '{original_text}'")
         return 0
     
-    def find_tiktok_statistics(self, texts: List[str]) -> Tuple[int, int, int, int]:
+    def find_tiktok_statistics(self, texts: List[RecognizedText]) -> Tuple[int, int, int, int]:
         """
         Знаходить статистику TikTok з усіх розпізнаних текстів
         
+        Кожен текст один раз розбирається граматикою stats_parser на кандидати
+        (поле, значення, джерело), переможці обираються за вагою правила та
+        кількістю текстів, що їх підтверджують.
+        
         Returns:
             Tuple: (duration_minutes, viewers_count, gifters_count, diamonds_count)
         """
-        duration = 0
-        viewers = 0
-        gifters = 0
-        diamonds = 0
-        
-        # Об'єднуємо всі тексти для аналізу
-        combined_text = ' '.join(texts).lower()
-        logger.info(f"Комбінований текст для аналізу: {combined_text[:200]}...")
-        
-        # Спочатку шукаємо тривалість - шукаємо специфічні патерни
-        for text in texts:
-            # Шукаємо українську тривалість "3 год 25 хв"
-            ukr_duration_match = re.search(r'(\d+)\s*год\s*(\d+)\s*хв', text, re.IGNORECASE)
-            if ukr_duration_match:
-                h = int(ukr_duration_match.group(1))
-                m = int(ukr_duration_match.group(2))
-                if h <= 24 and m <= 59:  # Розумні межі
-                    duration = h * 60 + m
-                    logger.info(f"Знайдено українську тривалість: {h}год {m}хв = {duration}хв")
-                    break
-            
-            # НОВІ ПАТЕРНИ ДЛЯ ОБРОБКИ ПОМИЛОК OCR:
-            
-            # OCR помилка: "27 хв хв" замість "3 год 25 хв" - спроба реконструкції
-            double_min_match = re.search(r'(\d+)\s*хв\s*хв', text, re.IGNORECASE)
-            if double_min_match:
-                # Якщо число в діапазоні що може бути неправильно прочитаним годинами+хвилинами
-                total_minutes = int(double_min_match.group(1))
-                if 20 <= total_minutes <= 500:  # Від 20 хвилин до ~8 годин (знижена межа для 27)
-                    # Спробуємо реконструювати: 27 може бути з "3год25хв" -> 3*10+25 = 35, але OCR читає як 27
-                    # Або це може бути справжні хвилини
-                    
-                    # Перевіряємо чи це може бути помилка часу
-                    # Якщо знайдемо в тексті індикатори що це час трансляції
-                    if any(keyword in text.lower() for keyword in ['тривалість', 'трансляц', 'ефір', 'live']):
-                        # Спробуємо різні інтерпретації
-                        if total_minutes >= 180:  # Більше 3 годин - ймовірно правильно
-                            duration = total_minutes
-                            logger.info(f"Знайдено тривалість з подвійним 'хв': {total_minutes}хв")
-                            break
-                        elif total_minutes >= 20:  # Може бути помилка читання (знижена межа)
-                            # Спробуємо розумне декодування на основі типових помилок
-                            # 27 може бути помилковим читанням "3 год 25 хв"
-                            
-                            # Перевіряємо чи число схоже на зжате "3год25хв" -> 27
-                            if total_minutes == 27:
-                                # Високоймовірна помилка: "3 год 25 хв" -> "27 хв хв"
-                                corrected_duration = 3 * 60 + 25  # 205 хвилин
-                                duration = corrected_duration
-                                logger.info(f"OCR виправлення: {total_minutes} хв хв -> 3год 25хв = {corrected_duration}хв (типова помилка)")
-                                break
-                            elif 20 <= total_minutes <= 35:
-                                # Інші схожі помилки в цьому діапазоні
-                                # Спробуємо реконструювати як години+хвилини
-                                potential_hours = total_minutes // 10
-                                potential_minutes = total_minutes % 10
-                                if 1 <= potential_hours <= 5 and 0 <= potential_minutes <= 9:
-                                    corrected_duration = potential_hours * 60 + (potential_minutes * 10 + 5)  # Додаємо 5 хв як припущення
-                                    duration = corrected_duration
-                                    logger.info(f"OCR реконструкція: {total_minutes} -> {potential_hours}год {potential_minutes * 10 + 5}хв = {corrected_duration}хв")
-                                    break
-                            
-                            # Якщо не вдалося реконструювати, залишаємо як є
-                            duration = total_minutes
-                            logger.info(f"Знайдено тривалість (можлива помилка OCR): {total_minutes}хв")
-                            break
-                    else:
-                        # Навіть без контекстних слів, перевіряємо спеціальний випадок 27
-                        if total_minutes == 27:
-                            corrected_duration = 3 * 60 + 25  # 205 хвилин  
-                            duration = corrected_duration
-                            logger.info(f"OCR виправлення (без контексту): {total_minutes} хв хв -> 3год 25хв = {corrected_duration}хв")
-                            break
-            
-            # OCR помилка: просто число без одиниць, але в контексті тривалості
-            standalone_duration_match = re.search(r'тривалість[:\s]*(\d+)', text, re.IGNORECASE)
-            if standalone_duration_match:
-                minutes = int(standalone_duration_match.group(1))
-                if 5 <= minutes <= 500:  # Розумні межі для хвилин
-                    duration = minutes
-                    logger.info(f"Знайдено тривалість з контексту: {minutes}хв")
-                    break
-            
-            # OCR помилка: "3год25" без "хв" або з іншими проблемами
-            compact_ukr_match = re.search(r'(\d+)год(\d+)', text, re.IGNORECASE)
-            if compact_ukr_match:
-                h = int(compact_ukr_match.group(1))
-                m = int(compact_ukr_match.group(2))
-                if h <= 24 and m <= 59:
-                    duration = h * 60 + m
-                    logger.info(f"Знайдено компактну українську тривалість: {h}год{m} = {duration}хв")
-                    break
-            
-            # Шукаємо "3 hours 40 min" або подібні варіанти
-            duration_match = re.search(r'(\d+)\s*hours?\s*(\d+)\s*min', text, re.IGNORECASE)
-            if duration_match:
-                h = int(duration_match.group(1))
-                m = int(duration_match.group(2))
-                if h <= 24 and m <= 59:  # Розумні межі
-                    duration = h * 60 + m
-                    logger.info(f"Знайдено тривалість: {h}г {m}хв = {duration}хв")
-                    break
-            
-            # Шукаємо "3:40" формат
-            time_match = re.search(r'(\d{1,2}):(\d{2})', text)
-            if time_match:
-                h = int(time_match.group(1))
-                m = int(time_match.group(2))
-                if h <= 24 and m <= 59:  # Розумні межі
-                    duration = h * 60 + m
-                    logger.info(f"Знайдено тривалість (час): {h}:{m:02d} = {duration}хв")
-                    break
-            
-            # Шукаємо тільки години
-            hours_match = re.search(r'(\d+)\s*hours?', text, re.IGNORECASE)
-            if hours_match:
-                h = int(hours_match.group(1))
-                if h <= 24:  # Не більше 24 годин
-                    duration = h * 60
-                    logger.info(f"Знайдено тривалість (години): {h}г = {duration}хв")
-                    break
+        return self.analyze_texts(texts).stats
+    
+    def analyze_texts(self, texts: List[RecognizedText]) -> StatsResult:
+        """
+        Статистика з текстів OCR разом із впевненістю в кожному полі
         
-        # Тепер шукаємо основну статистику - групу з трьох чисел
-        # Патерн для трьох чисел підряд (може бути з K, M або без)
-        three_number_patterns = [
-            r'(\d+(?:\.\d+)?[KkМК]?)\s+(\d+(?:\.\d+)?[KkМК]?)\s+(\d+(?:\.\d+)?[KkМК]?)',
-            r'(\d+(?:[.,]\d+)?[KkМК]?)\s+(\d+(?:[.,]\d+)?[KkМК]?)\s+(\d+(?:[.,]\d+)?[KkМК]?)',
-        ]
+        Для текстів зі словами (image_to_data) голоси за значення зважуються
+        впевненістю Tesseract, тож чітко розпізнане значення переважає розмите.
+        """
+        result = analyze(texts)
+        duration, viewers, gifters, diamonds = result.stats
+        logger.info(f"Фінальна статистика: duration={duration}, viewers={viewers}, gifters={gifters}, diamonds={diamonds}, "
+                    f"впевненість={result.confidence}")
+        return result
+    
+    def extract_statistics(self, variants: ImageVariants) -> Optional[StatsResult]:
+        """
+        Витягує статистику з варіантів зображення
         
-        # Шукаємо характерний паттерн TikTok Live статистики
-        # Спочатку шукаємо точний паттерн "49K 61 189K" або "3K 26 34K" тощо
-        for text in texts:
-            # Шукаємо паттерн: число + K/M + пробіл + число + пробіл + число + K/M
-            exact_pattern = r'(\d+(?:\.\d+)?[KkМК])\s+(\d+)\s+(\d+(?:\.\d+)?[KkМК])'
-            match = re.search(exact_pattern, text, re.IGNORECASE)
-            
-            if match:
-                v1 = self.parse_number_value(match.group(1))  # Перше число з K - viewers
-                v2 = self.parse_number_value(match.group(2))  # Друге число - gifters  
-                v3 = self.parse_number_value(match.group(3))  # Третє число з K - diamonds
-                
-                # Перевіряємо розумність значень (не сортуємо, зберігаємо порядок!)
-                if (v1 > 0 and v2 > 0 and v3 > 0 and 
-                    v1 <= 100000 and v2 <= 10000 and v3 <= 50000):
-                    
-                    # Зберігаємо порядок з екрану: viewers, gifters, diamonds
-                    viewers = v1
-                    gifters = v2  
-                    diamonds = v3
-                    
-                    logger.info(f"Знайдено точний паттерн (порядок збережено): {match.group(1)} {match.group(2)} {match.group(3)} -> viewers={viewers}, gifters={gifters}, diamonds={diamonds}")
-                    break
-            
-            # Альтернативний паттерн для українських скріншотів
-            ukr_pattern = r'(\d+[KkМК])\s+[Гг]лядач.*?(\d+)\s+[Дд]арувальник.*?(\d+[KkМК])\s+[Дд]іамант'
-            ukr_match = re.search(ukr_pattern, text, re.IGNORECASE | re.DOTALL)
-            
-            if ukr_match:
-                v1 = self.parse_number_value(ukr_match.group(1))  # Глядачі
-                v2 = self.parse_number_value(ukr_match.group(2))  # Дарувальники
-                v3 = self.parse_number_value(ukr_match.group(3))  # Діаманти
-                
-                if (v1 > 0 and v2 > 0 and v3 > 0 and 
-                    v1 <= 100000 and v2 <= 10000 and v3 <= 50000):
-                    
-                    viewers = v1
-                    gifters = v2
-                    diamonds = v3
-                    
-                    logger.info(f"Знайдено український паттерн: {ukr_match.group(1)} {ukr_match.group(2)} {ukr_match.group(3)} -> viewers={viewers}, gifters={gifters}, diamonds={diamonds}")
-                    break
+        Скріншот відомої розмітки розбирається вирізками шаблону; невідома розмітка
+        або невдача шаблону - загальний шлях згідно з режимом self.mode, після якого
+        розмітка вивчається (OCR_LAYOUT_LEARN). Навчання відкладається у variants.lessons.
         
-        # Якщо не знайшли точний паттерн, шукаємо загальний
-        if not any([viewers, gifters, diamonds]):
-            # Перевіряємо чи тривалість була виправлена з числа, щоб виключити його
-            duration_number_to_exclude = None
-            if duration > 0:
-                for text in texts:
-                    double_min_match = re.search(r'(\d+)\s*хв\s*хв', text, re.IGNORECASE)
-                    if double_min_match:
-                        original_number = int(double_min_match.group(1))
-                        if original_number == 27 and duration == 205:
-                            duration_number_to_exclude = 27
-                            logger.info(f"Виключаємо число {original_number} з обробки груп (воно стало тривалістю)")
-                            break
-            
-            for text in texts:
-                text_clean = re.sub(r'[^\d\s.,KkМК]', ' ', text)  # Залишаємо тільки цифри, пробіли, коми, точки та K/M
-                
-                for pattern in three_number_patterns:
-                    matches = re.findall(pattern, text_clean, re.IGNORECASE)
-                    
-                    for match in matches:
-                        v1 = self.parse_number_value(match[0])
-                        v2 = self.parse_number_value(match[1])
-                        v3 = self.parse_number_value(match[2])
-                        
-                        # Виключаємо число що стало тривалістю
-                        values = [v1, v2, v3]
-                        if duration_number_to_exclude:
-                            values = [v for v in values if v != duration_number_to_exclude]
-                            logger.info(f"Після виключення {duration_number_to_exclude}: {values}")
-                        
-                        # Перевіряємо чи це розумні значення для TikTok Live
-                        if len(values) >= 2 and all(v > 0 for v in values):
-                            # Сортуємо щоб призначити правильно
-                            values_sorted = sorted(values, reverse=True)
-                            
-                            if len(values) >= 3:
-                                viewers = values_sorted[0]   # Найбільше - viewers
-                                diamonds = values_sorted[1]  # Друге за розміром - diamonds
-                                gifters = values_sorted[2]   # Найменше - gifters
-                            elif len(values) == 2:
-                                viewers = values_sorted[0]   # Найбільше - viewers
-                                diamonds = values_sorted[1]  # Друге - diamonds
-                                gifters = 0
-                            
-                            # Перевірка розумності після виключення
-                            if (viewers <= 100000 and gifters <= 10000 and diamonds <= 50000):
-                                logger.info(f"Знайдено групу чисел (з виключенням): {match[0]} {match[1]} {match[2]} -> viewers={viewers}, gifters={gifters}, diamonds={diamonds}")
-                                break
-                    
-                    if viewers > 0:  # Якщо знайшли групу, виходимо
-                        break
-                
-                if viewers > 0:  # Якщо знайшли групу, виходимо
-                    break
+        Returns:
+            StatsResult: Статистика та впевненість у полях або None якщо текст не розпізнано
+        """
+        if self.layouts is None:
+            return self.run_generic(variants, {})
+        
+        source_gray = variants.get('source_gray')
+        with variants.timings.stage('layout'):
+            features = layout_features(source_gray)
+            template = self.layouts.match(features)
+        
+        if template is not None:
+            result = self.run_layout(variants, template)
+            success = self.is_complete(result.stats)
+            if not success and variants.deadline.expired:
+                # Невдача через бюджет часу не характеризує шаблон
+                return result
+            variants.lessons.append(partial(self.layouts.record, template, success))
+            if success:
+                return result
+        
+        boxes = {}
+        result = self.run_generic(variants, boxes)
+        if OCR_LAYOUT_LEARN and result and self.is_complete(result.stats):
+            variants.lessons.append(partial(self.learn_layout, variants, features, result, boxes))
+        return result
+    
+    def run_generic(self, variants: ImageVariants, boxes: FieldBoxes) -> Optional[StatsResult]:
+        """
+        Загальний шлях для будь-якої розмітки згідно з режимом self.mode
+        
+        Args:
+            variants: Варіанти зображення
+            boxes: Куди режим anchored запише вирізки знайдених полів
         
-        # Якщо не знайшли групу з трьох чисел, шукаємо окремо
-        if not any([viewers, gifters, diamonds]):
-            logger.info("Не знайшли групу з 3 чисел, шукаємо окремо...")
+        Returns:
+            StatsResult: Статистика та впевненість у полях або None якщо текст не розпізнано
+        """
+        if self.mode == 'full':
+            # 1. Обробляємо зображення різними способами
+            processed_images = variants.all()
             
-            # Збираємо всі розумні числа (перевикористовуємо логіку виключення)
-            duration_number_to_exclude = None
-            if duration > 0:
-                for text in texts:
-                    double_min_match = re.search(r'(\d+)\s*хв\s*хв', text, re.IGNORECASE)
-                    if double_min_match:
-                        original_number = int(double_min_match.group(1))
-                        if original_number == 27 and duration == 205:
-                            duration_number_to_exclude = 27
-                            logger.info(f"Виключаємо число {original_number} з списку чисел (воно стало тривалістю)")
-                            break
+            # 2. Витягуємо текст з усіх варіантів
+            with variants.timings.stage('ocr'):
+                all_texts = self.extract_text_variants(
+                    processed_images, variants.timings, variants.deadline, variants.language
+                )
+            if not all_texts:
+                return None
             
-            reasonable_numbers = []
-            for text in texts:
-                numbers_in_line = re.findall(r'\d+(?:[.,]\d+)?[KkMmМКmм]?', text)
-                for num_str in numbers_in_line:
-                    value = self.parse_number_value(num_str)
-                    # Фільтруємо тільки розумні значення і виключаємо число тривалості
-                    if (10 <= value <= 100000 and 
-                        value != duration_number_to_exclude):  # Виключаємо число що стало тривалістю
-                        reasonable_numbers.append(value)
+            logger.info(f"Розпізнано {len(all_texts)} варіантів тексту")
+            for i, text in enumerate(all_texts[:3]):  # Показуємо перші 3
+                text = text.text if isinstance(text, OCRText) else text
+                logger.info(f"Текст {i+1}: {text[:100]}...")
             
-            # Унікальні значення, відсортовані
-            unique_numbers = sorted(set(reasonable_numbers), reverse=True)
-            logger.info(f"Розумні числа: {unique_numbers[:10]}")  # Показуємо перші 10
+            # 3. Аналізуємо та витягуємо статистику
+            with variants.timings.stage('parse'):
+                return self.analyze_texts(all_texts)
+        
+        anchored = None
+        if self.mode == 'anchored':
+            # Спочатку дешеві вирізки за підписами, каскад - лише якщо чогось бракує
+            anchored = self.run_anchored(variants, boxes)
+            if self.is_complete(anchored.stats):
+                return anchored
+        
+        # Каскад: варіанти створюються та розпізнаються поступово
+        result = self.run_cascade(variants)
+        if anchored is not None:
+            cascade = result or StatsResult((0, 0, 0, 0), dict.fromkeys(FIELDS, 0.0))
+            stats = []
+            confidence = {}
+            for field, value, anchored_value in zip(FIELDS, cascade.stats, anchored.stats):
+                source = cascade if value else anchored
+                stats.append(value or anchored_value)
+                confidence[field] = source.confidence[field]
+            result = StatsResult(tuple(stats), confidence)
+        return result
+    
+    def recognize_screenshot(self, image_path: ImageSource, language: str = '') -> Optional[StatsResult]:
+        """
+        Обробляє скріншот TikTok Live та витягує статистику разом із впевненістю
+        
+        Час етапів додається до статистики часу поточного процесу.
+        
+        Args:
+            image_path: Шлях до скріншоту або його вміст у пам'яті
+            language: Відома мова користувача ('' - визначити пробою)
             
-            # Призначаємо за розміром
-            if len(unique_numbers) >= 3:
-                viewers = unique_numbers[0]     # Найбільше
-                diamonds = unique_numbers[1]    # Друге за розміром
-                gifters = unique_numbers[2]     # Третє за розміром
-            elif len(unique_numbers) == 2:
-                viewers = unique_numbers[0]
-                diamonds = unique_numbers[1]
-                gifters = 0
-            elif len(unique_numbers) == 1:
-                viewers = unique_numbers[0]
-        
-        logger.info(f"Фінальна статистика: duration={duration}, viewers={viewers}, gifters={gifters}, diamonds={diamonds}")
-        return duration, viewers, gifters, diamonds
-    
-    def cleanup_temp_files(self, file_paths: List[str]):
-        """Видаляє тимчасові файли"""
-        for file_path in file_paths:
-            try:
-                if os.path.exists(file_path):
-                    os.unlink(file_path)
-            except Exception as e:
-                logger.debug(f"Не вдалося видалити тимчасовий файл {file_path}: {e}")
+        Returns:
+            StatsResult: (duration_minutes, viewers_count, gifters_count, diamonds_count) та
+            впевненість у кожному полі від 0 до 1, або None
+        """
+        result, timings = self.recognize_with_timings(image_path, language)
+        timing_stats.add(timings)
+        return result
     
-    def process_tiktok_screenshot(self, image_path: str) -> Optional[Tuple[int, int, int, int]]:
+    def recognize_with_timings(self, image_path: ImageSource, language: str = '') -> Tuple[Optional[StatsResult], Dict]:
         """
-        Обробляє скріншот TikTok Live та витягує статистику
+        Розпізнає скріншот і вимірює час кожного етапу та кожного виклику Tesseract
         
         Args:
-            image_path: Шлях до скріншоту
+            image_path: Шлях до скріншоту або його вміст у пам'яті
+            language: Відома мова користувача ('' - визначити пробою)
             
         Returns:
-            Tuple: (duration_minutes, viewers_count, gifters_count, diamonds_count) або None
+            Tuple: (StatsResult або None, часи з StageTimings.as_dict) - часи повертаються
+            і для невдалих спроб, бо саме вони найчастіше повільні
         """
-        processed_images = []
+        timings = StageTimings()
+        with timings.stage('total'):
+            result = self.run_recognition(image_path, timings, Deadline(OCR_TIME_BUDGET), language)
         
+        snapshot = timings.as_dict()
+        stages = ', '.join(f"{name} {ms:.0f}" for name, ms in snapshot['stages'].items())
+        logger.info(f"Час етапів OCR (мс): {stages}; викликів Tesseract: {sum(map(len, snapshot['calls'].values()))}")
+        return result, snapshot
+    
+    def run_recognition(self, image_path: ImageSource, timings: StageTimings,
+                        deadline: Optional[Deadline] = None, language: str = '') -> Optional[StatsResult]:
+        """
+        Розпізнавання скріншоту із записом часу етапів у timings
+        
+        Якщо бюджет deadline вичерпано до повного результату, валідний частковий
+        результат повертається з partial=True - його має підтвердити користувач.
+        Мова language (запам'ятована для користувача) замінює пробу; якщо з нею
+        результат неповний, проба перевіряє, чи не змінилась мова телефону.
+        Мова, якою прочитано скріншот, повертається в StatsResult.language.
+        Тюнер і шаблони розмітки вчаться лише на проході, результат якого прийнято.
+        """
+        deadline = deadline or Deadline()
         try:
-            logger.info(f"Початок обробки TikTok скріншоту: {image_path}")
+            logger.info(f"Початок обробки TikTok скріншоту: {self.describe_source(image_path)}")
             
-            # 1. Обробляємо зображення різними способами
-            processed_images = self.preprocess_image(image_path)
-            if not processed_images:
+            with timings.stage('decode'):
+                variants = self.decode_variants(image_path, timings, deadline)
+            if variants is None:
                 return None
             
-            # 2. Витягуємо текст з усіх варіантів
-            all_texts = self.extract_text_variants(processed_images)
-            if not all_texts:
-                logger.warning("Не вдалося розпізнати текст жодним способом")
-                return None
+            if self.cache is not None:
+                # Повторно надісланий скріншот - без OpenCV/Tesseract; в кеш потрапляють
+                # лише результати, що пройшли валідацію
+                source_gray = variants.get('source_gray')
+                with timings.stage('cache'):
+                    cached, image_hash, digest = self.cache.get(source_gray)
+                if cached is not None:
+                    return StatsResult(cached, dict.fromkeys(FIELDS, 1.0))
             
-            logger.info(f"Розпізнано {len(all_texts)} варіантів тексту")
-            for i, text in enumerate(all_texts[:3]):  # Показуємо перші 3
-                logger.info(f"Текст {i+1}: {text[:100]}...")
+            hinted = language in self.languages
+            variants.language = language if hinted else self.probe_language(variants)
+            result = self.extract_statistics(variants)
+            lessons, variants.lessons = variants.lessons, []
             
-            # 3. Аналізуємо та витягуємо статистику
-            duration, viewers, gifters, diamonds = self.find_tiktok_statistics(all_texts)
+            if hinted and not deadline.expired and not (result and self.is_complete(result.stats)):
+                probed = self.probe_language(variants)
+                if probed != language:
+                    logger.info(f"Мова користувача {language} не підійшла, повтор з {probed}")
+                    variants.language = probed
+                    retry = self.extract_statistics(variants)
+                    if retry and (not result or sum(map(bool, retry.stats)) >= sum(map(bool, result.stats))):
+                        result, lessons = retry, variants.lessons
+                    else:
+                        variants.language = language
+                    variants.lessons = []
+            
+            if lessons:
+                with timings.stage('tuning'):
+                    for lesson in lessons:
+                        lesson()
+            
+            if not result or not any(result.stats):
+                logger.warning("Не вдалося розпізнати текст жодним способом")
+                return None
+            duration, viewers, gifters, diamonds = result.stats
+            partial = deadline.expired and not self.is_complete(result.stats)
             
             # 4. Валідуємо результати
-            if self.validate_stats(duration, viewers, gifters, diamonds):
+            with timings.stage('validate'):
+                valid = self.validate_stats(duration, viewers, gifters, diamonds)
+            if valid and partial:
+                # Неповний результат не кешується: повторна спроба може дати більше
+                logger.warning(f"Бюджет часу {deadline.seconds:g} с вичерпано, частковий результат: {result.stats}")
+                return result._replace(partial=True, language=variants.language)
+            if valid:
                 logger.info(f"Успішно витягнуто статистику: {duration}хв, {viewers} viewers, {gifters} gifters, {diamonds} diamonds")
-                return duration, viewers, gifters, diamonds
+                if self.cache is not None:
+                    with timings.stage('cache'):
+                        self.cache.put(image_hash, digest, result.stats)
+                return result._replace(language=variants.language)
             else:
                 logger.warning(f"Статистика не пройшла валідацію: {duration}, {viewers}, {gifters}, {diamonds}")
                 return None
@@ -569,10 +995,52 @@ class TikTokOCRProcessor:
         except Exception as e:
             logger.error(f"Помилка обробки TikTok скріншоту: {e}")
             return None
+    
+    def explore(self, image_path: ImageSource, language: str, stats: Tuple[int, int, int, int]) -> bool:
+        """
+        Фоновий прохід комбінації, до якої каскад з раннім виходом зазвичай не доходить
+        
+        Виконується для вже прийнятого й надісланого користувачу результату stats,
+        коли черга OCR вільна: найменш випробувана комбінація поза першою порцією
+        каскаду читає скріншот, а learn_from_result записує її час і зараховує поля,
+        що збіглися з stats. Без цього рейтинг комбінацій у кінці порядку не змінюється.
         
-        finally:
-            # Завжди очищуємо тимчасові файли
-            self.cleanup_temp_files(processed_images)
+        Returns:
+            bool: True якщо прохід виконано
+        """
+        if self.tuner is None:
+            return False
+        skipped = {
+            (name, self.ocr_configs[index]): (name, index)
+            for name, index in self.cascade_order[self.pool_size:]
+        }
+        combination = self.tuner.least_tried(list(skipped))
+        if combination is None:
+            return False
+        
+        variants = self.decode_variants(image_path, deadline=Deadline(OCR_TIME_BUDGET))
+        if variants is None:
+            return False
+        name, index = skipped[combination]
+        text, seconds = self.timed_recognize(
+            name, variants.get(name), with_language(self.ocr_configs[index], language), variants.deadline
+        )
+        self.learn_from_result({(name, index): text} if text else {}, {(name, index): seconds}, stats)
+        logger.info(f"Фонове дослідження комбінації {name} / {short_config(self.ocr_configs[index])}: {seconds * 1000:.0f} мс")
+        return True
+    
+    def process_tiktok_screenshot(self, image_path: ImageSource) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Обробляє скріншот TikTok Live та витягує статистику
+        
+        Args:
+            image_path: Шлях до скріншоту або його вміст у пам'яті
+            
+        Returns:
+            Tuple: (duration_minutes, viewers_count, gifters_count, diamonds_count) або None
+        """
+        result = self.recognize_screenshot(image_path)
+        return result.stats if result else None
     
     def validate_stats(self, duration: int, viewers: int, gifters: int, diamonds: int) -> bool:
         """Валідує статистику"""
@@ -606,17 +1074,66 @@ class TikTokOCRProcessor:
         logger.info(f"Валідація пройшла: duration={duration}, viewers={viewers}, gifters={gifters}, diamonds={diamonds}")
         return True
     
+    def warmup_image(self) -> np.ndarray:
+        """Скріншот для прогріву: OCR_WARMUP_IMAGE або синтетичний екран підсумків"""
+        if OCR_WARMUP_IMAGE:
+            img = self.load_image(OCR_WARMUP_IMAGE)
+            if img is not None:
+                return img
+        
+        img = np.full((480, 360, 3), 255, np.uint8)
+        lines = [('LIVE summary', ''), ('Duration', '1:25'), ('Viewers', '4.9K'), ('Gifters', '27'), ('Diamonds', '612')]
+        for index, (label, value) in enumerate(lines):
+            y = 60 + index * 80
+            cv2.putText(img, label, (20, y), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (90, 90, 90), 2)
+            cv2.putText(img, value, (220, y), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2)
+        return img
+    
+    def warm_up(self) -> bool:
+        """
+        Прогрів процесу перед першим скріншотом
+        
+        Кожна конфігурація Tesseract з кожною мовою OCR_LANGUAGES і проба мови
+        виконуються один раз на тестовому скріншоті: завантажуються traineddata
+        (у пул теплих воркерів або в кеш сторінок ОС для процесів tesseract),
+        створюються варіанти зображення, працюють вирізки значень. Кеш, самонавчання та шаблони не змінюються.
+        
+        Returns:
+            bool: True якщо всі виклики Tesseract завершились без помилок
+        """
+        variants = ImageVariants(self.warmup_image(), OCR_TARGET_GLYPH_HEIGHT)
+        binary = variants.get('binary')
+        configs = [
+            with_language(config, language)
+            for language in self.languages or ['']
+            for config in dict.fromkeys([*self.ocr_configs, self.layout_config, *self.value_configs.values()])
+        ]
+        if len(self.languages) > 1:
+            configs.append(probe_config(self.languages))
+        
+        def run(config: str) -> bool:
+            try:
+                image_to_data(binary, config) if OCR_WORD_CONFIDENCE else image_to_string(binary, config)
+                return True
+            except Exception as e:
+                logger.warning(f"Прогрів OCR: помилка конфігурації {config[:20]}...: {e}")
+                return False
+        
+        started = time.perf_counter()
+        results = list(self.executor.map(run, configs))
+        variants.all()
+        if self.glyphs is not None:
+            gray = variants.get('gray')
+            self.glyphs.read(self.crop_value(gray, (0, 0, gray.shape[1], gray.shape[0])))
+        
+        logger.info(f"Прогрів OCR: {sum(results)}/{len(results)} конфігурацій за {time.perf_counter() - started:.1f} с")
+        return all(results)
+    
     def test_ocr_installation(self) -> bool:
         """Тестує чи працює OCR"""
         try:
-            test_image = Image.new('RGB', (200, 50), 'white')
-            test_path = tempfile.mktemp(suffix='.png')
-            test_image.save(test_path)
-            
-            pytesseract.image_to_string(test_path, config=self.ocr_configs[0])
-            
-            if os.path.exists(test_path):
-                os.unlink(test_path)
+            test_image = np.full((50, 200, 3), 255, np.uint8)
+            image_to_string(test_image, config=self.ocr_configs[0])
             
             logger.info("OCR тест пройшов успішно")
             return True
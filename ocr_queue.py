@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from config import OCR_QUEUE_SIZE, OCR_QUEUE_CONSUMERS
+from cpu_planner import AdaptiveLimiter, current_plan
+from ocr_workers import resize_pool
+
+logger = logging.getLogger(__name__)
+
+# Початкова оцінка часу однієї задачі, поки немає вимірювань (секунди)
+DEFAULT_JOB_SECONDS = 8.0
+
+# Вага нового вимірювання в ковзному середньому часу задачі
+JOB_SECONDS_SMOOTHING = 0.2
+
+# Як часто перевіряти позицію в черзі та мінімальний інтервал між оновленнями повідомлення
+POSITION_POLL_INTERVAL = 1.0
+POSITION_UPDATE_INTERVAL = 3.0
+
+# Зворотний виклик про позицію: (позиція від 1 або 0 - обробка почалась, орієнтовне очікування в секундах)
+PositionCallback = Callable[[int, float], Awaitable[None]]
+
+
+class QueueFull(Exception):
+    """Черга OCR заповнена; retry_after - через скільки секунд варто спробувати знову"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Черга OCR заповнена, повторіть через {retry_after:.0f} с")
+        self.retry_after = retry_after
+
+
+class Job:
+    """Задача OCR у черзі"""
+
+    def __init__(self, user_id: int, work: Callable[[], Awaitable[Any]], future: asyncio.Future):
+        self.user_id = user_id
+        self.work = work
+        self.future = future
+        self.started = False
+
+
+class OCRQueue:
+    """
+    Обмежена черга задач OCR - єдине місце, що визначає паралельність OCR
+
+    Задачі різних користувачів видаються по колу: користувач з альбомом
+    із десяти скріншотів не затримує всіх інших на десять задач. Одночасно
+    обробляється не більше задач, ніж дозволяє адаптивний ліміт; решта
+    залишається в черзі зі своєю позицією. Коли черга заповнена, submit
+    одразу кидає QueueFull замість очікування. Фонова задача (submit_background)
+    запускається лише тоді, коли жодна задача користувача не чекає.
+    """
+
+    def __init__(self, max_size: int, limiter: AdaptiveLimiter):
+        """
+        Args:
+            max_size: Максимум задач, що очікують
+            limiter: Ліміт одночасних задач, що росте з чергою (обробників - його максимум)
+        """
+        self.max_size = max(1, max_size)
+        self.limiter = limiter
+        self.consumers = max(1, limiter.maximum)
+        self.job_seconds = DEFAULT_JOB_SECONDS
+        self.running = 0
+        self.completed = 0
+        self._queues: Dict[int, Deque[Job]] = {}
+        self._order: 'OrderedDict[int, None]' = OrderedDict()
+        self._waiting = 0
+        self._background: Optional[Callable[[], Awaitable[Any]]] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def waiting(self) -> int:
+        """Кількість задач, що очікують обробника"""
+        return self._waiting
+
+    def eta(self, position: int) -> float:
+        """Орієнтовний час до завершення задачі на позиції position (секунди)"""
+        return math.ceil(position / max(1, self.limiter.limit)) * self.job_seconds
+
+    def retry_after(self) -> float:
+        """Через скільки секунд черга орієнтовно звільниться"""
+        return self.eta(self._waiting + self.running)
+
+    def ensure_capacity(self, count: int = 1):
+        """Перевірити, що в черзі є місце для count задач, інакше QueueFull"""
+        if self._waiting + count > self.max_size:
+            raise QueueFull(self.retry_after())
+
+    def position(self, job: Job) -> int:
+        """
+        Позиція задачі, що очікує, з урахуванням черговості користувачів по колу
+
+        Returns:
+            int: Позиція від 1 або 0, якщо задача вже обробляється
+        """
+        if job.started:
+            return 0
+        jobs = self._queues.get(job.user_id)
+        if not jobs or job not in jobs:
+            return 0
+
+        rounds = jobs.index(job)
+        ahead = 0
+        before_user = True
+        for user_id in self._order:
+            size = len(self._queues[user_id])
+            if user_id == job.user_id:
+                before_user = False
+                ahead += rounds
+                continue
+            # Кожен користувач отримує по задачі за коло; ті, хто раніше в колі, - ще одну
+            ahead += min(size, rounds + 1 if before_user else rounds)
+        return ahead + 1
+
+    async def submit(self, user_id: int, work: Callable[[], Awaitable[Any]],
+                     on_position: Optional[PositionCallback] = None) -> Any:
+        """
+        Поставити задачу в чергу та дочекатися її результату
+
+        Args:
+            user_id: Користувач, для справедливої черговості
+            work: Функція, що повертає корутину з роботою
+            on_position: Викликається при зміні позиції в черзі
+
+        Raises:
+            QueueFull: Черга заповнена
+        """
+        self.ensure_capacity()
+        self._start()
+        self.limiter.update(self._waiting, self.running)  # після простою ліміт зменшується
+
+        job = Job(user_id, work, asyncio.get_running_loop().create_future())
+        self._queues.setdefault(user_id, deque()).append(job)
+        self._order.setdefault(user_id, None)
+        self._waiting += 1
+        self._wakeup.set()
+
+        reporter = asyncio.create_task(self._report_position(job, on_position)) if on_position else None
+        try:
+            return await job.future
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+
+    def submit_background(self, work: Callable[[], Awaitable[Any]]):
+        """
+        Запланувати фонову задачу без очікування результату
+
+        Зберігається лише одна, найновіша, фонова задача: вона не займає місця
+        в черзі й не впливає на позиції та ETA користувачів.
+        """
+        self._start()
+        self._background = work
+        self._wakeup.set()
+
+    async def _run_background(self):
+        """Виконати фонову задачу в межах ліміту одночасних задач"""
+        work, self._background = self._background, None
+        self.running += 1
+        try:
+            await work()
+        except Exception as e:
+            logger.warning(f"Фонова задача OCR не вдалася: {e}")
+        finally:
+            self.running -= 1
+            self._wakeup.set()
+
+    async def _report_position(self, job: Job, on_position: PositionCallback):
+        """Повідомляти про зміну позиції, поки задача очікує"""
+        shown = None
+        shown_at = 0.0
+        while not job.started:
+            position = self.position(job)
+            now = time.monotonic()
+            if position and position != shown and now - shown_at >= POSITION_UPDATE_INTERVAL:
+                try:
+                    await on_position(position, self.eta(position))
+                except Exception as e:
+                    logger.debug(f"Не вдалося оновити позицію в черзі: {e}")
+                shown, shown_at = position, now
+            await asyncio.sleep(POSITION_POLL_INTERVAL)
+
+        if shown:
+            try:
+                await on_position(0, 0.0)
+            except Exception as e:
+                logger.debug(f"Не вдалося оновити позицію в черзі: {e}")
+
+    def _next_job(self) -> Optional[Job]:
+        """Наступна задача: перший користувач у колі переходить у його кінець"""
+        if not self._order:
+            return None
+        user_id, _ = self._order.popitem(last=False)
+        jobs = self._queues[user_id]
+        job = jobs.popleft()
+        if jobs:
+            self._order[user_id] = None
+        else:
+            del self._queues[user_id]
+        self._waiting -= 1
+        return job
+
+    def _start(self):
+        """Запустити обробників у поточному циклі подій при першій задачі"""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._consume()) for _ in range(self.consumers)]
+        logger.info(f"Черга OCR: {self.consumers} обробників, до {self.max_size} задач")
+
+    async def _consume(self):
+        """Обробник: бере задачі по черзі, поки працює бот"""
+        while True:
+            limit = self.limiter.update(self._waiting, self.running)
+            if self.running >= limit or not (self._waiting or self._background):
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if not self._waiting:
+                await self._run_background()
+                continue
+            job = self._next_job()
+
+            job.started = True
+            if job.future.done():  # відправник уже не чекає
+                continue
+
+            self.running += 1
+            started = time.monotonic()
+            try:
+                result = await job.work()
+                if not job.future.done():
+                    job.future.set_result(result)
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self.running -= 1
+                self.completed += 1
+                seconds = time.monotonic() - started
+                self.job_seconds += (seconds - self.job_seconds) * JOB_SECONDS_SMOOTHING
+                self._wakeup.set()  # звільнилось місце в межах ліміту
+
+    def info(self) -> Dict:
+        """Стан черги для діагностики"""
+        return {
+            'waiting': self._waiting,
+            'running': self.running,
+            'users': len(self._order),
+            'consumers': self.consumers,
+            'limit': self.limiter.limit,
+            'max_size': self.max_size,
+            'completed': self.completed,
+            'job_seconds': self.job_seconds,
+        }
+
+
+def create_queue() -> OCRQueue:
+    """Черга з лімітом від мінімуму до максимуму процесів плану CPU (або OCR_QUEUE_CONSUMERS), за яким змінюється пул"""
+    plan = current_plan()
+    maximum = OCR_QUEUE_CONSUMERS or plan.max_workers
+    return OCRQueue(OCR_QUEUE_SIZE, AdaptiveLimiter(min(plan.min_workers, maximum), maximum, resize_pool))
+
+
+# Глобальна черга OCR бота
+ocr_queue = create_queue()
@@ -0,0 +1,116 @@
+import logging
+from typing import Optional
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Вимірювання на зменшеній копії, якщо довша сторона більша
+MEASURE_MAX_SIDE = 1600
+
+# Межі масштабу нормалізації
+MIN_SCALE = 0.25
+MAX_SCALE = 4.0
+
+# Різниця з цільовою висотою, за якої масштабування не варте часу
+SCALE_TOLERANCE = 0.15
+
+# Кратності зменшення, які OpenCV виконує під час декодування (IMREAD_REDUCED_*)
+DECODE_REDUCTIONS = (8, 4, 2)
+
+# Запас над цільовою висотою символів після зменшення при декодуванні: висота
+# оцінюється за пропорцією, а втрачену роздільність збільшення вже не поверне
+DECODE_REDUCTION_MARGIN = 1.25
+
+
+def measure_glyph_height(gray: np.ndarray) -> Optional[float]:
+    """
+    Медіанна висота символів на зображенні за зв'язними компонентами
+
+    Після бінаризації текстом вважається менший за площею клас пікселів -
+    так світлий текст на темному фоні TikTok LIVE і темний на світлому
+    вимірюються однаково. Компоненти, що не схожі на символ (лінії, іконки,
+    плашки), відкидаються за пропорціями та заповненістю.
+
+    Args:
+        gray: Сіре зображення
+
+    Returns:
+        float: Висота символу в пікселях вихідного зображення або None, якщо символів не знайдено
+    """
+    factor = 1.0
+    height, width = gray.shape[:2]
+    if max(height, width) > MEASURE_MAX_SIDE:
+        factor = max(height, width) / MEASURE_MAX_SIDE
+        gray = cv2.resize(gray, (round(width / factor), round(height / factor)), interpolation=cv2.INTER_AREA)
+
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if cv2.countNonZero(binary) > binary.size / 2:
+        binary = cv2.bitwise_not(binary)
+
+    count, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    if count <= 1:
+        return None
+
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    fill = stats[1:, cv2.CC_STAT_AREA] / np.maximum(widths * heights, 1)
+    glyphs = (
+        (heights >= 4) & (heights <= binary.shape[0] * 0.1)
+        & (widths <= heights * 1.5) & (widths * 8 >= heights)
+        & (fill >= 0.15) & (fill <= 0.95)
+    )
+    if np.count_nonzero(glyphs) < 3:
+        return None
+
+    return float(np.median(heights[glyphs])) * factor
+
+
+def normalization_scale(glyph_height: Optional[float], target_height: int) -> float:
+    """
+    Масштаб, що приводить висоту символів до цільової
+
+    Returns:
+        float: Коефіцієнт масштабу; 1.0 якщо висоту не виміряно або вона вже близька до цільової
+    """
+    if not glyph_height or target_height <= 0:
+        return 1.0
+
+    scale = min(MAX_SCALE, max(MIN_SCALE, target_height / glyph_height))
+    if abs(scale - 1.0) <= SCALE_TOLERANCE:
+        return 1.0
+    return scale
+
+
+def decode_reduction(height: int, glyph_height_ratio: float, target_height: int) -> int:
+    """
+    У скільки разів зменшити зображення вже під час декодування
+
+    Висота символів оцінюється за висотою зображення з заголовка файлу та
+    типовою пропорцією (benchmark_ocr.py --glyph-ratio). Обирається найбільше
+    зменшення, після якого символи не нижчі за цільову висоту з запасом. Зменшення
+    в 2 рази потребує висоти target_height * DECODE_REDUCTION_MARGIN * 2 / glyph_height_ratio
+    (4000 px з типовими налаштуваннями): фото Telegram (до 1280 px) декодуються
+    повністю, зменшуються лише великі файли (benchmark_ocr.py --decode).
+
+    Returns:
+        int: 1, 2, 4 або 8
+    """
+    if height <= 0 or glyph_height_ratio <= 0 or target_height <= 0:
+        return 1
+
+    expected = height * glyph_height_ratio
+    for reduction in DECODE_REDUCTIONS:
+        if expected / reduction >= target_height * DECODE_REDUCTION_MARGIN:
+            return reduction
+    return 1
+
+
+def rescale(image: np.ndarray, scale: float) -> np.ndarray:
+    """Змінити розмір зображення: INTER_AREA для зменшення, INTER_CUBIC для збільшення"""
+    if scale == 1.0:
+        return image
+    height, width = image.shape[:2]
+    interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_CUBIC
+    return cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=interpolation)
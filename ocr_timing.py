@@ -0,0 +1,198 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from ocr_tuning import short_config
+
+# Порядок етапів розпізнавання для відображення
+STAGES = ('decode', 'cache', 'preprocess', 'layout', 'ocr', 'parse', 'validate', 'tuning', 'total')
+
+# Верхні межі кошиків гістограми в мілісекундах (останній кошик - все, що більше)
+BUCKET_BOUNDS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class StageTimings:
+    """
+    Час етапів розпізнавання одного скріншоту та кожного виклику Tesseract
+
+    Проходи OCR виконуються в потоках пулу, тому запис захищений блокуванням.
+    Час етапу - сумарний час усіх його ділянок; для 'ocr' це час очікування
+    порцій, а не сума викликів, які йдуть паралельно.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Виміряти ділянку коду як частину етапу"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name: str, seconds: float):
+        """Додати час до етапу"""
+        with self._lock:
+            self.stages[name] += seconds * 1000
+
+    def add_call(self, variant: str, config: str, seconds: float):
+        """Врахувати один виклик Tesseract для варіанту та конфігурації"""
+        with self._lock:
+            self.calls[f'{variant} | {short_config(config)}'].append(seconds * 1000)
+
+    def as_dict(self) -> Dict:
+        """
+        Знімок для передачі між процесами
+
+        Returns:
+            Dict: {'stages': {етап: мс}, 'calls': {комбінація: [мс, ...]}}
+        """
+        with self._lock:
+            return {
+                'stages': {name: round(ms, 2) for name, ms in self.stages.items()},
+                'calls': {key: [round(ms, 2) for ms in values] for key, values in self.calls.items()},
+            }
+
+
+class Deadline:
+    """
+    Бюджет часу на розпізнавання одного скріншоту
+
+    Проходи OCR перевіряють залишок перед стартом і передають його Tesseract
+    як тайм-аут: після вичерпання бюджету нові проходи не починаються, а ті,
+    що виконуються, перериваються.
+    """
+
+    def __init__(self, seconds: float = 0):
+        """
+        Args:
+            seconds: Бюджет у секундах (0 - без обмеження)
+        """
+        self.seconds = seconds
+        self.started = time.monotonic()
+
+    def remaining(self) -> Optional[float]:
+        """Залишок бюджету в секундах (не менше 0) або None без обмеження"""
+        if self.seconds <= 0:
+            return None
+        return max(0.0, self.seconds - (time.monotonic() - self.started))
+
+    @property
+    def expired(self) -> bool:
+        """Чи вичерпано бюджет"""
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+
+class TimingHistogram:
+    """Гістограма тривалостей з фіксованими кошиками"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms: float):
+        """Врахувати одне вимірювання"""
+        self.buckets[bisect_left(BUCKET_BOUNDS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    @property
+    def average_ms(self) -> float:
+        return self.total_ms / self.count if self.count else 0.0
+
+    def percentile(self, percent: float) -> float:
+        """Оцінка перцентиля: верхня межа кошика (для останнього - максимум)"""
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(BUCKET_BOUNDS[index], self.max_ms) if index < len(BUCKET_BOUNDS) else self.max_ms
+        return self.max_ms
+
+
+class TimingStats:
+    """Накопичені гістограми етапів та комбінацій OCR у межах процесу"""
+
+    def __init__(self):
+        self.stages: Dict[str, TimingHistogram] = defaultdict(TimingHistogram)
+        self.calls: Dict[str, TimingHistogram] = defaultdict(TimingHistogram)
+        self.screenshots = 0
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, timings: Optional[Dict]):
+        """Врахувати часи одного скріншоту (результат StageTimings.as_dict)"""
+        if not timings:
+            return
+        with self._lock:
+            self.screenshots += 1
+            for name, ms in timings.get('stages', {}).items():
+                self.stages[name].add(ms)
+            for key, values in timings.get('calls', {}).items():
+                for ms in values:
+                    self.calls[key].add(ms)
+
+    def stage_summary(self) -> List[Dict]:
+        """Зведення етапів у порядку STAGES"""
+        with self._lock:
+            names = [name for name in STAGES if name in self.stages]
+            names += sorted(name for name in self.stages if name not in STAGES)
+            return [self._summary(name, self.stages[name]) for name in names]
+
+    def slowest_calls(self, limit: int = 10) -> List[Dict]:
+        """Комбінації (варіант, конфігурація) з найбільшим середнім часом виклику"""
+        with self._lock:
+            summary = [self._summary(key, histogram) for key, histogram in self.calls.items()]
+        return sorted(summary, key=lambda item: item['avg_ms'], reverse=True)[:limit]
+
+    def total_histogram(self) -> Optional[TimingHistogram]:
+        """Гістограма повного часу розпізнавання"""
+        with self._lock:
+            return self.stages.get('total')
+
+    def reset(self):
+        """Очистити накопичену статистику"""
+        with self._lock:
+            self.stages.clear()
+            self.calls.clear()
+            self.screenshots = 0
+            self.started = time.time()
+
+    @staticmethod
+    def _summary(name: str, histogram: TimingHistogram) -> Dict:
+        return {
+            'name': name,
+            'count': histogram.count,
+            'avg_ms': histogram.average_ms,
+            'p50_ms': histogram.percentile(50),
+            'p95_ms': histogram.percentile(95),
+            'max_ms': histogram.max_ms,
+        }
+
+
+def bucket_label(index: int) -> str:
+    """Підпис кошика гістограми: '≤250 мс' або '>30 с'"""
+    def format_ms(ms: int) -> str:
+        return f'{ms / 1000:g} с' if ms >= 1000 else f'{ms} мс'
+
+    if index < len(BUCKET_BOUNDS):
+        return f'≤{format_ms(BUCKET_BOUNDS[index])}'
+    return f'>{format_ms(BUCKET_BOUNDS[-1])}'
+
+
+# Глобальна статистика часу розпізнавання процесу бота
+timing_stats = TimingStats()
@@ -0,0 +1,176 @@
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Комбінація для статистики: (назва варіанту, рядок конфігурації Tesseract)
+Combination = Tuple[str, str]
+
+# Найдовше, скільки накопичена статистика чекає запису в БД при малому потоці скріншотів (секунди)
+FLUSH_INTERVAL = 300.0
+
+
+def short_config(config: str) -> str:
+    """Коротка назва конфігурації Tesseract для відображення: 'psm 6 +wl'"""
+    psm = re.search(r'--psm\s+(\d+)', config)
+    label = f"psm {psm.group(1)}" if psm else config[:12]
+    if 'whitelist' in config:
+        label += ' +wl'
+    return label
+
+
+def combination_score(field_hits: int, attempts: int, total_seconds: float) -> float:
+    """
+    Корисність комбінації: очікувана кількість прийнятих полів на секунду OCR
+
+    Згладжування не дає комбінації з однією випадковою вдачею обігнати перевірені.
+    """
+    if attempts <= 0:
+        return 0.0
+    hit_rate = (field_hits + 1) / (attempts + 2)
+    average_seconds = total_seconds / attempts
+    return hit_rate / (average_seconds + 0.1)
+
+
+def rank_combinations(rows: List[Dict], min_attempts: int) -> List[Dict]:
+    """
+    Рейтинг комбінацій зі статистики бази даних
+
+    Args:
+        rows: Записи ocr_combo_stats
+        min_attempts: Мінімум спроб, щоб комбінація вважалась вивченою
+
+    Returns:
+        List[Dict]: Записи з полями score, avg_ms, pruned, відсортовані за спаданням score
+    """
+    ranking = []
+    for row in rows:
+        attempts = row['attempts'] or 0
+        total_seconds = (row['total_ms'] or 0) / 1000
+        ranking.append({
+            **row,
+            'score': combination_score(row['field_hits'] or 0, attempts, total_seconds),
+            'avg_ms': (row['total_ms'] or 0) / attempts if attempts else 0,
+            # Вивчена комбінація, яка жодного разу не дала поле, йде в кінець черги
+            'pruned': attempts >= min_attempts and not row['field_hits'],
+        })
+    return sorted(ranking, key=lambda item: (item['pruned'], -item['score']))
+
+
+class CombinationTuner:
+    """
+    Збирає статистику успішності комбінацій та перевпорядковує каскад
+
+    Статистика накопичується в пам'яті й записується в БД одним пакетом перед
+    перечитуванням рейтингу (кожні refresh_every скріншотів) або через
+    FLUSH_INTERVAL секунд. Ранній вихід каскаду означає, що комбінації в кінці
+    порядку майже не запускаються і їх рейтинг не оновлюється, тому фонові проходи
+    (TikTokOCRProcessor.explore) обирають найменш випробувану з них - least_tried.
+    """
+
+    def __init__(self, min_attempts: int, refresh_every: int):
+        """
+        Args:
+            min_attempts: Мінімум спроб для участі комбінації в рейтингу
+            refresh_every: Кожні скільки скріншотів перечитувати рейтинг з БД
+        """
+        self.min_attempts = min_attempts
+        self.refresh_every = max(1, refresh_every)
+        self._lock = threading.Lock()
+        self._pending: Dict[Combination, List[float]] = defaultdict(lambda: [0, 0, 0.0])
+        self._attempts: Dict[Combination, int] = {}
+        self._screenshots = 0
+        self._flushed_at = time.monotonic()
+
+    def record(self, combination: Combination, seconds: float):
+        """Врахувати один прохід OCR"""
+        with self._lock:
+            counters = self._pending[combination]
+            counters[0] += 1
+            counters[2] += seconds * 1000
+
+    def credit(self, combination: Combination, fields: int):
+        """Зарахувати комбінації поля, які увійшли в прийнятий результат"""
+        with self._lock:
+            self._pending[combination][1] += fields
+
+    def least_tried(self, combinations: List[Combination]) -> Optional[Combination]:
+        """
+        Найменш випробувана комбінація з урахуванням ще не записаних спроб
+
+        Returns:
+            Combination: Перша з найменшою кількістю спроб або None для порожнього списку
+        """
+        if not combinations:
+            return None
+        with self._lock:
+            return min(combinations, key=lambda combination: (
+                self._attempts.get(combination, 0)
+                + (self._pending[combination][0] if combination in self._pending else 0)
+            ))
+
+    def flush(self) -> bool:
+        """
+        Завершити скріншот: записати накопичену статистику в БД, якщо настав час
+
+        Returns:
+            bool: True якщо настав час перечитати рейтинг
+        """
+        with self._lock:
+            self._screenshots += 1
+            refresh = self._screenshots % self.refresh_every == 0
+            if not refresh and time.monotonic() - self._flushed_at < FLUSH_INTERVAL:
+                return False
+            pending = dict(self._pending)
+            self._pending.clear()
+            self._flushed_at = time.monotonic()
+
+        if pending:
+            try:
+                from database import db
+                db.update_ocr_combo_stats([
+                    (variant, config, int(attempts), int(field_hits), total_ms)
+                    for (variant, config), (attempts, field_hits, total_ms) in pending.items()
+                ])
+            except Exception as e:
+                logger.warning(f"Не вдалося зберегти статистику комбінацій OCR: {e}")
+        return refresh
+
+    def order(self, default_order: List[Combination]) -> List[Combination]:
+        """
+        Новий порядок комбінацій: спершу вивчені за рейтингом, далі ще не вивчені
+        в початковому порядку, в кінці - вивчені без жодного успіху
+
+        Args:
+            default_order: Початковий порядок комбінацій
+
+        Returns:
+            List[Combination]: Перевпорядкований список тих самих комбінацій
+        """
+        try:
+            from database import db
+            ranking = rank_combinations(db.get_ocr_combo_stats(), self.min_attempts)
+        except Exception as e:
+            logger.warning(f"Не вдалося отримати рейтинг комбінацій OCR: {e}")
+            return default_order
+
+        with self._lock:
+            self._attempts = {(item['variant'], item['config']): item['attempts'] or 0 for item in ranking}
+
+        known = set(default_order)
+        learned = [
+            (item['variant'], item['config']) for item in ranking
+            if item['attempts'] >= self.min_attempts and (item['variant'], item['config']) in known
+        ]
+        pruned = {(item['variant'], item['config']) for item in ranking if item['pruned']}
+
+        good = [combination for combination in learned if combination not in pruned]
+        cold = [combination for combination in default_order if combination not in learned]
+        dead = [combination for combination in learned if combination in pruned]
+
+        logger.info(f"Порядок OCR оновлено: {len(good)} вивчених, {len(cold)} нових, {len(dead)} відкладених")
+        return good + cold + dead
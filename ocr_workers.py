@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+from cpu_planner import current_plan
+from ocr_timing import timing_stats
+from stats_parser import StatsResult
+
+logger = logging.getLogger(__name__)
+
+# Скріншот: шлях до файлу або вміст у пам'яті (передається у воркер без запису на диск)
+ImageSource = Union[str, bytes, bytearray]
+
+# Пул процесів для OCR (створюється при першому використанні). Процеси запускаються
+# пулом лише коли всі наявні зайняті, тому їх не більше, ніж найбільший ліміт черги
+# з моменту створення пулу - це число зберігає _pool_workers. З методом fork пул
+# запустив би всі процеси одразу, тому процеси створює forkserver (де він є)
+_executor: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+# Готовність OCR для перевірки стану та адмін-панелі:
+# starting - прогрів не запускався, warming - триває, ready - процеси мінімуму прогріті,
+# degraded - прогрів з помилками (скріншоти приймаються, але OCR може не працювати)
+_readiness: Dict = {'status': 'starting', 'workers': 0, 'seconds': 0.0, 'error': None}
+
+# Результат прогріву поточного процесу-воркера: (успіх, секунди)
+_worker_warmup: Optional[Tuple[bool, float]] = None
+
+# Скільки задача прогріву тримає процес: інакше вже прогрітий процес забрав би
+# задачі, призначені процесам, що ще проходять _init_worker
+WARMUP_HOLD_SECONDS = 0.2
+
+# Максимум очікування, поки кожен процес пулу повідомить про прогрів (секунди)
+WARMUP_TIMEOUT = 300
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def _init_worker(log_level: int = logging.INFO):
+    """
+    Ініціалізація нового процесу-воркера: логування, імпорт стеку OCR та прогрів
+
+    Виконується пулом при старті кожного процесу, тому перший скріншот
+    не платить за імпорт OpenCV і завантаження traineddata. Процес forkserver
+    не успадковує налаштувань логування бота - рівень передається явно.
+    """
+    global _worker_warmup
+    logging.basicConfig(format=LOG_FORMAT, level=log_level)
+    started = time.perf_counter()
+    try:
+        from ocr_processor import ocr_processor
+        ready = ocr_processor.warm_up()
+    except Exception as e:
+        logger.error(f"Помилка прогріву процесу OCR: {e}")
+        ready = False
+    _worker_warmup = (ready, time.perf_counter() - started)
+
+
+def _warmup_result() -> Tuple[int, bool, float]:
+    """Результат прогріву процесу-воркера, що виконав задачу: (PID, успіх, секунди)"""
+    time.sleep(WARMUP_HOLD_SECONDS)
+    ok, seconds = _worker_warmup or (False, 0.0)
+    return os.getpid(), ok, seconds
+
+
+def _recognize_screenshot(image: ImageSource, language: str = '') -> Tuple[Optional[StatsResult], Dict]:
+    """
+    Розпізнавання скріншоту всередині процесу-воркера
+
+    Часи етапів повертаються разом із результатом і накопичуються в головному процесі.
+    """
+    from ocr_processor import ocr_processor
+    return ocr_processor.recognize_with_timings(image, language)
+
+
+def _explore_screenshot(image: ImageSource, language: str, stats: Tuple[int, int, int, int]) -> bool:
+    """Фоновий прохід пропущеної комбінації всередині процесу-воркера"""
+    from ocr_processor import ocr_processor
+    return ocr_processor.explore(image, language, stats)
+
+
+def _test_ocr_installation() -> bool:
+    """Перевірка OCR всередині процесу-воркера"""
+    from ocr_processor import ocr_processor
+    return ocr_processor.test_ocr_installation()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Отримати пул процесів OCR, створивши його при потребі"""
+    global _executor
+    if _executor is None:
+        plan = current_plan()
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else None)
+        _executor = ProcessPoolExecutor(
+            max_workers=plan.max_workers, mp_context=context,
+            initializer=_init_worker, initargs=(logging.getLogger().getEffectiveLevel(),),
+        )
+        logger.info(f"Пул процесів OCR: {plan.min_workers}-{plan.max_workers}, процеси запускаються з ростом черги")
+    return _executor
+
+
+def resize_pool(limit: int):
+    """
+    Узгодити пул процесів OCR з лімітом черги (AdaptiveLimiter.on_change)
+
+    Ріст не потребує дій: пул сам запустить процес, коли черга видасть задачу,
+    а всі наявні процеси зайняті. Окремий процес ProcessPoolExecutor зупинити
+    не можна, тому коли ліміт після простою повертається до мінімуму плану,
+    а процесів більше, пул замінюється новим: старий завершує поточні задачі
+    й закриває свої процеси, а в новому у фоні прогріваються процеси мінімуму.
+    """
+    global _executor, _pool_workers
+    if limit >= _pool_workers:
+        _pool_workers = limit
+        return
+    if limit > current_plan().min_workers or _executor is None:
+        return
+
+    retired, _executor = _executor, None
+    logger.info(f"Пул процесів OCR зменшено: {_pool_workers} -> {limit}")
+    _pool_workers = limit
+    retired.shutdown(wait=False)
+    asyncio.get_running_loop().create_task(warm_up(limit))
+
+
+async def process_screenshot(image: ImageSource) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Обробити скріншот у пулі процесів, не блокуючи цикл подій бота
+
+    Args:
+        image: Шлях до скріншоту або його вміст у пам'яті
+
+    Returns:
+        Tuple: (duration_minutes, viewers_count, gifters_count, diamonds_count) або None
+    """
+    result = await recognize_screenshot(image)
+    return result.stats if result else None
+
+
+async def recognize_screenshot(image: ImageSource, language: str = '') -> Optional[StatsResult]:
+    """
+    Розпізнати скріншот у пулі процесів разом із впевненістю в кожному полі
+
+    Кількість одночасних розпізнавань обмежує черга OCR (ocr_queue.py).
+
+    Args:
+        image: Шлях до скріншоту або його вміст у пам'яті
+        language: Запам'ятована мова користувача ('' - визначити пробою)
+
+    Returns:
+        StatsResult: Статистика та впевненість від 0 до 1 або None
+    """
+    loop = asyncio.get_running_loop()
+    result, timings = await loop.run_in_executor(get_executor(), _recognize_screenshot, image, language)
+    timing_stats.add(timings)
+    return result
+
+
+async def explore_screenshot(image: ImageSource, language: str, stats: Tuple[int, int, int, int]) -> bool:
+    """
+    Фоновий прохід пропущеної каскадом комбінації для самонавчання (OCR_TUNING)
+
+    Запускається чергою OCR як фонова задача (OCRQueue.submit_background) - коли
+    користувачі не чекають, тож на час відповіді не впливає.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), _explore_screenshot, image, language, stats)
+
+
+async def test_ocr_installation() -> bool:
+    """Перевірити OCR у пулі процесів"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), _test_ocr_installation)
+
+
+async def warm_up(workers: int = 0) -> Dict:
+    """
+    Прогріти пул процесів OCR у фоні
+
+    Задач прогріву стільки, скільки процесів у мінімумі плану CPU, - пул запускає
+    ці процеси, і кожен проходить _init_worker; решту пул запустить, коли ліміт
+    черги зросте (resize_pool). Один процес може виконати кілька
+    задач, тому готовність рахується за різними PID: раунди задач повторюються,
+    доки про себе не повідомить кожен процес (або до WARMUP_TIMEOUT). Задачі йдуть
+    повз чергу OCR: скріншоти, що надійдуть під час прогріву, чекатимуть вільний процес.
+
+    Args:
+        workers: Скільки процесів прогріти (0 - мінімум плану)
+
+    Returns:
+        Dict: Стан готовності (як readiness)
+    """
+    global _pool_workers
+    _readiness.update(status='warming', error=None)
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    expected = workers or current_plan().min_workers
+    _pool_workers = max(_pool_workers, expected)
+    try:
+        workers: Dict[int, bool] = {}
+        while len(workers) < expected and time.monotonic() - started < WARMUP_TIMEOUT:
+            results: List[Tuple[int, bool, float]] = await asyncio.gather(*(
+                loop.run_in_executor(get_executor(), _warmup_result)
+                for _ in range(expected)
+            ))
+            workers.update((pid, ok) for pid, ok, _ in results)
+            _readiness['workers'] = len(workers)
+
+        if len(workers) < expected:
+            error = f"Прогріто процесів {len(workers)} з {expected}"
+        elif not all(workers.values()):
+            error = "Tesseract повернув помилку під час прогріву"
+        else:
+            error = None
+        _readiness.update(status='degraded' if error else 'ready', error=error)
+    except Exception as e:
+        logger.error(f"Помилка прогріву OCR: {e}")
+        _readiness.update(status='degraded', error=str(e))
+    _readiness['seconds'] = time.monotonic() - started
+
+    log = logger.info if _readiness['status'] == 'ready' else logger.warning
+    log(f"Прогрів OCR: {_readiness['status']}, процесів {_readiness['workers']}, {_readiness['seconds']:.1f} с")
+    return readiness()
+
+
+def readiness() -> Dict:
+    """Стан готовності OCR: status (starting/warming/ready/degraded), workers, seconds, error"""
+    return dict(_readiness)
+
+
+def shutdown_executor():
+    """Зупинити пул процесів OCR"""
+    global _executor, _pool_workers
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+        _pool_workers = 0
+        logger.info("Пул процесів OCR зупинено")
@@ -0,0 +1,464 @@
+import re
+import logging
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Pattern, Sequence, Tuple, Union
+
+from ocr_anchors import FIELDS, FIELD_LABELS
+
+logger = logging.getLogger(__name__)
+
+# Один прохід по тексту: кінець рядка, час "3:40", число з необов'язковим суфіксом K/M, слово
+TOKEN_PATTERN = re.compile(
+    r'(\n)'
+    r'|\b(\d{1,2}:\d{2})\b'
+    r'|(\d+(?:[.,]\d+)?)(?:[ \t]?([KkКкMМ])(?![^\W\d_]))?'
+    r'|([^\W\d_]+)'
+)
+
+SUFFIX_MULTIPLIERS = {'k': 1000, 'к': 1000, 'm': 1000000, 'м': 1000000}
+
+HOUR_WORDS = frozenset({'год', 'г', 'h', 'hr', 'hrs', 'hour', 'hours', 'година', 'години', 'годин'})
+MINUTE_WORDS = frozenset({'хв', 'м', 'm', 'min', 'mins', 'minute', 'minutes', 'хвилина', 'хвилини', 'хвилин'})
+
+# Основа будь-якого підпису поля; назва групи - поле
+LABEL_PATTERN = re.compile('|'.join(f"(?P<{field}>{'|'.join(stems)})" for field, stems in FIELD_LABELS.items()))
+
+# Символи токенів у рядку, з яким зіставляються шаблони граматики:
+# i - ціле число, k - число з K/M, n - дробове число, t - час, h - години,
+# m - хвилини, D/V/G/A - підписи полів, w - інше слово, \n - кінець рядка
+LABEL_CODES = {'duration': 'D', 'viewers': 'V', 'gifters': 'G', 'diamonds': 'A'}
+NUMBER_CODES = frozenset('ikn')
+ELEMENT_CODES = {
+    'INT': 'i', 'KNUM': 'k', 'NUM': '[ikn]', 'TIME': 't',
+    'HOURS': 'h', 'MINUTES': 'm', 'UNIT': '[hm]',
+    **{f'LABEL:{field}': code for field, code in LABEL_CODES.items()},
+}
+
+# Відомі помилки OCR тривалості "N хв хв" -> справжня тривалість у хвилинах
+# ("3 год 25 хв" на екрані підсумків читається як "27 хв хв")
+DURATION_FIXES = {27: 205}
+
+# Верхні межі для групи "глядачі дарувальники алмази" в одному рядку
+ROW_LIMITS = {'viewers': 100000, 'gifters': 10000, 'diamonds': 50000}
+
+
+class Candidate(NamedTuple):
+    """Кандидат значення поля: звідки він узявся та наскільки надійне правило"""
+    field: str
+    value: int
+    source: int  # Індекс тексту OCR, з якого взято значення
+    rule: str
+    weight: int
+    confidence: float = 100.0  # Впевненість Tesseract у словах збігу (0-100)
+
+
+class OCRText(NamedTuple):
+    """Текст OCR з позиціями слів у ньому: (початок, кінець, впевненість)"""
+    text: str
+    words: Tuple[Tuple[int, int, float], ...] = ()
+
+
+class StatsResult(NamedTuple):
+    """Розпізнана статистика та впевненість у кожному полі від 0 до 1"""
+    stats: Tuple[int, int, int, int]
+    confidence: Dict[str, float]
+    partial: bool = False  # бюджет часу вичерпано до повного результату - потрібне підтвердження
+    language: str = ''  # модель Tesseract, якою прочитано скріншот ('' - з кешу)
+
+
+@lru_cache(maxsize=4096)
+def number_value(digits: str, suffix: str) -> Tuple[str, int]:
+    """
+    Символ та значення числового токена
+
+    OCR часто губить крапку в скорочених числах: "49K" замість "4.9K". Двоцифрове
+    число з K, що закінчується на 9, відновлюється як десяткове.
+    """
+    if suffix.lower() in ('k', 'к') and len(digits) == 2 and digits.isdigit() and digits[1] == '9':
+        logger.debug(f"OCR виправлення: {digits}{suffix} -> {digits[0]}.{digits[1]}{suffix} (можлива втрата крапки)")
+        digits = f'{digits[0]}.{digits[1]}'
+
+    multiplier = SUFFIX_MULTIPLIERS[suffix.lower()] if suffix else 1
+    code = 'k' if suffix else 'i' if digits.isdigit() else 'n'
+    return code, int(float(digits.replace(',', '.')) * multiplier)
+
+
+@lru_cache(maxsize=4096)
+def word_code(word: str) -> str:
+    """Символ слова: одиниця часу, підпис поля або звичайне слово"""
+    lowered = word.lower()
+    if lowered in HOUR_WORDS:
+        return 'h'
+    if lowered in MINUTE_WORDS:
+        return 'm'
+    label = LABEL_PATTERN.search(lowered)
+    return LABEL_CODES[label.lastgroup] if label else 'w'
+
+
+def tokenize(text: str) -> Tuple[str, List[int], List[Tuple[int, int]]]:
+    """
+    Розбити текст OCR на токени
+
+    Returns:
+        Tuple: (рядок символів токенів, значення токенів - числа з урахуванням K/M,
+        хвилини для часу, 0 для слів; позиції токенів у тексті)
+    """
+    codes = []
+    values = []
+    spans = []
+    for match in TOKEN_PATTERN.finditer(text):
+        newline, clock, digits, suffix, word = match.groups()
+        if word:
+            code, value = word_code(word), 0
+        elif digits:
+            code, value = number_value(digits, suffix or '')
+        elif clock:
+            hours, minutes = clock.split(':')
+            code, value = 't', int(hours) * 60 + int(minutes)
+        else:
+            code, value = '\n', 0
+        codes.append(code)
+        values.append(value)
+        spans.append(match.span())
+    return ''.join(codes), values, spans
+
+
+def required_codes(elements: Sequence[str]) -> frozenset:
+    """Символи, без яких у тексті шаблон точно не знайдеться"""
+    return frozenset(
+        ELEMENT_CODES[element] for element in elements
+        if not element.startswith('!') and len(ELEMENT_CODES[element]) == 1
+    )
+
+
+def compile_pattern(elements: Sequence[str]) -> Pattern:
+    """
+    Скомпілювати шаблон граматики в регулярний вираз над рядком символів токенів
+
+    Елементи зіставляються з токенами одного рядка. Елемент з '!' на початку -
+    заперечний: наступний токен не повинен йому відповідати, токен при цьому не
+    поглинається. Зовнішній lookahead дозволяє знаходити перекриті збіги.
+    """
+    parts = []
+    for element in elements:
+        if element.startswith('!'):
+            parts.append(f'(?!{ELEMENT_CODES[element[1:]]})')
+        else:
+            parts.append(ELEMENT_CODES[element])
+    return re.compile(f"(?=({''.join(parts)}))")
+
+
+def _hours_minutes(hours: int, minutes: int) -> int:
+    return hours * 60 + minutes if hours <= 24 and minutes <= 59 else 0
+
+
+def _double_minutes(minutes: int) -> int:
+    if minutes in DURATION_FIXES:
+        return DURATION_FIXES[minutes]
+    return minutes if 20 <= minutes <= 500 else 0
+
+
+def _row_values(values: List[int]) -> Optional[Tuple[int, ...]]:
+    if all(0 < value <= ROW_LIMITS[field] for value, field in zip(values, ('viewers', 'gifters', 'diamonds'))):
+        return tuple(values)
+    return None
+
+
+# Граматика тривалості: (назва, шаблон токенів, вага, значення в хвилинах або 0).
+# Функція значення отримує значення токенів збігу
+DURATION_RULES: List[Tuple[str, Tuple[str, ...], int, Callable[[List[int]], int]]] = [
+    ('hours_minutes', ('INT', 'HOURS', 'INT', 'MINUTES'), 6, lambda v: _hours_minutes(v[0], v[2])),
+    ('double_minutes', ('INT', 'MINUTES', 'MINUTES'), 5, lambda v: _double_minutes(v[0])),
+    ('label_minutes', ('LABEL:duration', 'INT', '!UNIT'), 4, lambda v: v[1] if 5 <= v[1] <= 500 else 0),
+    ('compact_hours_minutes', ('INT', 'HOURS', 'INT', '!UNIT'), 4, lambda v: _hours_minutes(v[0], v[2])),
+    ('clock', ('TIME',), 3, lambda v: v[0] if v[0] <= 24 * 60 else 0),
+    ('hours', ('INT', 'HOURS'), 2, lambda v: v[0] * 60 if v[0] <= 24 else 0),
+    ('minutes', ('INT', 'MINUTES'), 1, lambda v: v[0] if v[0] <= 12 * 60 else 0),
+]
+
+# Граматика лічильників: (назва, шаблон токенів, вага, поля, значення полів або None)
+COUNT_RULES: List[Tuple[str, Tuple[str, ...], int, Tuple[str, ...], Callable[[List[int]], Optional[Tuple[int, ...]]]]] = [
+    # "4.9K 61 18.9K" - рядок підсумків у порядку екрану
+    ('row', ('KNUM', 'INT', 'KNUM'), 6, ('viewers', 'gifters', 'diamonds'), _row_values),
+]
+for _field in FIELDS[1:]:
+    COUNT_RULES += [
+        # "4.9K Глядачі"
+        ('value_label', ('NUM', f'LABEL:{_field}'), 5, (_field,), lambda v: (v[0],)),
+        # "Глядачі: 4.9K"
+        ('label_value', (f'LABEL:{_field}', 'NUM'), 4, (_field,), lambda v: (v[1],)),
+    ]
+
+DURATION_GRAMMAR = [
+    (name, required_codes(elements), compile_pattern(elements), weight, build)
+    for name, elements, weight, build in DURATION_RULES
+]
+COUNT_GRAMMAR = [
+    (name, required_codes(elements), compile_pattern(elements), weight, fields, build)
+    for name, elements, weight, fields, build in COUNT_RULES
+]
+
+# Ваги запасних правил, що ігнорують слова між числами
+GROUP_WEIGHT = 2
+LOOSE_WEIGHT = 1
+
+# Достатньо, щоб кожне поле дало правило з вагою від STRONG_WEIGHT і набрало
+# CONSENSUS_VOTES голосів (голос тексту - впевненість слів / 100) - далі тексти не аналізуються
+STRONG_WEIGHT = 5
+CONSENSUS_VOTES = 1.5
+
+# Впевненість тексту без даних про слова (image_to_string)
+FULL_CONFIDENCE = 100.0
+
+
+def _group_candidates(numbers: List[Tuple[int, int, int]]) -> List[Tuple[str, int, str, int, int, int]]:
+    """Перша група з трьох чисел поспіль: найбільше - глядачі, далі алмази, дарувальники"""
+    for start in range(len(numbers) - 2):
+        group = sorted(numbers[start:start + 3], reverse=True)
+        viewers, diamonds, gifters = (value for value, _, _ in group)
+        if gifters > 0 and viewers <= ROW_LIMITS['viewers'] and gifters <= ROW_LIMITS['gifters'] \
+                and diamonds <= ROW_LIMITS['diamonds']:
+            return [
+                (field, value, 'number_group', GROUP_WEIGHT, first, last)
+                for field, (value, first, last) in zip(('viewers', 'diamonds', 'gifters'), group)
+            ]
+    return []
+
+
+def _loose_candidates(numbers: List[Tuple[int, int, int]]) -> List[Tuple[str, int, str, int, int, int]]:
+    """Розумні числа за спаданням: глядачі, алмази, дарувальники"""
+    first_seen = {}
+    for value, first, last in numbers:
+        if 10 <= value <= 100000:
+            first_seen.setdefault(value, (first, last))
+    values = sorted(first_seen, reverse=True)
+    return [
+        (field, value, 'loose', LOOSE_WEIGHT, *first_seen[value])
+        for field, value in zip(('viewers', 'diamonds', 'gifters'), values)
+    ]
+
+
+@lru_cache(maxsize=1024)
+def _text_candidates(text: str) -> Tuple[Tuple[str, int, str, int, int, int], ...]:
+    """
+    Кандидати одного тексту (кешуються - каскад повторно аналізує ті самі тексти)
+
+    Returns:
+        Tuple: (поле, значення, правило, вага, початок, кінець) - позиції збігу в тексті
+    """
+    codes, values, spans = tokenize(text)
+    present = set(codes)
+    found = []
+    consumed = set()
+
+    for name, required, pattern, weight, build in DURATION_GRAMMAR:
+        if not required <= present:
+            continue
+        for match in pattern.finditer(codes):
+            start, end = match.span(1)
+            value = build(values[start:end])
+            if value > 0:
+                found.append(('duration', value, name, weight, spans[start][0], spans[end - 1][1]))
+                # Числа тривалості не повинні потрапити в лічильники
+                consumed.update(index for index in range(start, end) if codes[index] in NUMBER_CODES)
+
+    if consumed:
+        kept = [index for index in range(len(codes)) if index not in consumed]
+        codes = ''.join(codes[index] for index in kept)
+        values = [values[index] for index in kept]
+        spans = [spans[index] for index in kept]
+
+    for name, required, pattern, weight, fields, build in COUNT_GRAMMAR:
+        if not required <= present:
+            continue
+        for match in pattern.finditer(codes):
+            start, end = match.span(1)
+            matched = build(values[start:end])
+            if matched:
+                # Впевненість кожного поля - за його власним числом, а не за всім збігом
+                numbers = [index for index in range(start, end) if codes[index] in NUMBER_CODES]
+                found.extend(
+                    (field, value, name, weight, *spans[index])
+                    for field, value, index in zip(fields, matched, numbers) if value > 0
+                )
+
+    numbers = [(value, *span) for code, value, span in zip(codes, values, spans) if code in NUMBER_CODES]
+    found.extend(_group_candidates(numbers))
+    found.extend(_loose_candidates(numbers))
+    return tuple(found)
+
+
+def words_to_text(words: List[Dict]) -> OCRText:
+    """
+    Зібрати текст з розпізнаних слів (ocr_engine.image_to_data)
+
+    Слова одного рядка розділяються пробілом, рядки - переносом; для кожного
+    слова запам'ятовується його позиція в тексті та впевненість Tesseract.
+    """
+    parts = []
+    spans = []
+    position = 0
+    line = None
+    for word in words:
+        if line is not None:
+            separator = ' ' if word['line'] == line else '\n'
+            parts.append(separator)
+            position += 1
+        line = word['line']
+        parts.append(word['text'])
+        spans.append((position, position + len(word['text']), max(0.0, float(word['conf']))))
+        position += len(word['text'])
+    return OCRText(''.join(parts), tuple(spans))
+
+
+def span_confidence(text: OCRText, start: int, end: int) -> float:
+    """Впевненість збігу - найменша впевненість слів, які він зачіпає"""
+    if not text.words:
+        return FULL_CONFIDENCE
+    overlapping = [confidence for first, last, confidence in text.words if first < end and last > start]
+    return min(overlapping) if overlapping else FULL_CONFIDENCE
+
+
+def _as_ocr_text(text: Union[str, OCRText]) -> OCRText:
+    return text if isinstance(text, OCRText) else OCRText(text)
+
+
+def _candidates(text: OCRText, source: int) -> Iterator[Candidate]:
+    for field, value, rule, weight, start, end in _text_candidates(text.text):
+        yield Candidate(field, value, source, rule, weight, span_confidence(text, start, end))
+
+
+def extract_candidates(texts: Iterable[Union[str, OCRText]]) -> List[Candidate]:
+    """
+    Кандидати значень полів з усіх текстів OCR
+
+    Args:
+        texts: Тексти OCR (рядки або OCRText зі впевненістю слів);
+            індекс тексту стає джерелом кандидата
+
+    Returns:
+        List[Candidate]: Всі знайдені кандидати
+    """
+    candidates = []
+    for source, text in enumerate(texts):
+        candidates.extend(_candidates(_as_ocr_text(text), source))
+    return candidates
+
+
+class Ballot:
+    """
+    Голосування кандидатів по полях
+
+    Перемагає значення з найнадійнішим правилом; за рівної ваги - те, за яке
+    більше голосів, де голос тексту дорівнює впевненості Tesseract у словах
+    збігу (чітке "4.9K" важить більше за розмите); далі - найраніший текст.
+    """
+
+    def __init__(self):
+        # (поле, значення) -> [найкращий кандидат, джерело -> впевненість]
+        self._groups: Dict[Tuple[str, int], list] = {}
+        # Поля, для яких уже є значення з надійного правила з достатньою кількістю голосів
+        self._confirmed = set()
+
+    def add(self, candidate: Candidate):
+        """Врахувати кандидата"""
+        group = self._groups.get((candidate.field, candidate.value))
+        if group is None:
+            group = self._groups[(candidate.field, candidate.value)] = [candidate, {}]
+        elif candidate.weight > group[0].weight:
+            group[0] = candidate
+        votes = group[1]
+        votes[candidate.source] = max(votes.get(candidate.source, 0.0), candidate.confidence)
+
+        if group[0].weight >= STRONG_WEIGHT and sum(votes.values()) / FULL_CONFIDENCE >= CONSENSUS_VOTES:
+            self._confirmed.add(candidate.field)
+
+    def winners(self) -> Dict[str, Tuple[Candidate, float]]:
+        """Поле -> (кандидат-переможець, сума голосів за його значення)"""
+        best: Dict[str, Tuple[tuple, Candidate, float]] = {}
+        for (field, _), (strongest, votes) in self._groups.items():
+            mass = sum(votes.values()) / FULL_CONFIDENCE
+            key = (strongest.weight, mass, -min(votes))
+            if field not in best or key > best[field][0]:
+                best[field] = (key, strongest, mass)
+        return {field: (candidate, mass) for field, (_, candidate, mass) in best.items()}
+
+    def agreed(self) -> bool:
+        """Чи всі поля знайдені надійними правилами та підтверджені достатньою кількістю голосів"""
+        if len(self._confirmed) < len(FIELDS):
+            return False
+        winners = self.winners()
+        return all(
+            field in winners and winners[field][0].weight >= STRONG_WEIGHT and winners[field][1] >= CONSENSUS_VOTES
+            for field in FIELDS
+        )
+
+    def confidence(self) -> Dict[str, float]:
+        """
+        Впевненість у кожному полі від 0 до 1
+
+        Частка голосів переможця серед значень, знайдених правилами тієї ж ваги,
+        помножена на середню впевненість Tesseract у його голосах.
+        """
+        winners = self.winners()
+        contested: Dict[str, float] = dict.fromkeys(winners, 0.0)
+        for (field, _), (strongest, votes) in self._groups.items():
+            if strongest.weight == winners[field][0].weight:
+                contested[field] += sum(votes.values()) / FULL_CONFIDENCE
+
+        confidence = dict.fromkeys(FIELDS, 0.0)
+        for field, (candidate, mass) in winners.items():
+            group_votes = self._groups[(field, candidate.value)][1]
+            average = mass / len(group_votes)
+            confidence[field] = round(mass / contested[field] * average, 3)
+        return confidence
+
+
+def resolve(candidates: Iterable[Candidate]) -> Dict[str, Candidate]:
+    """
+    Обрати значення кожного поля
+
+    Returns:
+        Dict: поле -> кандидат-переможець
+    """
+    ballot = Ballot()
+    for candidate in candidates:
+        ballot.add(candidate)
+    return {field: candidate for field, (candidate, _) in ballot.winners().items()}
+
+
+def analyze(texts: Iterable[Union[str, OCRText]]) -> StatsResult:
+    """
+    Статистика з текстів OCR разом із впевненістю в кожному полі
+
+    Тексти аналізуються по черзі; щойно всі поля знайдені надійними правилами
+    з достатньою кількістю голосів, решта текстів уже не може змінити результат
+    суттєво і пропускається.
+
+    Returns:
+        StatsResult: (duration_minutes, viewers_count, gifters_count, diamonds_count) та впевненість,
+        0 для незнайдених полів
+    """
+    ballot = Ballot()
+    for source, text in enumerate(texts):
+        for candidate in _candidates(_as_ocr_text(text), source):
+            ballot.add(candidate)
+        if ballot.agreed():
+            logger.debug(f"Згода полів після {source + 1} текстів")
+            break
+
+    chosen = ballot.winners()
+    for field, (candidate, votes) in chosen.items():
+        logger.debug(f"Поле {field}: {candidate.value} (правило {candidate.rule}, текст {candidate.source}, голосів {votes:.2f})")
+    stats = tuple(chosen[field][0].value if field in chosen else 0 for field in FIELDS)
+    return StatsResult(stats, ballot.confidence())
+
+
+def find_statistics(texts: Iterable[Union[str, OCRText]]) -> Tuple[int, int, int, int]:
+    """
+    Статистика з текстів OCR
+
+    Returns:
+        Tuple: (duration_minutes, viewers_count, gifters_count, diamonds_count), 0 для незнайдених полів
+    """
+    return analyze(texts).stats
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Навчання вбудованого розпізнавача цифр на розміченому корпусі скріншотів
+
+Корпус той самий, що й для benchmark_ocr.py: зображення та JSON з очікуваними
+значеннями. Для кожного скріншоту вирізки значень знаходяться за підписами,
+Tesseract читає їх, і вирізка стає навчальною лише якщо її текст дає очікуване
+значення, а кількість символів збігається з кількістю знайдених гліфів.
+
+Приклад:
+    python train_glyphs.py screenshots/ --output glyph_model.npz
+"""
+
+import argparse
+import os
+import sys
+from collections import Counter
+
+import numpy as np
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Навчання розпізнавача цифр на розміченому корпусі")
+    parser.add_argument('corpus', help="Каталог зі скріншотами та JSON розміткою")
+    parser.add_argument('--output', default='glyph_model.npz', help="Файл моделі (.npz)")
+    args = parser.parse_args()
+
+    # Вирізки читає лише Tesseract, результати не потрапляють у кеш і БД
+    os.environ['OCR_GLYPH_MODEL'] = ''
+    os.environ['OCR_CACHE_SIZE'] = '0'
+    os.environ['OCR_TUNING'] = 'false'
+    os.environ['OCR_LAYOUTS'] = 'false'
+
+    from benchmark_ocr import load_corpus
+    from config import OCR_GLYPH_MIN_CONFIDENCE
+    from glyph_recognizer import GlyphRecognizer, glyph_features, segment
+    from ocr_anchors import FIELDS
+    from ocr_language import with_language
+    from ocr_processor import ocr_processor
+
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        print(f"❌ У каталозі {args.corpus} немає розмічених скріншотів")
+        return 2
+
+    print(f"🧪 Навчання розпізнавача цифр: {len(corpus)} скріншотів")
+    print("=" * 60)
+
+    features = []
+    labels = []
+    crops = []
+    skipped = Counter()
+
+    for item in corpus:
+        # Те саме декодування, що й у боті: вирізки мають ту саму роздільність
+        variants = ocr_processor.decode_variants(item['path'])
+        if variants is None:
+            skipped['зображення'] += 1
+            continue
+
+        variants.language = ocr_processor.probe_language(variants)
+        boxes = {}
+        ocr_processor.run_anchored(variants, boxes)
+        gray = variants.get('gray')
+
+        for field, expected in zip(FIELDS, item['expected']):
+            if field not in boxes or boxes[field][1] != expected:
+                skipped['поле не знайдено'] += 1
+                continue
+
+            parser_kind = 'duration' if field == 'duration' else 'number'
+            crop = ocr_processor.crop_value(gray, boxes[field][0])
+            config = with_language(ocr_processor.value_configs[parser_kind], variants.language)
+            text, _ = ocr_processor.crop_text(ocr_processor.recognize_variant(field, crop, config))
+            if ocr_processor.parse_field_value(parser_kind, text) != expected:
+                skipped['текст не збігся'] += 1
+                continue
+
+            glyph_boxes = segment(crop)
+            symbols = ''.join(text.split())
+            if not glyph_boxes or len(glyph_boxes) != len(symbols):
+                skipped['сегментація'] += 1
+                continue
+
+            features.append(glyph_features(crop, glyph_boxes))
+            labels.extend(symbols)
+            crops.append((crop, parser_kind, expected))
+
+    if not labels:
+        print("❌ Жодної придатної вирізки - перевірте корпус та встановлення Tesseract")
+        return 1
+
+    recognizer = GlyphRecognizer.train(np.vstack(features), labels)
+    recognizer.save(args.output)
+
+    print(f"✅ Вирізок: {len(crops)}, символів: {len(labels)}")
+    for reason, count in skipped.items():
+        print(f"⚠️ Пропущено ({reason}): {count}")
+    print("\n🔤 Зразків за символами:")
+    for symbol, count in sorted(Counter(labels).items()):
+        print(f"   {symbol!r}: {count}")
+
+    # Перевірка на навчальних вирізках: скільки читається впевнено і скільки з них вірно
+    confident = correct = 0
+    for crop, parser_kind, expected in crops:
+        read = recognizer.read(crop)
+        if read is not None and read.confidence >= OCR_GLYPH_MIN_CONFIDENCE:
+            confident += 1
+            correct += ocr_processor.parse_field_value(parser_kind, read.text) == expected
+    print(f"\n📊 Впевнено прочитано: {confident}/{len(crops)}, з них вірно: {correct}")
+    print(f"💾 Модель збережено: {args.output} (поріг невідомого символу {recognizer.reject_distance:.2f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())